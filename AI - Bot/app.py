@@ -1,13 +1,66 @@
+import json
+import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import Body, FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from engine import (
+    LabRows,
+    answer_cache,
+    answer_flights,
+    generate_answer_async,
+    generate_answers_async,
+    prompt_stats,
+    stream_answer_async,
+)
+from guard_rules import local_guard_stats
+from guardrails import verdict_cache
+from metrics import observe_stage, registry, request_seconds, start_timings, timings_ms
+from sessions import LabSession, SessionTooLarge, session_store
+from upstream import (
+    DeadlineExceeded,
+    Overloaded,
+    admission_stats,
+    call_stats_snapshot,
+    set_deadline,
+    start_deadline,
+)
+from upstream import aclose as close_upstream
+from upstream import pool_stats as upstream_pool_stats
+from upstream import warm_up as warm_up_upstream
+from wire import WireError, decode_body, decode_lab_columns, wire_stats
+
+# najviše pitanja u jednom /chat/batch zahtjevu
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "32"))
+
+# rok za odgovor na /chat, /chat/batch i /chat/stream (s); pozivi modela
+# (i njihova ponavljanja) se ne šalju poslije roka – vidi upstream.call_async
+CHAT_DEADLINE_S = float(os.getenv("CHAT_DEADLINE_S", "30"))
+
+# sa ovim headerom (bilo koja vrijednost osim "0") odgovor nosi i "timings" po fazama, u ms
+DEBUG_HEADER = "X-LabGuard-Debug"
 
-from engine import generate_answer
 
+# rezultat zagrijavanja konekcija prema modelu (za /health)
+_warm_up: Dict[str, Any] = {}
 
-app = FastAPI(title="LabGuard AI Bot")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start: zagrijavanje konekcija prema modelu; gašenje: zatvaranje klijenata."""
+    _warm_up.update(await warm_up_upstream())
+    try:
+        yield
+    finally:
+        await close_upstream()
+
+
+app = FastAPI(title="LabGuard AI Bot", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,18 +79,124 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    """Poziv modela nije primljen (admission control) – brz 503 umjesto čekanja bez kraja."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    Trajanje zahtjeva do poslednjeg bajta tijela, ne samo do headera:
+    call_next vraća čim handler vrati odgovor, a kod /chat/stream tada je
+    stigao tek prvi događaj. Zato se mjeri kada se tijelo isprazni (ili
+    prekine, ako klijent ode usred streama).
+    """
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # šablon rute (/sessions/{session_id}), ne stvarna putanja – ograničen broj serija
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    status = str(response.status_code)
+    body = response.body_iterator
+
+    async def observed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            request_seconds.observe(time.perf_counter() - t0, route=route, status=status)
+
+    response.body_iterator = observed_body()
+    return response
+
+
+def _collect_metrics():
+    """Brojači koji već postoje (keševi, guard nivoi) – čitaju se pri svakom /metrics."""
+    hits, misses, sizes = [], [], []
+    for name, cache in (("answer", answer_cache), ("guard", verdict_cache), ("session", session_store)):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        hits.append(({"cache": name}, stats["hits"]))
+        misses.append(({"cache": name}, stats["misses"]))
+        sizes.append(({"cache": name}, stats["size"]))
+
+    guard = local_guard_stats()
+    flights = answer_flights.stats()
+    return [
+        ("labguard_cache_hits_total", "counter", "Pogoci keša", hits),
+        ("labguard_cache_misses_total", "counter", "Promašaji keša", misses),
+        ("labguard_cache_size", "gauge", "Broj stavki u kešu", sizes),
+        (
+            "labguard_guard_decisions_total",
+            "counter",
+            "Guard odluke po nivou (canned / lokalno / evaluator)",
+            [({"tier": tier}, guard[tier]) for tier in ("canned", "local_unsafe", "escalated")],
+        ),
+        (
+            "labguard_coalesced_requests_total",
+            "counter",
+            "Pitanja koja su dobila odgovor iz istovremenog istog poziva modela",
+            [({}, flights["coalesced"])],
+        ),
+        ("labguard_answer_flights", "gauge", "Zajednički pozivi modela u toku", [({}, flights["in_flight"])]),
+    ]
+
+
+registry.register_collector(_collect_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _debug_timings(request: Request) -> Optional[Dict[str, float]]:
+    """Dict za vremena faza ako je poslat DEBUG_HEADER, inače None (histogrami se pune uvijek)."""
+    if request.headers.get(DEBUG_HEADER, "0") in ("", "0"):
+        return None
+    return start_timings()
+
+
 @app.get("/health")
 async def health():
-    return {"status": "ok", "time": datetime.now().isoformat()}
+    return {
+        "status": "ok",
+        "time": datetime.now().isoformat(),
+        "guard": local_guard_stats(),
+        "guard_cache": verdict_cache.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "answer_flights": answer_flights.stats(),
+        "prompt": prompt_stats.stats(),
+        "sessions": session_store.stats(),
+        "wire": wire_stats.stats(),
+        "upstream": {**upstream_pool_stats(), "warm_up": _warm_up or None},
+        "admission": admission_stats(),
+        "upstream_calls": call_stats_snapshot(),
+    }
 
 
-@app.post("/chat")
-async def chat(payload: Dict[str, Any] = Body(...)):
+def _lab_columns_of(payload: Dict[str, Any]) -> Any:
+    return payload.get("lab_columns") or payload.get("labColumns")
+
+
+def _parse_chat_payload(payload: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
     """
     Namjerno jako tolerantna verzija:
     - prihvata bilo kakav JSON
     - pokušava da pronađe pitanje pod više ključeva
     - pokušava da pronađe lab_rows (labRows / lab_rows / rows ...)
+    - ili kolonski zapis lab_columns (vidi wire.py); neispravan -> WireError
     """
 
     # 1) Izvuci pitanje iz raznih mogućih ključeva
@@ -51,7 +210,12 @@ async def chat(payload: Dict[str, Any] = Body(...)):
     if not isinstance(question, str):
         question = str(question)
 
-    # 2) Izvuci lab_rows iz više mogućih naziva
+    # 2) Kolonski zapis ima prednost – on je tipiziran, pa se ne "pogađa"
+    columns = _lab_columns_of(payload)
+    if columns is not None:
+        return question, decode_lab_columns(columns)
+
+    # 3) Izvuci lab_rows iz više mogućih naziva
     raw_rows = (
         payload.get("lab_rows")
         or payload.get("labRows")
@@ -69,11 +233,262 @@ async def chat(payload: Dict[str, Any] = Body(...)):
         # ako je nešto drugo (npr. dict), jednostavno ignorišemo
         lab_rows = []
 
+    return question, lab_rows
+
+
+async def _read_payload(request: Request) -> Tuple[Dict[str, Any], str, List[Dict[str, Any]]]:
+    """
+    Tijelo zahtjeva -> (payload, pitanje, lab_rows). Tijelo može biti
+    kompresovano (Content-Encoding: gzip / deflate / br); veličina na žici,
+    veličina poslije dekompresije i vrijeme parsiranja idu u wire_stats.
+    """
+    body = await request.body()
+    encoding = (request.headers.get("content-encoding") or "identity").strip().lower()
+    t0 = time.perf_counter()
+    try:
+        payload, body_bytes = decode_body(body, encoding)
+        question, lab_rows = _parse_chat_payload(payload)
+    except WireError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    parse_s = time.perf_counter() - t0
+
+    fmt = "columns" if _lab_columns_of(payload) is not None else "rows"
+    wire_stats.record(encoding, fmt, len(body), body_bytes, len(lab_rows), parse_s)
+    observe_stage("parse", parse_s)
+    return payload, question, lab_rows
+
+
+def _session_not_found(session_id: str) -> HTTPException:
+    # klijent na 404 ponovo šalje nalaze (POST /sessions) i dobija novu sesiju
+    return HTTPException(status_code=404, detail=f"Sesija {session_id} ne postoji ili je istekla")
+
+
+def _resolve_lab_rows(payload: Dict[str, Any], lab_rows: List[Dict[str, Any]]) -> LabRows:
+    """
+    Nalazi za pitanje: iz sesije ako je poslat session_id (lab_rows iz
+    zahtjeva se tada ignorišu), inače redovi poslati uz pitanje.
+    Ako je uz session_id poslat i fingerprint, a sesija u međuvremenu ima
+    drugi sadržaj, vraća se 409 – klijent zna da treba da osvježi sesiju.
+    """
+    session_id = payload.get("session_id") or payload.get("sessionId")
+    if not session_id:
+        return lab_rows
+
+    session_id = str(session_id)
+    lab = session_store.lab_context(session_id)
+    if lab is None:
+        raise _session_not_found(session_id)
+    expected = payload.get("fingerprint")
+    if expected and expected != lab.fingerprint:
+        raise HTTPException(status_code=409, detail="Sadržaj sesije se promijenio")
+    return lab
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    timings = _debug_timings(request)
+    start_deadline(CHAT_DEADLINE_S)
+    payload, question, lab_rows = await _read_payload(request)
+    lab_rows = _resolve_lab_rows(payload, lab_rows)
+
     # 3) Pozovi engine
-    answer = generate_answer(question=question, lab_rows=lab_rows)
+    answer = await generate_answer_async(question=question, lab_rows=lab_rows)
 
-    return {
+    body = {
         "question": question,
         "answer": answer,
         "timestamp": datetime.now().isoformat(),
     }
+    if timings is not None:
+        body["timings"] = timings_ms(timings)
+    return body
+
+
+def _batch_result(question: str, answer: Any) -> Dict[str, Any]:
+    """Stavka /chat/batch odgovora; status i poruka greške kao kod /chat."""
+    if not isinstance(answer, BaseException):
+        return {"question": question, "status": 200, "answer": answer}
+    if isinstance(answer, Overloaded):
+        return {"question": question, "status": 503, "error": str(answer), "retry_after": answer.retry_after}
+    if isinstance(answer, DeadlineExceeded):
+        return {"question": question, "status": 504, "error": str(answer)}
+    return {"question": question, "status": 500, "error": "Odgovor nije mogao biti generisan"}
+
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request):
+    """
+    Više pitanja nad istim nalazima u jednom zahtjevu: {"questions": [...]}
+    uz lab_rows / lab_columns / session_id kao kod /chat. Nalazi se pripreme
+    jednom, a pitanja idu ka modelu istovremeno (BATCH_CONCURRENCY), pa batch
+    traje otprilike koliko i najsporije pitanje. Odgovori su istim redoslijedom.
+
+    Svaka stavka ima "status" kao da je pitanje poslato na /chat: 200 uz
+    "answer", ili 503 (uz "retry_after") / 504 / 500 uz "error" umjesto
+    odgovora – klijent ponavlja samo ta pitanja. "failed" je broj neuspjelih.
+    """
+    timings = _debug_timings(request)
+    start_deadline(CHAT_DEADLINE_S)
+    payload, _, lab_rows = await _read_payload(request)
+    lab_rows = _resolve_lab_rows(payload, lab_rows)
+
+    questions = payload.get("questions")
+    if not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=422, detail="questions mora biti neprazan niz pitanja")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413, detail=f"Najviše {BATCH_MAX_QUESTIONS} pitanja po zahtjevu"
+        )
+    questions = [q if isinstance(q, str) else str(q) for q in questions]
+
+    answers = await generate_answers_async(questions, lab_rows)
+    # nijedno pitanje nije primljeno / stiglo u roku – ponašaj se kao /chat (503 / 504)
+    for kind in (Overloaded, DeadlineExceeded):
+        if all(isinstance(answer, kind) for answer in answers):
+            raise answers[0]
+
+    results = [_batch_result(question, answer) for question, answer in zip(questions, answers)]
+    body = {
+        "results": results,
+        "failed": sum(result["status"] != 200 for result in results),
+        "timestamp": datetime.now().isoformat(),
+    }
+    if timings is not None:
+        # faze su sabrane preko svih pitanja (pitanja idu paralelno)
+        body["timings"] = timings_ms(timings)
+    return body
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse koji na kraju uvijek zatvori `source` (generator odgovora).
+
+    Generator već drži mjesto za model (admission) od prvog događaja, koji se
+    čeka u handleru. Ako klijent ode prije nego što se tijelo počne čitati, ili
+    usred streama, samo zatvaranje generatora to mjesto odmah oslobađa –
+    BackgroundTask se poslije ClientDisconnect ne izvršava.
+    """
+
+    def __init__(self, content: AsyncIterator[str], source: AsyncIterator[Dict], **kwargs):
+        super().__init__(content, **kwargs)
+        self.source = source
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.source.aclose()
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """
+    Isto kao /chat, ali kao Server-Sent Events:
+    - `delta`   – novi dio odgovora koji je već prošao guard provjeru
+    - `replace` – odgovor je odbijen; prikazani tekst zamijeni porukom iz `text`
+    - `done`    – kraj, sa cijelim konačnim odgovorom (i "timings" uz DEBUG_HEADER)
+    """
+    timings = _debug_timings(request)
+    deadline = start_deadline(CHAT_DEADLINE_S)
+    payload, question, lab_rows = await _read_payload(request)
+    # nepostojeća sesija je greška zahtjeva (404), prije nego što stream počne
+    lab_rows = _resolve_lab_rows(payload, lab_rows)
+
+    # prvi događaj se čeka ovdje: ako poziv modela nije primljen (Overloaded)
+    # ili je pukao prije prvog teksta, klijent dobija HTTP grešku, ne prekinut stream
+    stream = stream_answer_async(question=question, lab_rows=lab_rows).__aiter__()
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def answer_events():
+        if first is not None:
+            yield first
+            async for event in stream:
+                yield event
+
+    async def events():
+        if timings is not None:
+            start_timings(timings)  # stream se izvršava u drugom tasku
+        set_deadline(deadline)
+        answer = ""
+        async for event in answer_events():
+            if event["event"] == "replace":
+                answer = event["text"]
+            else:
+                answer += event["text"]
+            yield _sse(event["event"], {k: v for k, v in event.items() if k != "event"})
+
+        done = {
+            "question": question,
+            "answer": answer,
+            "timestamp": datetime.now().isoformat(),
+        }
+        if timings is not None:
+            done["timings"] = timings_ms(timings)
+        yield _sse("done", done)
+
+    return _ClosingStreamingResponse(
+        events(),
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------------------------------------------------
+#  SESIJE SA NALAZIMA
+# ---------------------------------------------------------
+
+def _session_response(session: LabSession) -> Dict[str, Any]:
+    return {**session.info(), "ttl": session_store.ttl}
+
+
+@app.post("/sessions", status_code=201)
+async def create_session(request: Request):
+    """
+    Jednom pošalji nalaze (isti formati kao za /chat: lab_rows / labRows / rows),
+    dobiješ session_id i fingerprint; dalje uz /chat šalješ samo session_id.
+    Prihvata i kolonski zapis (lab_columns) i kompresovano tijelo, kao /chat.
+    """
+    payload, _, lab_rows = await _read_payload(request)
+    try:
+        session = session_store.create(lab_rows, normalized=_lab_columns_of(payload) is not None)
+    except SessionTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return _session_response(session)
+
+
+@app.post("/sessions/{session_id}/rows")
+async def append_session_rows(session_id: str, request: Request):
+    """Dopuna sesije novim redovima (npr. novi izvještaj); redovi koji već postoje se preskaču."""
+    payload, _, lab_rows = await _read_payload(request)
+    try:
+        session = session_store.append(
+            session_id, lab_rows, normalized=_lab_columns_of(payload) is not None
+        )
+    except SessionTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if session is None:
+        raise _session_not_found(session_id)
+    return _session_response(session)
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise _session_not_found(session_id)
+    return _session_response(session)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise _session_not_found(session_id)
+    return {"session_id": session_id, "deleted": True}
@@ -0,0 +1,246 @@
+"""
+Lokalna zamjena za OpenAI API (chat completions + embeddings) za load testove –
+bez troška i bez zavisnosti od mreže.
+
+- /v1/chat/completions: guard pozive (sistemski prompt evaluatora) prepoznaje
+  i odgovara SAFE ili UNSAFE (udio --unsafe-rate, deterministički po sadržaju,
+  pa je isti odgovor uvijek ista odluka); ostalo dobija kratak edukativni
+  odgovor. Podržava stream=True (SSE chunkovi, usage na kraju uz include_usage).
+- /v1/embeddings: deterministički normalizovani vektori (isti tekst = isti vektor).
+- /stats: broj poziva po vrsti i najveći broj istovremenih; POST /stats/reset.
+
+Latencija je log-normalna: medijana * exp(sigma * N(0, 1)), posebno za
+generisanje, guard i embeddings; streaming šalje riječ po riječ brzinom --stream-tps.
+Udio --stall-rate chat poziva "zaglavi" dodatnih --stall-ms (povremeni spori
+odgovori API-ja, za provjeru rokova, ponavljanja i hedginga).
+
+Primjer:
+    python bench/fake_openai.py --port 8100 --gen-ms 800 --guard-ms 300 --sigma 0.4
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake uvicorn app:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import time
+import zlib
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# isti marker kao u guardrails.GUARD_SYSTEM_PROMPT
+GUARD_MARKER = "evaluator sigurnosti"
+
+EMBEDDING_DIMS = {"text-embedding-3-large": 3072, "text-embedding-3-small": 1536}
+
+ANSWER_TEMPLATE = (
+    "{topic} je laboratorijski parametar koji se koristi u procjeni opšteg zdravstvenog stanja. "
+    "Vrijednosti se uvijek posmatraju u odnosu na referentni opseg laboratorije i raniji nalaz. "
+    "Ovo je samo edukativno objašnjenje; za tumačenje nalaza obrati se svom ljekaru."
+)
+
+
+class Config:
+    gen_ms = 800.0
+    guard_ms = 300.0
+    embed_ms = 80.0
+    sigma = 0.4
+    stream_tps = 60.0
+    unsafe_rate = 0.0
+    stall_rate = 0.0
+    stall_ms = 20000.0
+
+
+app = FastAPI(title="Fake OpenAI")
+_stats: Dict[str, int] = {}
+_in_flight = 0
+
+
+def _count(kind: str) -> None:
+    _stats[kind] = _stats.get(kind, 0) + 1
+
+
+async def _sleep(median_ms: float) -> None:
+    if median_ms > 0:
+        await asyncio.sleep(median_ms / 1000.0 * math.exp(Config.sigma * random.gauss(0.0, 1.0)))
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _guard_reply(content: str) -> str:
+    # deterministički po sadržaju – ponovljena provjera istog odgovora daje istu odluku
+    bucket = zlib.crc32(content.encode("utf-8")) % 10000 / 10000.0
+    return "UNSAFE: previše direktno tumačenje" if bucket < Config.unsafe_rate else "SAFE"
+
+
+def _answer_reply(messages: List[Dict[str, Any]]) -> str:
+    question = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    topic = (question.strip().rstrip("?").split() or ["Ovaj parametar"])[-1].capitalize()
+    return ANSWER_TEMPLATE.format(topic=topic)
+
+
+def _usage(prompt: str, completion: str) -> Dict[str, int]:
+    p, c = _tokens(prompt), _tokens(completion)
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    global _in_flight
+    body = await request.json()
+    messages = body.get("messages") or []
+    system = (messages[0].get("content") or "") if messages else ""
+    prompt = "\n".join(m.get("content") or "" for m in messages)
+    is_guard = GUARD_MARKER in system
+    kind = "guard" if is_guard else "generation"
+    _count(kind)
+
+    reply = _guard_reply(prompt) if is_guard else _answer_reply(messages)
+    model = body.get("model", "gpt-4.1-mini")
+    created = int(time.time())
+    completion_id = "chatcmpl-" + hashlib.sha1(f"{time.time_ns()}".encode()).hexdigest()[:24]
+
+    _in_flight += 1
+    _stats["max_in_flight"] = max(_stats.get("max_in_flight", 0), _in_flight)
+    try:
+        # vrijeme do prvog tokena (kod streama) odnosno cijelog odgovora
+        if random.random() < Config.stall_rate:
+            _count("stalled")
+            await asyncio.sleep(Config.stall_ms / 1000.0)
+        await _sleep(Config.guard_ms if is_guard else Config.gen_ms)
+    finally:
+        _in_flight -= 1
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(prompt, reply),
+        })
+
+    _count("stream")
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta: Dict[str, Any], finish=None, **extra) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            **extra,
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for word in reply.split(" "):
+            yield chunk({"content": word + " "})
+            if Config.stream_tps > 0:
+                await asyncio.sleep(1.0 / Config.stream_tps)
+        yield chunk({}, finish="stop")
+        if include_usage:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": _usage(prompt, reply),
+            }
+            yield f"data: {json.dumps(data)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _embedding(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    _count("embeddings")
+    texts = body.get("input")
+    if isinstance(texts, str):
+        texts = [texts]
+    model = body.get("model", "text-embedding-3-large")
+    dim = int(body.get("dimensions") or EMBEDDING_DIMS.get(model, 1536))
+    await _sleep(Config.embed_ms)
+
+    data = []
+    for i, text in enumerate(texts):
+        vec = _embedding(str(text), dim)
+        if body.get("encoding_format") == "base64":
+            embedding: Any = base64.b64encode(vec.tobytes()).decode("ascii")
+        else:
+            embedding = vec.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(_tokens(str(t)) for t in texts)
+    return {
+        "object": "list",
+        "data": data,
+        "model": model,
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return dict(_stats)
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    _stats.clear()
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--gen-ms", type=float, default=Config.gen_ms, help="medijana latencije generisanja")
+    parser.add_argument("--guard-ms", type=float, default=Config.guard_ms, help="medijana latencije guard poziva")
+    parser.add_argument("--embed-ms", type=float, default=Config.embed_ms, help="medijana latencije embeddinga")
+    parser.add_argument("--sigma", type=float, default=Config.sigma, help="rasipanje log-normalne latencije")
+    parser.add_argument("--stream-tps", type=float, default=Config.stream_tps, help="riječi u sekundi kod streama")
+    parser.add_argument("--unsafe-rate", type=float, default=Config.unsafe_rate, help="udio UNSAFE guard odluka")
+    parser.add_argument("--stall-rate", type=float, default=Config.stall_rate, help="udio chat poziva koji zaglave")
+    parser.add_argument("--stall-ms", type=float, default=Config.stall_ms, help="koliko dugo zaglavljen poziv čeka")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    Config.gen_ms = args.gen_ms
+    Config.guard_ms = args.guard_ms
+    Config.embed_ms = args.embed_ms
+    Config.sigma = args.sigma
+    Config.stream_tps = args.stream_tps
+    Config.unsafe_rate = args.unsafe_rate
+    Config.stall_rate = args.stall_rate
+    Config.stall_ms = args.stall_ms
+    random.seed(args.seed)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Load test za /chat: mješavina pitanja (obično / opšte stanje / nepoznat analit)
+nad sintetičkim lab_rows, na rastućoj konkurentnosti. Za svaki nivo ispisuje
+p50/p95/p99 latenciju, zahtjeve u sekundi, odbijene zahtjeve (503 iz
+admission control-a) i pozive modela po zahtjevu (iz /stats lažnog OpenAI
+servera, bench/fake_openai.py).
+
+Primjeri:
+    # sve lokalno: podiže fake_openai.py i bota (uvicorn) sa OPENAI_BASE_URL na fake
+    python bench/load_test.py --spawn --concurrency 1,8,32 --requests 200
+
+    # već pokrenuti servisi
+    python bench/load_test.py --url http://127.0.0.1:8000 --fake-url http://127.0.0.1:8100
+
+    # nalazi kroz sesiju (POST /sessions jednom po korisniku) ili kolonski zapis, streaming
+    python bench/load_test.py --spawn --payload session --stream
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+BOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BOT_DIR))
+
+from wire import encode_lab_columns  # noqa: E402
+
+KNOWLEDGE_FILE = BOT_DIR / "data" / "knowledge_analiti.json"
+
+DEFAULT_TEMPLATES = [
+    "Šta znači moj {name}?",
+    "Objasni mi {name} iz nalaza.",
+    "Zašto se mjeri {name}?",
+    "Da li je {name} kod mene u opsegu?",
+]
+OVERALL_QUESTIONS = [
+    "Kakvo je moje opšte stanje na osnovu nalaza?",
+    "Kakav je trend mojih nalaza kroz vrijeme?",
+    "Da li se moji nalazi poboljšavaju?",
+]
+UNKNOWN_QUESTIONS = [
+    "Šta znači moj parametar XQZ-{n}?",
+    "Objasni mi analit Zetamin-{n}.",
+]
+
+
+def _analiti() -> List[Dict]:
+    with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        return [d for d in json.load(f) if d.get("type") == "analit_info"]
+
+
+def synthetic_lab_rows(analiti: List[Dict], history: int, rng: random.Random) -> List[Dict]:
+    """Nalazi jednog korisnika: `history` izvještaja, u svakom svi analiti sa blagim trendom."""
+    rows = []
+    for doc in analiti:
+        name = doc.get("name") or doc.get("id")
+        low, high = 10.0, 100.0
+        level = rng.uniform(low * 0.8, high * 1.1)
+        drift = rng.uniform(-2.0, 2.0)
+        for i in range(history):
+            value = round(level + drift * i + rng.gauss(0, 3), 1)
+            status = "H" if value > high else ("L" if value < low else "N")
+            rows.append({
+                "analit": name,
+                "value": value,
+                "unit": doc.get("unit_general"),
+                "ref_low": low,
+                "ref_high": high,
+                "status": status,
+                "date": f"{2019 + i // 12}-{1 + i % 12:02d}-15",
+                "source": f"izvjestaj_{i}.pdf",
+            })
+    return rows
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix.append((kind.strip(), float(weight)))
+    return mix
+
+
+def make_question(kind: str, analiti: List[Dict], rng: random.Random) -> str:
+    if kind == "overall":
+        return rng.choice(OVERALL_QUESTIONS)
+    if kind == "unknown":
+        return rng.choice(UNKNOWN_QUESTIONS).format(n=rng.randint(1, 999))
+    doc = rng.choice(analiti)
+    name = rng.choice([doc.get("name")] + list(doc.get("synonyms") or []))
+    return rng.choice(DEFAULT_TEMPLATES).format(name=name)
+
+
+class User:
+    """Sintetički korisnik: svoji nalazi i (kod --payload session) svoja sesija."""
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.columns = encode_lab_columns(rows)
+        self.session_id: Optional[str] = None
+
+    async def payload(self, client: httpx.AsyncClient, url: str, mode: str) -> Dict:
+        if mode == "columns":
+            return {"lab_columns": self.columns}
+        if mode == "session":
+            if self.session_id is None:
+                r = await client.post(f"{url}/sessions", json={"lab_columns": self.columns})
+                r.raise_for_status()
+                self.session_id = r.json()["session_id"]
+            return {"session_id": self.session_id}
+        return {"lab_rows": self.rows}
+
+
+async def _one_request(client, url: str, user: User, question: str, mode: str, stream: bool) -> float:
+    body = {"question": question, **(await user.payload(client, url, mode))}
+    t0 = time.perf_counter()
+    if stream:
+        async with client.stream("POST", f"{url}/chat/stream", json=body) as r:
+            r.raise_for_status()
+            async for _ in r.aiter_raw():
+                pass
+    else:
+        r = await client.post(f"{url}/chat", json=body)
+        r.raise_for_status()
+    return time.perf_counter() - t0
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    url: str,
+    users: List[User],
+    questions: List[Tuple[int, str]],
+    concurrency: int,
+    mode: str,
+    stream: bool,
+) -> Tuple[List[float], int, int, float]:
+    """Izvršava sva pitanja sa najviše `concurrency` u letu; (latencije, odbijeni, greške, ukupno_s)."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in questions:
+        queue.put_nowait(item)
+    latencies: List[float] = []
+    shed = 0
+    errors = 0
+
+    async def worker():
+        nonlocal shed, errors
+        while True:
+            try:
+                user_index, question = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                latencies.append(await _one_request(client, url, users[user_index], question, mode, stream))
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 503:
+                    shed += 1
+                else:
+                    errors += 1
+            except (httpx.HTTPError, KeyError):
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, shed, errors, time.perf_counter() - t0
+
+
+async def _fake_stats(client: httpx.AsyncClient, fake_url: Optional[str]) -> Dict[str, int]:
+    if not fake_url:
+        return {}
+    try:
+        return (await client.get(f"{fake_url}/stats")).json()
+    except httpx.HTTPError:
+        return {}
+
+
+async def main_async(args) -> None:
+    analiti = _analiti()
+    rng = random.Random(args.seed)
+    users = [User(synthetic_lab_rows(analiti, args.history, rng)) for _ in range(args.users)]
+    mix = parse_mix(args.mix)
+    kinds = [k for k, _ in mix]
+    weights = [w for _, w in mix]
+
+    limits = httpx.Limits(max_connections=max(args.concurrency_levels) + 8)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        print(
+            f"{len(users)} users x {len(users[0].rows)} rows, mix {args.mix}, payload={args.payload}"
+            f"{', stream' if args.stream else ''}"
+        )
+        print(
+            f"{'conc':>5} {'reqs':>6} {'503':>4} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+            f" {'gen/req':>8} {'guard/req':>9} {'emb/req':>8}"
+        )
+        for concurrency in args.concurrency_levels:
+            questions = [
+                (rng.randrange(len(users)), make_question(rng.choices(kinds, weights)[0], analiti, rng))
+                for _ in range(args.requests)
+            ]
+            before = await _fake_stats(client, args.fake_url)
+            latencies, shed, errors, elapsed = await run_level(
+                client, args.url, users, questions, concurrency, args.payload, args.stream
+            )
+            after = await _fake_stats(client, args.fake_url)
+
+            done = len(latencies)
+            ms = np.array(latencies) * 1000.0 if latencies else np.zeros(1)
+            per_req = {
+                kind: (after.get(kind, 0) - before.get(kind, 0)) / done if done and after else float("nan")
+                for kind in ("generation", "guard", "embeddings")
+            }
+            print(
+                f"{concurrency:5d} {done:6d} {shed:4d} {errors:4d} {done / elapsed:8.1f} "
+                f"{np.percentile(ms, 50):9.1f} {np.percentile(ms, 95):9.1f} {np.percentile(ms, 99):9.1f}"
+                f" {per_req['generation']:8.2f} {per_req['guard']:9.2f} {per_req['embeddings']:8.2f}"
+            )
+
+
+def _wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} nije odgovorio za {timeout:.0f}s")
+
+
+def _spawn(args) -> List[subprocess.Popen]:
+    """Podiže lažni OpenAI i bota (uvicorn) koji ga koristi preko OPENAI_BASE_URL."""
+    fake_port = int(args.fake_url.rsplit(":", 1)[1])
+    bot_port = int(args.url.rsplit(":", 1)[1])
+    fake = subprocess.Popen([
+        sys.executable, str(Path(__file__).with_name("fake_openai.py")),
+        "--port", str(fake_port),
+        "--gen-ms", str(args.gen_ms), "--guard-ms", str(args.guard_ms),
+        "--sigma", str(args.sigma), "--unsafe-rate", str(args.unsafe_rate),
+        "--stall-rate", str(args.stall_rate), "--stall-ms", str(args.stall_ms),
+    ])
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"{args.fake_url}/v1",
+        "OPENAI_API_KEY": "fake",
+        "GUARD_CACHE_FILE": "",
+    })
+    bot = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(bot_port), "--log-level", "warning"],
+        cwd=str(BOT_DIR),
+        env=env,
+    )
+    procs = [fake, bot]
+    try:
+        _wait_for(f"{args.fake_url}/stats")
+        _wait_for(f"{args.url}/health")
+    except Exception:
+        for p in procs:
+            p.terminate()
+        raise
+    return procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="bot (app.py)")
+    parser.add_argument("--fake-url", default="http://127.0.0.1:8100", help="fake_openai.py (za pozive po zahtjevu)")
+    parser.add_argument("--spawn", action="store_true", help="sam podigni fake_openai.py i bota")
+    parser.add_argument("--concurrency", default="1,4,16,32")
+    parser.add_argument("--requests", type=int, default=200, help="zahtjeva po nivou konkurentnosti")
+    parser.add_argument("--mix", default="default=0.7,overall=0.2,unknown=0.1")
+    parser.add_argument("--users", type=int, default=50, help="različitih korisnika (različiti lab_rows)")
+    parser.add_argument("--history", type=int, default=12, help="izvještaja po korisniku")
+    parser.add_argument("--payload", choices=("rows", "columns", "session"), default="rows")
+    parser.add_argument("--stream", action="store_true", help="/chat/stream umjesto /chat")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    # za --spawn: latencija lažnog OpenAI-ja
+    parser.add_argument("--gen-ms", type=float, default=800.0)
+    parser.add_argument("--guard-ms", type=float, default=300.0)
+    parser.add_argument("--sigma", type=float, default=0.4)
+    parser.add_argument("--unsafe-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="udio poziva modela koji zaglave")
+    parser.add_argument("--stall-ms", type=float, default=20000.0)
+    args = parser.parse_args()
+    args.concurrency_levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    procs = _spawn(args) if args.spawn else []
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
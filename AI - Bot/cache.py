@@ -0,0 +1,345 @@
+"""
+Jednostavni keševi za LabGuardBot (guard odluke, odgovori ...).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+_WS_RE = re.compile(r"\s+")
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    """lowercase + sažeti razmaci – da se ista pitanja/odgovori poklope u ključu."""
+    return _WS_RE.sub(" ", (text or "").lower()).strip()
+
+
+def fingerprint(*parts: str) -> str:
+    """SHA-256 nad normalizovanim dijelovima ključa."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(normalize_text(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class LRUCache:
+    """
+    Ograničen LRU keš sa TTL-om, thread-safe, sa brojačima pogodaka.
+
+    Vrijednosti moraju biti JSON-serijalizabilne ako se koristi save()/load().
+    """
+
+    blocking = False  # sve u memoriji – može se zvati direktno iz event loop-a
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_field(self, key: str, field: str) -> Optional[Any]:
+        """Jedno polje dict vrijednosti (kao get(key)[field]); None ako stavke nema."""
+        value = self.get(key)
+        return value.get(field) if isinstance(value, dict) else None
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def save(self, path: Path) -> None:
+        """Atomski upis (tmp + rename) svih još važećih stavki u JSON."""
+        now = time.time()
+        with self._lock:
+            items = [
+                [key, value, expires_at]
+                for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def load(self, path: Path) -> int:
+        """Učitava stavke sačuvane sa save(); istekle preskače. Vraća broj učitanih."""
+        path = Path(path)
+        if not path.exists():
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception:
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for key, value, expires_at in items:
+                if expires_at is not None and expires_at <= now:
+                    continue
+                self._data[key] = (value, expires_at)
+                loaded += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return loaded
+
+
+class SQLiteCache:
+    """
+    Isti interfejs kao LRUCache, ali na disku (SQLite) – preživljava restart
+    i može da ga dijeli više worker procesa na istoj mašini.
+
+    Vrijednosti se čuvaju kao JSON.
+
+    get() ne piše u bazu: vrijeme pristupa (za LRU) se pamti u memoriji i
+    upisuje zajedno sa sledećim set(), prije izbacivanja; istekle stavke se
+    preskaču pri čitanju i brišu pri upisu. Pozivi ipak idu na disk, pa ih
+    async kod zove kroz asyncio.to_thread (`blocking`).
+    """
+
+    blocking = True
+
+    def __init__(self, path: Path, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}  # ključ -> last_access, još neupisano
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self.hits += 1
+        return json.loads(value)
+
+    def get_field(self, key: str, field: str) -> Optional[Any]:
+        """
+        Jedno polje dict vrijednosti (kao get(key)[field]) bez dekodiranja
+        cijele vrijednosti u Pythonu – SQLite ga izvuče iz JSON-a (json_extract).
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT json_extract(value, ?), expires_at FROM cache WHERE key = ?",
+                ("$." + field, key),
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self.hits += 1
+        return row[0]
+
+    def _flush_touched(self) -> None:
+        """Upisuje vremena pristupa iz get(); zove se pod lock-om, prije commit-a."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE cache SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            self._touched.pop(key, None)
+            self._flush_touched()
+            self._conn.execute(
+                "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            # LRU izbacivanje kada pređemo maxsize
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self._touched.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        size = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def make_cache(backend: str, maxsize: int, ttl: Optional[float], path: Optional[Path] = None):
+    """
+    Fabrika keša po imenu backenda: "memory" (LRUCache), "sqlite" (SQLiteCache)
+    ili "off"/"" (None – keš isključen).
+    """
+    backend = (backend or "").strip().lower()
+    if backend in ("", "off", "none", "0"):
+        return None
+    if backend == "memory":
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if backend == "sqlite":
+        if path is None:
+            raise ValueError("SQLite keš zahtijeva putanju do fajla")
+        return SQLiteCache(path, maxsize=maxsize, ttl=ttl)
+    raise ValueError(f"Nepoznat backend keša: {backend}")
+
+
+class SingleFlight:
+    """
+    Spajanje istovremenih async izračuna sa istim ključem: prvi poziv
+    pokreće izračun (kao zaseban task), a ostali koji stignu dok je u toku
+    čekaju isti rezultat (ili istu grešku) umjesto da ga računaju ponovo.
+
+    Za razliku od keša ne čeka da se rezultat upiše – pokriva upravo nalet
+    istih pitanja prije nego što prvi odgovor stigne. Otkazivanje jednog
+    čekaoca (npr. klijent zatvorio konekciju) ne prekida izračun za ostale.
+    Radi unutar jednog event loop-a (procesa).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    def _done(self, key: str, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled() and flight.exception() is not None:
+            self.failed += 1  # exception() ujedno označava grešku kao preuzetu
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(compute())
+            self._flights[key] = flight
+            self.leaders += 1
+            flight.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    def pending(self, key: str) -> Optional[asyncio.Future]:
+        """Izračun u toku za ključ (za čekaoce koji ga ne bi sami pokrenuli) ili None."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        return flight
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "coalesce_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+        }
@@ -1,21 +1,94 @@
+import asyncio
+import hashlib
+import json
 import os
-from collections import defaultdict
-from typing import Dict, List, Optional
-
-from openai import OpenAI
-
-from guardrails import guarded_response
+import time
+from contextlib import aclosing
+from functools import cached_property
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from cache import SingleFlight, fingerprint, make_cache, normalize_text
+from guard_rules import register_canned_answer
+from guardrails import guarded_response, guarded_response_async, guarded_stream
+from ingest.local_storage_vector import STORAGE_FILE as ANALITI_FILE
+from ingest.local_storage_vector import VECTOR_INDEX_FILE, search_documents_scored
 from ingest.local_storage_vector import load_documents as load_analiti_documents
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from lab_columns import ROLLING_WINDOW, AnalitStats, LabColumns, fmt_number
+from metrics import observe_stage, prompt_tokens, record_usage, span
+from prompt_budget import ContextPiece, PromptReport, PromptStats, count_message_tokens, fit_pieces
+from retrieval import HybridRetriever
+from text_match import AhoCorasick, Match
+from upstream import admit, async_client, call_async, call_sync, client
+
+# Keš gotovih (guard-ovanih) odgovora: memory | sqlite | off
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_PATH = Path(
+    os.getenv("ANSWER_CACHE_PATH", str(Path(__file__).resolve().parent / "data" / "answer_cache.sqlite3"))
+)
+
+# Hibridna pretraga (BM25 + vektori) kada pitanje ne pominje analit po imenu/sinonimu
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") != "0"
+HYBRID_VECTOR_BUDGET_MS = float(os.getenv("HYBRID_VECTOR_BUDGET_MS", "800"))
+HYBRID_BM25_MIN_SCORE = float(os.getenv("HYBRID_BM25_MIN_SCORE", "1.0"))
+HYBRID_VECTOR_MIN_SIM = float(os.getenv("HYBRID_VECTOR_MIN_SIM", "0.35"))
+# RRF prag (1/(60+3) = treće mjesto u jednoj listi) i da li analit moraju naći i BM25 i vektori
+HYBRID_MIN_RRF_SCORE = float(os.getenv("HYBRID_MIN_RRF_SCORE", str(1.0 / (60 + 3))))
+HYBRID_REQUIRE_AGREEMENT = os.getenv("HYBRID_REQUIRE_AGREEMENT", "1") != "0"
+
+answer_cache = make_cache(
+    ANSWER_CACHE_BACKEND,
+    maxsize=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL or None,
+    path=ANSWER_CACHE_PATH,
+)
+
+# Istovremena ista pitanja (isti ključ kao keš odgovora) dijele jedan poziv modela + guard
+ANSWER_SINGLE_FLIGHT = os.getenv("ANSWER_SINGLE_FLIGHT", "1") != "0"
+answer_flights = SingleFlight()
+
+# Budžet cijelog prompta u tokenima (sistemski prompt + kontekst + pitanje)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+
+# /chat/batch: koliko pitanja iz jednog batch-a ide ka modelu istovremeno
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+prompt_stats = PromptStats()
 
 # ---------------------------------------------------------
 #  GLOBALNI KONTEKST IZ knowledge_analiti.json
 # ---------------------------------------------------------
 
+class AnalitRecord(NamedTuple):
+    """Unaprijed pripremljen analit: gotov blok konteksta i razriješeni povezani analiti."""
+    doc: Dict
+    name: str
+    context: str  # _analit_doc_to_text(doc), renderovan jednom pri učitavanju
+    brief: str  # ime + kratak opis – kada je analit samo "povezan" sa pitanim
+    related_ids: Tuple[str, ...]  # samo id-jevi koji postoje u bazi
+    related_names: Tuple[str, ...]
+
+
 _ANALITI_DOCS: List[Dict] = []
 _ANALITI_SYNONYMS: Dict[str, List[Dict]] = {}
 _ANALITI_BY_ID: Dict[str, Dict] = {}
+_ANALITI_RECORDS: Dict[int, AnalitRecord] = {}  # id(doc) -> record
+_ANALITI_MATCHER = AhoCorasick()
+_ANALITI_HYBRID: Optional[HybridRetriever] = None
+
+# verzija baze znanja (hash sadržaja) + potpis fajla (mtime, veličina) za detekciju izmjena
+_KB_VERSION = ""
+_KB_FILE_SIGNATURE: Optional[Tuple[int, int]] = None
+
+
+def _kb_file_signature() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(ANALITI_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
 
 
 def _init_analiti_index():
@@ -23,14 +96,23 @@ def _init_analiti_index():
     Učita analite iz knowledge_analiti.json i napravi mape:
     - lowercase(ime/sinonim) -> lista dokumenata
     - id -> dokument (za related_analytes)
+    - Aho–Corasick automat nad svim imenima/sinonimima (bez dijakritika)
+    - AnalitRecord po analitu (gotov tekst konteksta + povezani analiti)
     """
-    global _ANALITI_DOCS, _ANALITI_SYNONYMS, _ANALITI_BY_ID
+    global _ANALITI_DOCS, _ANALITI_SYNONYMS, _ANALITI_BY_ID, _ANALITI_MATCHER, _ANALITI_HYBRID
+    global _ANALITI_RECORDS
+    global _KB_VERSION, _KB_FILE_SIGNATURE
 
+    _KB_FILE_SIGNATURE = _kb_file_signature()
     try:
         docs = load_analiti_documents()
     except Exception:
         docs = []
 
+    _KB_VERSION = hashlib.sha256(
+        json.dumps(docs, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
     _ANALITI_DOCS = []
     _ANALITI_SYNONYMS = {}
     _ANALITI_BY_ID = {}
@@ -60,27 +142,153 @@ def _init_analiti_index():
         for term in terms:
             _ANALITI_SYNONYMS.setdefault(term, []).append(doc)
 
+    # tek kada je _ANALITI_BY_ID kompletan mogu se razriješiti related_analytes
+    _ANALITI_RECORDS = {id(doc): _compile_analit(doc) for doc in _ANALITI_DOCS}
 
-# inicijalizacija pri importu
-_init_analiti_index()
+    _ANALITI_MATCHER = AhoCorasick.from_terms(_ANALITI_SYNONYMS.items())
+    # BM25 indeks se gradi tek pri prvoj hibridnoj pretrazi (_hybrid_retriever)
+    _ANALITI_HYBRID = None
+
+
+def _compile_analit(doc: Dict) -> AnalitRecord:
+    related = [
+        (rid, (_ANALITI_BY_ID[rid].get("name") or "").strip())
+        for rid in doc.get("related_analytes") or []
+        if rid in _ANALITI_BY_ID
+    ]
+    name = (doc.get("name") or "").strip()
+    short = (doc.get("short_description") or "").strip()
+    return AnalitRecord(
+        doc=doc,
+        name=name,
+        context=_analit_doc_to_text(doc),
+        brief=f"{name}: {short}" if short else name,
+        related_ids=tuple(rid for rid, _ in related),
+        related_names=tuple(sorted({name for _, name in related if name})),
+    )
+
+
+def _analit_record(doc: Dict) -> AnalitRecord:
+    """
+    Record za dokument iz trenutne baze; za dokument koji nije iz nje (npr.
+    zahtjev u toku dok se baza ponovo učitavala) pravi se na licu mjesta.
+    """
+    record = _ANALITI_RECORDS.get(id(doc))
+    if record is None or record.doc is not doc:
+        record = _compile_analit(doc)
+    return record
+
+
+def _hybrid_retriever() -> HybridRetriever:
+    global _ANALITI_HYBRID
+    retriever = _ANALITI_HYBRID
+    if retriever is None:
+        retriever = HybridRetriever(
+            _ANALITI_DOCS,
+            text_fn=lambda doc: _analit_record(doc).context,
+            vector_search=_vector_search_analiti,
+            bm25_min_score=HYBRID_BM25_MIN_SCORE,
+            vector_min_similarity=HYBRID_VECTOR_MIN_SIM,
+            min_rrf_score=HYBRID_MIN_RRF_SCORE,
+            vector_budget_s=HYBRID_VECTOR_BUDGET_MS / 1000.0,
+            require_agreement=HYBRID_REQUIRE_AGREEMENT,
+        )
+        _ANALITI_HYBRID = retriever
+    return retriever
+
+
+def _vector_search_analiti(question: str, k: int) -> List[Tuple[str, float]]:
+    """FAISS pretraga -> [(id analita, cosine)]; bez indexa na disku nema ni faze."""
+    if not VECTOR_INDEX_FILE.exists():
+        return []
+    return [
+        (doc.get("id"), score)
+        for doc, score in search_documents_scored(question, k)
+        if doc.get("type") == "analit_info" and doc.get("id")
+    ]
+
+
+def _refresh_knowledge_if_changed() -> None:
+    """
+    Ako je knowledge_analiti.json izmijenjen od poslednjeg učitavanja,
+    ponovo gradi indeks analita i prazni keš odgovora (stari odgovori
+    su nastali nad starom bazom znanja).
+    """
+    if _kb_file_signature() == _KB_FILE_SIGNATURE:
+        return
+    old_version = _KB_VERSION
+    _init_analiti_index()
+    if answer_cache is not None and _KB_VERSION != old_version:
+        answer_cache.clear()
+
+
+def _lab_rows_fingerprint(lab_rows: List[Dict]) -> str:
+    """Stabilan otisak lab_rows – ne zavisi od redosljeda redova ni ključeva."""
+    encoded = sorted(
+        json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+        for row in lab_rows
+    )
+    h = hashlib.sha256()
+    for item in encoded:
+        h.update(item.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def _answer_cache_key(question: str, lab: "LabContext") -> str:
+    """Ključ keša: pitanje + namjera + otisak lab_rows + verzija baze znanja."""
+    return fingerprint(question, detect_intent(question), lab.fingerprint, _KB_VERSION)
+
+
+async def _cache_get_async(key: str) -> Optional[str]:
+    """answer_cache.get iz async koda; SQLite (blocking) keš ide u thread, ne na event loop."""
+    if answer_cache.blocking:
+        return await asyncio.to_thread(answer_cache.get, key)
+    return answer_cache.get(key)
+
+
+async def _cache_set_async(key: str, answer: str) -> None:
+    if answer_cache.blocking:
+        await asyncio.to_thread(answer_cache.set, key, answer)
+    else:
+        answer_cache.set(key, answer)
+
+
+def _find_analiti_matches(question: str) -> List[Match]:
+    """
+    Svi pogoci imena/sinonima u pitanju, u jednom prolazu kroz automat.
+    Poređenje je po cijelim riječima i bez dijakritika ("gvozdje" == "gvožđe");
+    zadnja riječ izraza može biti u padežu ("nizak nivo hemoglobina").
+    Svaki Match nosi poziciju, pogođeni izraz i listu dokumenata (payload).
+
+    Pogoci sadržani u dužem pogotku se odbacuju, pa "LDL holesterol" ne
+    povlači i "Ukupni holesterol" preko sinonima "holesterol".
+    """
+    if not question:
+        return []
+
+    matches = _ANALITI_MATCHER.search(question)  # sortirano po (start, -end)
+    maximal: List[Match] = []
+    covered_until = -1
+    for m in matches:
+        if m.end <= covered_until:
+            continue
+        maximal.append(m)
+        covered_until = m.end
+    return maximal
 
 
 def _match_analiti_in_question(question: str) -> List[Dict]:
     """
     Na osnovu imena i sinonima traži koje analite pitanje eksplicitno pominje.
     Ne koristi semantičku sličnost – samo direktna pojavljivanja izraza.
+    Dokumenti su poredani po prvom pominjanju u pitanju.
     """
-    q = (question or "").lower()
-    if not q or not _ANALITI_SYNONYMS:
-        return []
-
     seen_ids = set()
     results: List[Dict] = []
 
-    for term, docs in _ANALITI_SYNONYMS.items():
-        if not term or term not in q:
-            continue
-        for d in docs:
+    for match in _find_analiti_matches(question):
+        for d in match.payload:
             doc_id = d.get("id") or id(d)
             if doc_id in seen_ids:
                 continue
@@ -94,6 +302,9 @@ def _analit_doc_to_text(doc: Dict) -> str:
     """
     Pretvara jedan analit_info zapis u sažeti tekst za kontekst.
     Podržava nova polja: related_analytes i trend_focus.
+
+    Poziva se jednom po analitu pri učitavanju baze (_compile_analit);
+    pri obradi pitanja se koristi gotov AnalitRecord.context.
     """
     name = doc.get("name", "")
     category = doc.get("category", "")
@@ -153,6 +364,10 @@ def _analit_doc_to_text(doc: Dict) -> str:
     return text[:8000]
 
 
+# inicijalizacija pri importu (poslije _analit_doc_to_text – records se renderuju odmah)
+_init_analiti_index()
+
+
 SYSTEM_PROMPT = """
 Ti si LabGuard AI – digitalni asistent koji ljudima na jednostavan način objašnjava
 laboratorijske nalaze.
@@ -224,87 +439,151 @@ def detect_intent(question: str) -> str:
     return "default"
 
 
-def build_analiti_context(question: str, k: int = 3) -> str:
+def retrieve_analiti(question: str, k: int = 3) -> List[Dict]:
     """
-    Umjesto semantičke pretrage, koristimo STROGO
-    podudaranje sa imenima i sinonimima iz knowledge_analiti.json.
+    Analiti relevantni za pitanje:
+    1) tačno podudaranje imena/sinonima (bez ikakvog mrežnog poziva),
+    2) tek ako toga nema – hibridna BM25 + vektorska pretraga sa RRF-om.
+
+    Vremena faza hibridne pretrage idu u /metrics i debug timings kao
+    retrieval_lexical / retrieval_vector / retrieval_fusion.
     """
     matched_docs = _match_analiti_in_question(question)
+    if matched_docs or not HYBRID_RETRIEVAL or not _ANALITI_DOCS:
+        return matched_docs[:k]
+    timings: Dict[str, float] = {}
+    try:
+        return _hybrid_retriever().search(question, k=k, timings=timings)
+    finally:
+        for stage, seconds in timings.items():
+            observe_stage(f"retrieval_{stage}", seconds)
+
+
+def build_analiti_context(
+    question: str, k: int = 3, matched_docs: Optional[List[Dict]] = None
+) -> str:
+    """
+    Kontekst iz baze znanja: prvo STROGO podudaranje sa imenima i sinonimima
+    iz knowledge_analiti.json, a hibridna pretraga samo kao fallback.
+    """
+    if matched_docs is None:
+        matched_docs = retrieve_analiti(question, k=k)
     if not matched_docs:
         return ""
 
-    parts = []
-    for doc in matched_docs[:k]:
-        parts.append(_analit_doc_to_text(doc))
+    # blokovi su renderovani pri učitavanju baze – ovdje se samo spajaju
+    return "\n\n".join(_analit_record(doc).context for doc in matched_docs[:k])
+
+
+_TREND_LABELS = {"porast": "u porastu", "pad": "u padu", "stabilno": "stabilno"}
+
+
+LAB_SUMMARY_HEADER = "Sažeti pregled nalaza po analitima (bazirano na dostavljenim izvještajima):\n"
+
+
+def _summary_line(st: AnalitStats) -> str:
+    last = st.last
+    last_val = last["value"]
+    unit = last["unit"]
+    ref_low = last["ref_low"]
+    ref_high = last["ref_high"]
+    status = last["status"]
+
+    line = f"- {st.analit}: "
+    if last_val is not None:
+        line += f"poslednja vrijednost {last_val} {unit or ''}".strip()
+    else:
+        line += "poslednja vrijednost: nema podataka"
+
+    if ref_low is not None and ref_high is not None:
+        line += f", referentni opseg {ref_low}–{ref_high}"
+        if st.ref_distance > 0:
+            line += f" (iznad gornje granice za {st.ref_distance:.0f}%)"
+        elif st.ref_distance < 0:
+            line += f" (ispod donje granice za {-st.ref_distance:.0f}%)"
+
+    if status:
+        line += f", status u zadnjem nalazu: {status}"
+
+    if st.n_values >= 2:
+        stats = [
+            f"min: {fmt_number(st.min)}",
+            f"max: {fmt_number(st.max)}",
+            f"trend: uglavnom {_TREND_LABELS[st.trend]}",
+            f"prosjek zadnjih {min(st.n_values, ROLLING_WINDOW)}: {fmt_number(st.rolling_mean)}",
+        ]
+        if st.out_of_range:
+            stats.append(f"van ref. opsega: {st.out_of_range} od {st.n_values} mjerenja")
+        line += " (" + ", ".join(stats) + ")"
+    elif st.n_values == 1:
+        line += " (samo jedno mjerenje)"
+
+    return line
 
-    if not parts:
-        return ""
 
-    return "\n\n".join(parts)
+def _summary_priority(st: AnalitStats) -> int:
+    """Za budžet prompta: prvo analiti trenutno van opsega, pa oni koji su bili, pa ostali."""
+    if st.ref_distance > 0 or st.ref_distance < 0:
+        return 0
+    if st.out_of_range:
+        return 1
+    return 2
+
+
+def _lab_summary_pieces(lab_rows: List[Dict]) -> List[ContextPiece]:
+    """Redovi sažetka po analitu kao dijelovi konteksta (redoslijed = redoslijed ispisa)."""
+    if not lab_rows:
+        return []
+    return [
+        ContextPiece("summary", _summary_line(st), _summary_priority(st))
+        for st in LabColumns(lab_rows).stats()
+    ]
 
 
 def summarize_lab_rows(lab_rows: List[Dict]) -> str:
     """
-    Sažetak nalaza po analitima: zadnja vrijednost, min/max i jednostavan trend.
+    Sažetak nalaza po analitima: zadnja vrijednost, min/max, trend (nagib
+    kroz sva mjerenja), prosjek zadnjih mjerenja i koliko ih je van opsega.
+    Statistike se računaju kolonski (lab_columns) za sve analite odjednom.
     """
-    if not lab_rows:
+    pieces = _lab_summary_pieces(lab_rows)
+    if not pieces:
         return ""
+    return LAB_SUMMARY_HEADER + "\n".join(p.text for p in pieces)
+
 
-    by_analit: Dict[str, List[Dict]] = defaultdict(list)
+USER_LAB_HEADER = "Za ovog korisnika imamo sledeće poslednje vrijednosti iz nalaza:\n"
+
+
+def _latest_lab_rows(lab_rows: List[Dict]) -> Dict[str, Dict]:
+    """analit -> red sa najnovijim datumom."""
+    by_analit: Dict[str, Dict] = {}
     for row in lab_rows:
         analit = row.get("analit") or row.get("Analit")
         if not analit:
             continue
-        by_analit[analit].append(row)
-
-    summary_lines = []
-    for analit, rows in by_analit.items():
-        rows_sorted = sorted(rows, key=lambda r: r.get("date", ""))
-        values = [r.get("value") or r.get("Vrijednost") for r in rows_sorted]
-        values = [v for v in values if isinstance(v, (int, float))]
-
-        last = rows_sorted[-1]
-        last_val = last.get("value") or last.get("Vrijednost")
-        unit = last.get("unit") or last.get("Jedinica")
-        ref_low = last.get("ref_low") or last.get("Ref_low")
-        ref_high = last.get("ref_high") or last.get("Ref_high")
-        status = last.get("status") or last.get("Status")
-        n = len(values)
-
-        line = f"- {analit}: "
-        if last_val is not None:
-            line += f"poslednja vrijednost {last_val} {unit or ''}".strip()
-        else:
-            line += "poslednja vrijednost: nema podataka"
-
-        if ref_low is not None and ref_high is not None:
-            line += f", referentni opseg {ref_low}–{ref_high}"
-
-        if status:
-            line += f", status u zadnjem nalazu: {status}"
-
-        if n >= 2:
-            min_val = min(values)
-            max_val = max(values)
-            if values[0] < values[-1]:
-                trend = "uglavnom u porastu"
-            elif values[0] > values[-1]:
-                trend = "uglavnom u padu"
-            else:
-                trend = "uglavnom stabilno"
-            line += f" (min: {min_val}, max: {max_val}, trend: {trend})"
-        elif n == 1:
-            line += " (samo jedno mjerenje)"
+        existing = by_analit.get(analit)
+        if not existing or (row.get("date", "") > existing.get("date", "")):
+            by_analit[analit] = row
+    return by_analit
 
-        summary_lines.append(line)
 
-    if not summary_lines:
-        return ""
+def _lab_row_line(analit: str, row: Dict) -> str:
+    val = row.get("value") or row.get("Vrijednost")
+    unit = row.get("unit") or row.get("Jedinica")
+    ref_low = row.get("ref_low") or row.get("Ref_low")
+    ref_high = row.get("ref_high") or row.get("Ref_high")
+    status = row.get("status") or row.get("Status")
 
-    header = (
-        "Sažeti pregled nalaza po analitima (bazirano na dostavljenim izvještajima):\n"
-    )
-    return header + "\n".join(summary_lines)
+    base = f"{analit}: {val} {unit or ''}".strip()
+    extra = []
+    if ref_low is not None and ref_high is not None:
+        extra.append(f"ref. opseg {ref_low}–{ref_high}")
+    if status:
+        extra.append(f"status: {status}")
+    if extra:
+        base += " (" + ", ".join(extra) + ")"
+    return "- " + base
 
 
 def build_user_lab_context(lab_rows: List[Dict]) -> str:
@@ -315,51 +594,93 @@ def build_user_lab_context(lab_rows: List[Dict]) -> str:
     if not lab_rows:
         return ""
 
-    by_analit: Dict[str, Dict] = {}
-    for row in lab_rows:
-        analit = row.get("analit") or row.get("Analit")
-        if not analit:
-            continue
-        existing = by_analit.get(analit)
-        if not existing or (row.get("date", "") > existing.get("date", "")):
-            by_analit[analit] = row
-
-    lines = []
-    for analit, row in by_analit.items():
-        val = row.get("value") or row.get("Vrijednost")
-        unit = row.get("unit") or row.get("Jedinica")
-        ref_low = row.get("ref_low") or row.get("Ref_low")
-        ref_high = row.get("ref_high") or row.get("Ref_high")
-        status = row.get("status") or row.get("Status")
-
-        base = f"{analit}: {val} {unit or ''}".strip()
-        extra = []
-        if ref_low is not None and ref_high is not None:
-            extra.append(f"ref. opseg {ref_low}–{ref_high}")
-        if status:
-            extra.append(f"status: {status}")
-        if extra:
-            base += " (" + ", ".join(extra) + ")"
-        lines.append(base)
-
+    lines = [_lab_row_line(analit, row) for analit, row in _latest_lab_rows(lab_rows).items()]
     if not lines:
         return ""
 
-    return (
-        "Za ovog korisnika imamo sledeće poslednje vrijednosti iz nalaza:\n"
-        + "\n".join(f"- {ln}" for ln in lines)
-    )
+    return USER_LAB_HEADER + "\n".join(lines)
 
 
-def _maybe_handle_unknown_analit(question: str) -> Optional[str]:
+class LabContext:
+    """
+    lab_rows jednog korisnika i ono što se iz njih računa nezavisno od
+    pitanja (otisak za keš, redovi sažetka, poslednje vrijednosti). Svaka
+    stavka se računa najviše jednom, pri prvom korišćenju – pa se isti
+    LabContext (npr. iz sesije, vidi sessions.py) koristi kroz više pitanja.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+
+    @cached_property
+    def fingerprint(self) -> str:
+        return _lab_rows_fingerprint(self.rows)
+
+    @cached_property
+    def summary_pieces(self) -> List[ContextPiece]:
+        return _lab_summary_pieces(self.rows)
+
+    @cached_property
+    def latest(self) -> Dict[str, Dict]:
+        return _latest_lab_rows(self.rows)
+
+    def precompute(self) -> "LabContext":
+        """Računa sve odmah (npr. pri učitavanju nalaza u sesiju)."""
+        for name in ("fingerprint", "summary_pieces", "latest"):
+            getattr(self, name)
+        return self
+
+
+LabRows = Union[List[Dict], LabContext, None]
+
+
+def as_lab_context(lab_rows: LabRows) -> LabContext:
+    if isinstance(lab_rows, LabContext):
+        return lab_rows
+    return LabContext(lab_rows or [])
+
+
+# ---------------------------------------------------------
+#  FIKSNI (CANNED) ODGOVORI
+# ---------------------------------------------------------
+
+META_ANSWER = (
+    "Nemam direktan uvid u tvoje medicinske podatke na serveru, ali aplikacija mi "
+    "prosleđuje sažete informacije iz tvojih nalaza (naziv analita, vrijednost i "
+    "referentni opseg). Na osnovu toga mogu da objasnim šta koji parametar znači "
+    "i da ti dam informativan opis, ali ne i dijagnozu."
+)
+
+UNKNOWN_ANALIT_ANSWER = (
+    "Nemam dovoljno pouzdanih informacija o tom konkretnom parametru u svojoj bazi znanja, "
+    "pa ne mogu da ga detaljno tumačim. U aplikaciji možeš da vidiš brojčane vrijednosti "
+    "i referentni opseg, ali za pravo medicinsko objašnjenje najbolje je da nalaz "
+    "prođeš sa svojim ljekarom."
+)
+
+NO_DATA_OVERALL_ANSWER = (
+    "Nemam dovoljno podataka o tvojim nalazima da bih opisao opšte stanje. "
+    "Molim te da prvo učitaš laboratorijske izvještaje u aplikaciju, pa onda pokušaš ponovo. "
+    "Za bilo kakvo ozbiljnije tumačenje uvijek se obrati svom ljekaru."
+)
+
+for _canned in (META_ANSWER, UNKNOWN_ANALIT_ANSWER, NO_DATA_OVERALL_ANSWER):
+    register_canned_answer(_canned)
+
+
+def _unknown_analit_answer(
+    question: str, matched_docs: Optional[List[Dict]] = None
+) -> Optional[str]:
     """
     Ako pitanje izgleda kao 'objasni mi ovaj analit', a nijedan analit
-    iz naše baze se ne poklapa sa imenom/sinonimima u pitanju,
-    vraćamo bezbjednu poruku UMJESTO poziva LLM-u.
+    iz naše baze nije pronađen (ni po imenu/sinonimu, ni hibridnom pretragom),
+    vraća (nečuvanu) bezbjednu poruku, inače None.
     """
     q = (question or "").lower()
 
-    if _match_analiti_in_question(q):
+    if matched_docs is None:
+        matched_docs = retrieve_analiti(question)
+    if matched_docs:
         return None
 
     triggers = [
@@ -375,119 +696,469 @@ def _maybe_handle_unknown_analit(question: str) -> Optional[str]:
     ]
 
     if any(t in q for t in triggers):
-        raw = (
-            "Nemam dovoljno pouzdanih informacija o tom konkretnom parametru u svojoj bazi znanja, "
-            "pa ne mogu da ga detaljno tumačim. U aplikaciji možeš da vidiš brojčane vrijednosti "
-            "i referentni opseg, ali za pravo medicinsko objašnjenje najbolje je da nalaz "
-            "prođeš sa svojim ljekarom."
-        )
-        return guarded_response(question, raw)
+        return UNKNOWN_ANALIT_ANSWER
 
     return None
 
 
-def generate_overall_answer(question: str, lab_summary: str) -> str:
+def _maybe_handle_unknown_analit(question: str) -> Optional[str]:
     """
-    Poseban poziv modela za 'opšte stanje' / trend nalaza.
+    Ako pitanje izgleda kao 'objasni mi ovaj analit', a nijedan analit
+    iz naše baze se ne poklapa sa imenom/sinonimima u pitanju,
+    vraćamo bezbjednu poruku UMJESTO poziva LLM-u.
     """
-    if not lab_summary:
-        raw_answer = (
-            "Nemam dovoljno podataka o tvojim nalazima da bih opisao opšte stanje. "
-            "Molim te da prvo učitaš laboratorijske izvještaje u aplikaciju, pa onda pokušaš ponovo. "
-            "Za bilo kakvo ozbiljnije tumačenje uvijek se obrati svom ljekaru."
-        )
-        return guarded_response(question, raw_answer)
+    raw = _unknown_analit_answer(question)
+    if raw is None:
+        return None
+    return guarded_response(question, raw)
 
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {
-            "role": "system",
-            "content": (
-                "Korisnik traži opis opšteg stanja i trenda nalaza kroz vrijeme. "
-                "Na osnovu sažetka ispod, opiši ukratko šta se mijenja (šta raste, šta pada, šta je stabilno). "
-                "Možeš da daš i okviran utisak (npr. 1–10), ali naglasi da to nije dijagnoza.\n\n"
-                + lab_summary
-            ),
-        },
-        {"role": "user", "content": question},
-    ]
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=messages,
-        temperature=0.1,
+async def _maybe_handle_unknown_analit_async(question: str) -> Optional[str]:
+    """Async varijanta _maybe_handle_unknown_analit."""
+    # hibridna pretraga može da čeka embedding poziv – van event loop-a
+    raw = await asyncio.to_thread(_unknown_analit_answer, question)
+    if raw is None:
+        return None
+    return await guarded_response_async(question, raw)
+
+
+# ---------------------------------------------------------
+#  SKLAPANJE PORUKA ZA MODEL
+# ---------------------------------------------------------
+
+def _budgeted_request(
+    intent: str,
+    pieces: List[ContextPiece],
+    render: Callable[[List[ContextPiece], int], List[Dict[str, str]]],
+    temperature: float,
+) -> Tuple[Dict, PromptReport]:
+    """
+    Bira dijelove konteksta po prioritetu tako da cijeli prompt stane u
+    PROMPT_TOKEN_BUDGET. `render(izabrani, broj_izostavljenih)` sklapa poruke.
+    """
+    fixed_tokens = count_message_tokens(render([], 0))
+    # zaglavlja sekcija (i napomena o izostavljenom) – rezervišu se unaprijed
+    overhead = count_message_tokens(render([p._replace(text="") for p in pieces], 1)) - fixed_tokens
+    chosen, dropped, truncated = fit_pieces(pieces, PROMPT_TOKEN_BUDGET - fixed_tokens - overhead)
+
+    messages = render(chosen, len(dropped))
+    prompt_tokens = count_message_tokens(messages)
+    # procjena je po dijelovima, a broji se cijeli prompt – eventualni višak skida najmanje važne
+    while prompt_tokens > PROMPT_TOKEN_BUDGET and chosen:
+        least = max(range(len(chosen)), key=lambda i: (chosen[i].priority, i))
+        dropped.append(chosen.pop(least))
+        messages = render(chosen, len(dropped))
+        prompt_tokens = count_message_tokens(messages)
+
+    report = PromptReport(
+        intent=intent,
+        budget=PROMPT_TOKEN_BUDGET,
+        prompt_tokens=prompt_tokens,
+        context_tokens=prompt_tokens - fixed_tokens,
+        pieces_included=len(chosen),
+        pieces_dropped=len(dropped),
+        truncated=truncated,
     )
-    raw_answer = response.choices[0].message.content or ""
-    return guarded_response(question, raw_answer)
+    return {"model": "gpt-4.1-mini", "messages": messages, "temperature": temperature}, report
+
+
+def _overall_request(
+    question: str, lab_summary: str, pieces: Optional[List[ContextPiece]] = None
+) -> Tuple[Dict, PromptReport]:
+    """
+    Parametri poziva modela za 'opšte stanje' / trend nalaza.
+
+    `pieces` su redovi sažetka sa prioritetom (_lab_summary_pieces); bez njih
+    se redovi uzimaju iz teksta lab_summary, svi jednako važni.
+    """
+    if pieces is None:
+        pieces = [
+            ContextPiece("summary", line, 0)
+            for line in lab_summary.splitlines()
+            if line.startswith("- ")
+        ]
+
+    def render(chosen: List[ContextPiece], n_dropped: int) -> List[Dict[str, str]]:
+        summary = LAB_SUMMARY_HEADER + "\n".join(p.text for p in chosen)
+        if n_dropped:
+            summary += f"\n- (još {n_dropped} analita nije prikazano zbog dužine)"
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {
+                "role": "system",
+                "content": (
+                    "Korisnik traži opis opšteg stanja i trenda nalaza kroz vrijeme. "
+                    "Na osnovu sažetka ispod, opiši ukratko šta se mijenja (šta raste, šta pada, šta je stabilno). "
+                    "Možeš da daš i okviran utisak (npr. 1–10), ali naglasi da to nije dijagnoza.\n\n"
+                    + summary
+                ),
+            },
+            {"role": "user", "content": question},
+        ]
+
+    return _budgeted_request("overall", pieces, render, temperature=0.1)
+
+
+def _default_context_pieces(
+    question: str, lab: LabContext, matched_docs: Optional[List[Dict]]
+) -> List[ContextPiece]:
+    """
+    Dijelovi konteksta za obično pitanje, po važnosti:
+    0    prvi pronađeni analit (skraćuje se umjesto da ispadne) i poslednje
+         vrijednosti pronađenih analita (kratke, pa se biraju prije skraćivanja),
+    1–2  ostali pronađeni analiti,
+    20   ostale poslednje vrijednosti,
+    30   kratki opisi povezanih analita (related_analytes).
+    """
+    if matched_docs is None:
+        matched_docs = retrieve_analiti(question, k=3)
+    records = [_analit_record(doc) for doc in matched_docs[:3]]
+    matched_ids = {id(r.doc) for r in records}
+
+    pieces = [
+        ContextPiece("knowledge", r.context, priority=i, truncatable=(i == 0))
+        for i, r in enumerate(records)
+    ]
+
+    for analit, row in lab.latest.items():
+        relevant = any(
+            id(doc) in matched_ids
+            for m in _find_analiti_matches(analit) for doc in m.payload
+        )
+        pieces.append(ContextPiece("labs", _lab_row_line(analit, row), 0 if relevant else 20))
+
+    seen = set(matched_ids)
+    for r in records:
+        for rid in r.related_ids:
+            rel = _ANALITI_BY_ID.get(rid)
+            if rel is None or id(rel) in seen:
+                continue
+            seen.add(id(rel))
+            pieces.append(ContextPiece("related", "- " + _analit_record(rel).brief, 30))
+
+    return pieces
+
+
+def _default_request(
+    question: str, lab: LabContext, matched_docs: Optional[List[Dict]] = None
+) -> Tuple[Dict, PromptReport]:
+    """Parametri poziva modela za obično pitanje (analit + poslednje vrijednosti)."""
+    pieces = _default_context_pieces(question, lab, matched_docs)
+
+    def render(chosen: List[ContextPiece], n_dropped: int) -> List[Dict[str, str]]:
+        knowledge = [p.text for p in chosen if p.section == "knowledge"]
+        related = [p.text for p in chosen if p.section == "related"]
+        labs = [p.text for p in chosen if p.section == "labs"]
+
+        # Kontekst iz baze znanja (pronađeni analiti) + poslednje vrijednosti
+        context_blocks = []
+        knowledge_parts = list(knowledge)
+        if related:
+            knowledge_parts.append("Povezani analiti (kratko):\n" + "\n".join(related))
+        if knowledge_parts:
+            context_blocks.append(
+                "Informacije iz baze znanja o analitima:\n" + "\n\n".join(knowledge_parts)
+            )
+        if labs:
+            context_blocks.append(
+                "Informacije iz korisnikovih nalaza (zadnje izmjerene vrijednosti):\n"
+                + USER_LAB_HEADER
+                + "\n".join(labs)
+            )
+
+        combined_context = "\n\n".join(context_blocks).strip()
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+        if combined_context:
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": (
+                        "Ovo su podaci koje možeš koristiti samo kao pomoć, "
+                        "ali ih ne smiješ izmišljati niti dopunjavati:\n\n"
+                        + combined_context
+                    ),
+                }
+            )
+
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    return _budgeted_request("default", pieces, render, temperature=0)
+
+
+Plan = Tuple[Optional[str], Optional[Dict], Optional[PromptReport]]
 
 
-def generate_answer(question: str, lab_rows: Optional[List[Dict]] = None) -> str:
+def _plan_answer(question: str, lab: LabContext) -> Plan:
     """
-    Glavna funkcija za generisanje odgovora.
+    Zajednički (sinhroni) dio generate_answer i generate_answer_async. Mrežu
+    koristi samo hibridna pretraga, i to samo kada nema tačnog poklapanja.
+
+    Vraća (canned_odgovor, None, None) kada odgovor ne traži poziv modela,
+    odnosno (None, parametri_poziva, veličina_prompta) kada treba pitati model.
     """
-    lab_rows = lab_rows or []
     q_low = (question or "").lower().strip()
 
     # 0) Meta pitanja tipa "da li vidis moje nalaze"
     if "vidis" in q_low or "vidiš" in q_low:
-        raw = (
-            "Nemam direktan uvid u tvoje medicinske podatke na serveru, ali aplikacija mi "
-            "prosleđuje sažete informacije iz tvojih nalaza (naziv analita, vrijednost i "
-            "referentni opseg). Na osnovu toga mogu da objasnim šta koji parametar znači "
-            "i da ti dam informativan opis, ali ne i dijagnozu."
-        )
-        return guarded_response(question, raw)
+        return META_ANSWER, None, None
 
-    intent = detect_intent(question)
+    with span("intent"):
+        intent = detect_intent(question)
 
     # 1) Opšte stanje / trend
     if intent == "overall":
-        lab_summary = summarize_lab_rows(lab_rows)
-        return generate_overall_answer(question, lab_summary)
-
-    # 2) Ako izgleda da pita za analit koga uopšte nemamo u bazi – odmah safe odgovor
-    maybe = _maybe_handle_unknown_analit(question)
-    if maybe is not None:
-        return maybe
-
-    # 3) Kontekst iz baze znanja (samo eksplicitni analiti) + poslednje vrijednosti
-    knowledge_context = build_analiti_context(question, k=3)
-    user_lab_context = build_user_lab_context(lab_rows)
-
-    context_blocks = []
-    if knowledge_context:
-        context_blocks.append(
-            "Informacije iz baze znanja o analitima:\n" + knowledge_context
-        )
-    if user_lab_context:
-        context_blocks.append(
-            "Informacije iz korisnikovih nalaza (zadnje izmjerene vrijednosti):\n"
-            + user_lab_context
-        )
+        with span("context"):
+            pieces = lab.summary_pieces
+            if not pieces:
+                return NO_DATA_OVERALL_ANSWER, None, None
+            return (None, *_overall_request(question, "", pieces))
 
-    combined_context = "\n\n".join(context_blocks).strip()
+    with span("match"):
+        # pretraga analita jednom po pitanju (tačno poklapanje, pa hibridni fallback)
+        matched_docs = retrieve_analiti(question, k=3)
 
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        # 2) Ako izgleda da pita za analit koga uopšte nemamo u bazi – odmah safe odgovor
+        raw = _unknown_analit_answer(question, matched_docs)
+    if raw is not None:
+        return raw, None, None
 
-    if combined_context:
-        messages.append(
-            {
-                "role": "assistant",
-                "content": (
-                    "Ovo su podaci koje možeš koristiti samo kao pomoć, "
-                    "ali ih ne smiješ izmišljati niti dopunjavati:\n\n"
-                    + combined_context
-                ),
-            }
-        )
+    # 3) Obično pitanje – kontekst iz baze znanja + poslednje vrijednosti
+    with span("context"):
+        return (None, *_default_request(question, lab, matched_docs))
 
-    messages.append({"role": "user", "content": question})
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=messages,
-        temperature=0,
-    )
+async def _plan_answer_async(question: str, lab: LabContext) -> Plan:
+    """
+    _plan_answer za async putanju. Kada nema tačnog poklapanja analita,
+    hibridna pretraga može da čeka embedding poziv, pa se tada planiranje
+    izvršava u threadu da ne blokira event loop.
+    """
+    if HYBRID_RETRIEVAL and not _match_analiti_in_question(question):
+        return await asyncio.to_thread(_plan_answer, question, lab)
+    return _plan_answer(question, lab)
+
+
+# ---------------------------------------------------------
+#  GENERISANJE ODGOVORA (sync API za skripte, async za server)
+# ---------------------------------------------------------
+
+def _record_generation(report: PromptReport, usage) -> None:
+    """Veličina prompta i usage poziva modela – za /health (prompt_stats) i /metrics."""
+    prompt_stats.record(report, usage)
+    prompt_tokens.observe(report.prompt_tokens, intent=report.intent)
+    record_usage("generation", usage)
+
+
+def generate_overall_answer(question: str, lab_summary: str) -> str:
+    """
+    Poseban poziv modela za 'opšte stanje' / trend nalaza.
+    """
+    if not lab_summary:
+        return guarded_response(question, NO_DATA_OVERALL_ANSWER)
 
+    request, report = _overall_request(question, lab_summary)
+    with span("generation"):
+        response = call_sync(
+            "generation", lambda timeout: client.chat.completions.create(**request, timeout=timeout)
+        )
+    _record_generation(report, getattr(response, "usage", None))
     raw_answer = response.choices[0].message.content or ""
     return guarded_response(question, raw_answer)
+
+
+async def generate_overall_answer_async(question: str, lab_summary: str) -> str:
+    """
+    Async varijanta generate_overall_answer.
+    """
+    if not lab_summary:
+        return await guarded_response_async(question, NO_DATA_OVERALL_ANSWER)
+
+    request, report = _overall_request(question, lab_summary)
+    async with admit("generation"):
+        with span("generation"):
+            response = await call_async(
+                "generation", lambda timeout: async_client.chat.completions.create(**request, timeout=timeout)
+            )
+    _record_generation(report, getattr(response, "usage", None))
+    raw_answer = response.choices[0].message.content or ""
+    return await guarded_response_async(question, raw_answer)
+
+
+def generate_answer(question: str, lab_rows: LabRows = None) -> str:
+    """
+    Glavna funkcija za generisanje odgovora. `lab_rows` je lista redova ili
+    već pripremljen LabContext (npr. iz sesije).
+    """
+    lab = as_lab_context(lab_rows)
+    _refresh_knowledge_if_changed()
+
+    # keš prije planiranja: ključ ne zavisi od plana, a planiranje može da
+    # pozove embedding (hibridna pretraga) i broji tokene prompta
+    key = _answer_cache_key(question, lab) if answer_cache is not None else ""
+    if key:
+        with span("cache"):
+            cached = answer_cache.get(key)
+        if cached is not None:
+            return cached
+
+    raw_answer, request, report = _plan_answer(question, lab)
+    if request is None:
+        return guarded_response(question, raw_answer)
+
+    with span("generation"):
+        response = call_sync(
+            "generation", lambda timeout: client.chat.completions.create(**request, timeout=timeout)
+        )
+    _record_generation(report, getattr(response, "usage", None))
+    raw_answer = response.choices[0].message.content or ""
+    answer = guarded_response(question, raw_answer)
+
+    if key:
+        answer_cache.set(key, answer)
+    return answer
+
+
+async def generate_answer_async(question: str, lab_rows: LabRows = None) -> str:
+    """
+    Async varijanta generate_answer: isti tok, ali poziv modela i guard
+    ne blokiraju event loop, pa jedan worker opslužuje više chatova paralelno.
+    Istovremena ista pitanja nad istim nalazima čekaju jedan zajednički
+    poziv modela + guard (answer_flights), čak i kada je keš isključen.
+    """
+    lab = as_lab_context(lab_rows)
+    _refresh_knowledge_if_changed()
+
+    # keš prije planiranja (kao u generate_answer); planiranje je dio zajedničkog izračuna
+    key = _answer_cache_key(question, lab) if answer_cache is not None or ANSWER_SINGLE_FLIGHT else ""
+    if key and answer_cache is not None:
+        with span("cache"):
+            cached = await _cache_get_async(key)
+        if cached is not None:
+            return cached
+
+    async def compute() -> str:
+        raw_answer, request, report = await _plan_answer_async(question, lab)
+        if request is None:
+            return await guarded_response_async(question, raw_answer)
+
+        async with admit("generation"):
+            with span("generation"):
+                response = await call_async(
+                    "generation", lambda timeout: async_client.chat.completions.create(**request, timeout=timeout)
+                )
+        _record_generation(report, getattr(response, "usage", None))
+        raw_answer = response.choices[0].message.content or ""
+        answer = await guarded_response_async(question, raw_answer)
+
+        if key and answer_cache is not None:
+            await _cache_set_async(key, answer)
+        return answer
+
+    if ANSWER_SINGLE_FLIGHT:
+        return await answer_flights.run(key, compute)
+    return await compute()
+
+
+async def generate_answers_async(
+    questions: List[str], lab_rows: LabRows = None, concurrency: Optional[int] = None
+) -> List[Union[str, BaseException]]:
+    """
+    Više pitanja nad istim nalazima (npr. svaki označeni analit iz novog
+    izvještaja). Nalazi se pripreme jednom (LabContext), a pitanja idu kroz
+    generate_answer_async istovremeno, najviše `concurrency` odjednom.
+    Ista pitanja (poslije normalize_text) pitaju model samo jednom.
+
+    Vraća odgovore istim redoslijedom kao pitanja; na mjestu pitanja čiji
+    je poziv pukao je izuzetak (ostali odgovori se ne gube).
+    """
+    lab = as_lab_context(lab_rows).precompute()
+    semaphore = asyncio.Semaphore(max(1, concurrency or BATCH_CONCURRENCY))
+
+    async def answer(question: str) -> str:
+        async with semaphore:
+            return await generate_answer_async(question, lab)
+
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_text(question), question)
+    results = await asyncio.gather(*(answer(q) for q in unique.values()), return_exceptions=True)
+    by_key = dict(zip(unique, results))
+    return [by_key[normalize_text(question)] for question in questions]
+
+
+async def stream_answer_async(
+    question: str, lab_rows: LabRows = None
+) -> AsyncIterator[Dict]:
+    """
+    Streaming varijanta generate_answer_async za /chat/stream.
+
+    Tokeni iz modela prolaze kroz guardrails.guarded_stream, pa korisnik
+    dobija provjereni tekst rečenicu po rečenicu umjesto da čeka cijeli
+    odgovor i cijelu guard provjeru. Vraća iste događaje kao guarded_stream.
+    """
+    lab = as_lab_context(lab_rows)
+    _refresh_knowledge_if_changed()
+
+    key = _answer_cache_key(question, lab) if answer_cache is not None or ANSWER_SINGLE_FLIGHT else ""
+    if key and answer_cache is not None:
+        with span("cache"):
+            cached = await _cache_get_async(key)
+        if cached is not None:
+            yield {"event": "delta", "text": cached}
+            return
+
+    # isto pitanje je već kod modela (npr. preko /chat) – sačekaj taj odgovor;
+    # stream sam ne pokreće zajednički izračun jer prekinut stream nema rezultat
+    flight = answer_flights.pending(key) if ANSWER_SINGLE_FLIGHT else None
+    if flight is not None:
+        yield {"event": "delta", "text": await asyncio.shield(flight)}
+        return
+
+    raw_answer, request, report = await _plan_answer_async(question, lab)
+    if request is None:
+        yield {"event": "delta", "text": await guarded_response_async(question, raw_answer)}
+        return
+
+    usage = []
+
+    async def tokens() -> AsyncIterator[str]:
+        # mjesto (admission) se drži dok model šalje tokene, ne i dok klijent čita
+        async with admit("generation"):
+            started = time.perf_counter()
+            # retry samo do prvog odgovora servera; bez hedge-a (dva streama = dva različita teksta)
+            stream = await call_async(
+                "generation",
+                lambda timeout: async_client.chat.completions.create(
+                    **request, stream=True, stream_options={"include_usage": True}, timeout=timeout
+                ),
+                hedge=False,
+            )
+            first = True
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage.append(chunk.usage)  # poslednji chunk, bez choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        observe_stage("first_token", time.perf_counter() - started)
+                    yield chunk.choices[0].delta.content
+            # generisanje u streamingu se preklapa sa guard provjerama isječaka
+            observe_stage("generation", time.perf_counter() - started)
+
+    answer = ""
+    # aclosing: kad klijent ode usred streama, zatvaranje ovog generatora mora
+    # zatvoriti i guarded_stream (pa i tokens()), da se odmah oslobodi mjesto za model
+    async with aclosing(guarded_stream(question, tokens())) as events:
+        async for event in events:
+            if event["event"] == "replace":
+                answer = event["text"]
+            else:
+                answer += event["text"]
+            yield event
+
+    _record_generation(report, usage[-1] if usage else None)
+    if key and answer_cache is not None:
+        await _cache_set_async(key, answer)
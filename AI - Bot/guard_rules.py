@@ -0,0 +1,212 @@
+"""
+Lokalni (prvi) nivo guardrails provjere za LabGuardBot.
+
+Brza pravila u procesu odlučuju jasne slučajeve bez poziva LLM evaluatoru:
+- poznati, fiksni (canned) odgovori aplikacije -> SAFE
+- odgovori koji očigledno postavljaju dijagnozu, daju terapiju ili
+  obeshrabruju odlazak ljekaru (pravila iz GUARD_SYSTEM_PROMPT) -> UNSAFE
+Sve ostalo se eskalira na LLM guard (guardrails.guard_answer). Lokalno se
+nikad ne odlučuje SAFE na osnovu odsustva riječi – nebezbjedan odgovor može
+biti sročen bez ijednog "rizičnog" termina ("ne idi ljekaru, sve je u redu").
+Pravila su zato uska (visoka preciznost): sumnjiv, ali nejasan slučaj ide na LLM –
+i rečenica sa uslovom ili negacijom ("ako imaš anemiju, ljekar će ...",
+"ovo ne znači da imaš ...") koju GUARD_SYSTEM_PROMPT dozvoljava.
+"""
+
+import re
+import threading
+from typing import Dict, Optional
+
+from text_match import fold_diacritics
+
+# ---------------------------------------------------------
+#  NORMALIZACIJA
+# ---------------------------------------------------------
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _fold(text: str) -> str:
+    """lowercase + bez dijakritika (č/ć/š/ž -> c/c/s/z, đ -> dj) + sažeti razmaci."""
+    return _WS_RE.sub(" ", fold_diacritics(text)).strip()
+
+
+# ---------------------------------------------------------
+#  ALLOWLIST FIKSNIH ODGOVORA
+# ---------------------------------------------------------
+
+_CANNED_ANSWERS = set()
+
+
+def register_canned_answer(text: str) -> None:
+    """Dodaje fiksni odgovor aplikacije u allowlist (engine ih registruje pri importu)."""
+    if text:
+        _CANNED_ANSWERS.add(_fold(text))
+
+
+# ---------------------------------------------------------
+#  PRAVILA (sve nad _fold tekstom)
+# ---------------------------------------------------------
+
+# stanja/bolesti koja se smiju pominjati samo uopšteno, nikad kao dijagnoza korisniku
+_CONDITION_TERMS = (
+    r"anemij\w*|dijabet\w*|secern\w* bolest\w*|infekcij\w*|upal\w*|policitemij\w*"
+    r"|leukemij\w*|limfom\w*|karcinom\w*|rak\w*|tumor\w*|tromboz\w*|hipotireoz\w*"
+    r"|hipertireoz\w*|insuficijencij\w*|ciroz\w*|hepatitis\w*|bolest\w*|sindrom\w*"
+    r"|nedostat\w* gvozdj\w*|manjak gvozdj\w*"
+)
+_CONDITIONS = "(?:" + _CONDITION_TERMS + ")"
+
+# lijekovi, suplementi i doze – objekat terapijskog savjeta
+_DOSE = r"\d+(?:[.,]\d+)? ?(?:mg|mcg|µg|ug|ij|iu|ml)\b"
+_THERAPY_OBJECTS = (
+    r"(?:" + _DOSE + r"|(?:tablet|lijek|ljekov|suplement|vitamin|kapsul|preparat|sirup|antibiotik"
+    r"|terapij|injekcij|kapi\b|gvozdj|feru|folnu kiselin|folne kiselin|kalcij|magnezij|cink|omega|insulin"
+    r"|metformin|levotiroksin|statin|aspirin|brufen|ibuprofen|paracetamol)\w*)"
+)
+
+# riječi između glagola i objekta: ne prelaze u novu klauzu ("da ...") niti u
+# predloški izraz ("imaš pitanja o bolesti", "uzmi u obzir")
+_GAP = r"(?:(?!(?:da|o|u|za|na|od|oko|pitanj\w*|obzir) )\w+ )"
+
+# uslov, negacija ili upućivanje na ljekara u rečenici: "ako ti imaš anemiju",
+# "ovo ne znači da imaš ...", "samo ljekar može da smanji dozu" – takva rečenica
+# se lokalno ne proglašava UNSAFE, nego ide na LLM guard
+_HEDGE_RE = re.compile(
+    r"\b(?:ako|ukoliko|da li|ne znaci|ne mora(?: da)? znaci|ne mozemo|nije moguce|ne mozes"
+    r"|samo ljekar\w*|ljekar (?:ce|moze)|obrati se ljekar\w*|posavjetuj se)\b"
+)
+
+_SENTENCE_RE = re.compile(r"[^.!?;\n]+")
+
+# imperativ upućen korisniku: početak rečenice/klauze, ne "ljekar može da smanji"
+_IMPERATIVE_START = r"(?:^ ?|[,:] |\b(?:i|pa|zato|onda|odmah|sada|slobodno) )"
+
+# pravila: (razlog, obrazac, dodatni obrazac koji mora biti u istoj rečenici ili None)
+_UNSAFE_RULES = [
+    (
+        "direktna dijagnoza",
+        re.compile(r"\b(?:ti )?imas " + _GAP + r"{0,2}?" + _CONDITIONS),
+        None,
+    ),
+    (
+        "direktna dijagnoza",
+        re.compile(
+            r"\b(?:ovo|to|ovde|ovdje) je (?:sigurno|definitivno|bez sumnje|ocigledno"
+            r"|(?:vrlo )?vjerovatno) (?:\w+ ){0,2}?" + _CONDITIONS
+        ),
+        None,
+    ),
+    (
+        "jak utisak dijagnoze",
+        re.compile(r"\b(?:sigurno|definitivno|(?:vrlo )?vjerovatno) (?:znaci|ukazuje) da (?:ti )?imas\b"),
+        None,
+    ),
+    (
+        "pretpostavljen uzrok kod korisnika",
+        re.compile(r"\bkod tebe je (?:ovo|to)? ?(?:zbog|posljedica|uzrokovano)\b"),
+        None,
+    ),
+    (
+        "pretpostavljen uzrok kod korisnika",
+        re.compile(r"\buzrok (?:tvog|tvoje|tvojih|tvojeg) \w+ (?:je|su)\b"),
+        None,
+    ),
+    (
+        "terapijski savjet",
+        # glagol sam nije dovoljan ("uzmi u obzir", "popij dosta vode") – mora
+        # slijediti lijek, suplement ili doza
+        re.compile(
+            r"\b(?:uzmi|uzimaj|popij|pij|pocni da uzimas|pocni (?:sa|s)|nastavi da uzimas|treba da uzimas"
+            r"|trebalo bi da uzimas|preporucujem(?: ti)?(?: da uzimas)?)"
+            r" " + _GAP + r"{0,3}?" + _THERAPY_OBJECTS
+        ),
+        None,
+    ),
+    (
+        "terapijski savjet",
+        re.compile(_IMPERATIVE_START + r"(?:povecaj|smanji|prekini|promijeni) (?:\w+ )?(?:dozu|terapiju|lijek\w*)\b"),
+        None,
+    ),
+    (
+        "doza lijeka",
+        re.compile(r"\b\d+(?:[.,]\d+)? ?(?:tablet\w*|kapsul\w*)\b(?: \w+)? (?:dnevno|na dan|ujutru|uvece|puta)\b"),
+        None,
+    ),
+    (
+        "doza lijeka",
+        # "vrijednost od 5 mg dnevno" je podatak; doza je tek uz lijek ili uzimanje
+        re.compile(r"\b\d+(?:[.,]\d+)? ?(?:mg|mcg|µg|ug|ij|iu)\b(?: \w+)? (?:dnevno|na dan|ujutru|uvece|puta)\b"),
+        re.compile(r"\b(?:doz\w*|uzim\w*|uzmi|popij|pij|preporuc\w*|lijek\w*|tablet\w*|kapsul\w*|suplement\w*)\b"),
+    ),
+    (
+        "obeshrabrivanje odlaska ljekaru",
+        re.compile(
+            r"\b(?:nije potrebno|nema potrebe|ne moras|ne treba) (?:da )?(?:ides |ici |odlazis |odlaziti )?"
+            r"(?:kod |do )?(?:ljekar\w*|doktor\w*)"
+        ),
+        None,
+    ),
+    (
+        "obeshrabrivanje odlaska ljekaru",
+        re.compile(
+            r"\b(?:ne idi|ne odlazi|nemoj (?:da )?ici|nemoj (?:da )?ides) (?:kod |do )?(?:ljekar\w*|doktor\w*)"
+            r"|\bpreskoci (?:\w+ )?(?:kontrol\w*|pregled\w*|ljekar\w*)"
+        ),
+        None,
+    ),
+]
+
+# ---------------------------------------------------------
+#  KLASIFIKACIJA + STATISTIKA
+# ---------------------------------------------------------
+
+_stats_lock = threading.Lock()
+_stats = {
+    "total": 0,
+    "canned": 0,
+    "local_unsafe": 0,
+    "escalated": 0,
+}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats["total"] += 1
+        _stats[key] += 1
+
+
+def classify_locally(question: str, answer: str) -> Optional[Dict]:
+    """
+    Prvi nivo provjere. Vraća odluku u formatu guard_answer
+    ({"allowed": bool, "reason": str}) ili None kada odgovor treba eskalirati.
+    SAFE lokalno dobijaju samo fiksni odgovori aplikacije (allowlist).
+
+    Pravila se provjeravaju po rečenici; rečenica sa uslovom, negacijom ili
+    upućivanjem na ljekara (_HEDGE_RE) se preskače – takav odgovor ide na LLM.
+    """
+    folded = _fold(answer)
+
+    if folded in _CANNED_ANSWERS:
+        _count("canned")
+        return {"allowed": True, "reason": ""}
+
+    for sentence in _SENTENCE_RE.findall(folded):
+        if _HEDGE_RE.search(sentence):
+            continue  # uslov / negacija / ljekar – odlučuje LLM guard
+        for reason, pattern, context in _UNSAFE_RULES:
+            if pattern.search(sentence) and (context is None or context.search(sentence)):
+                _count("local_unsafe")
+                return {"allowed": False, "reason": reason}
+
+    _count("escalated")
+    return None
+
+
+def local_guard_stats() -> Dict:
+    """Brojači prvog nivoa i udio odgovora eskaliranih na LLM guard."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["total"]
+    stats["escalation_rate"] = round(stats["escalated"] / total, 4) if total else 0.0
+    return stats
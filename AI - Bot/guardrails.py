@@ -3,27 +3,57 @@ Guardrails modul za LabGuardBot.
 Procjenjuje da li je odgovor bezbjedan za prikaz u aplikaciji.
 """
 
+import asyncio
+import atexit
 import os
-from openai import OpenAI
+import re
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
 from dotenv import load_dotenv
 
+from cache import LRUCache, fingerprint
+from guard_rules import classify_locally, register_canned_answer
+from metrics import record_usage, span
+from upstream import admit, async_client, call_async, call_sync, client
+
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Streaming: koliko neprovjerenog teksta (u znakovima) skupimo prije nego
+# što pošaljemo sledeći, rastući isječak na provjeru.
+STREAM_GUARD_MIN_CHARS = int(os.getenv("STREAM_GUARD_MIN_CHARS", "80"))
 
+# Lokalni prvi nivo (guard_rules) – jasne slučajeve odlučuje bez LLM poziva
+GUARD_LOCAL_TIER = os.getenv("GUARD_LOCAL_TIER", "1") != "0"
 
-def guard_answer(question: str, answer: str) -> dict:
-    """
-    Evaluira odgovor modela i vraća odluku da li je siguran za prikaz.
+# Keš guard odluka po (pitanje, odgovor) – sa temperature=0 ista pitanja daju
+# iste odgovore, pa nema potrebe da ih evaluator ocjenjuje iznova.
+GUARD_CACHE_SIZE = int(os.getenv("GUARD_CACHE_SIZE", "4096"))
+GUARD_CACHE_TTL = float(os.getenv("GUARD_CACHE_TTL", str(7 * 24 * 3600)))
+GUARD_CACHE_FILE = os.getenv("GUARD_CACHE_FILE", "")  # prazno = bez čuvanja na disk
+_GUARD_CACHE_SAVE_EVERY = 50
 
-    Returns:
-        {
-          "allowed": bool,
-          "reason": str
-        }
-    """
+verdict_cache = LRUCache(maxsize=GUARD_CACHE_SIZE, ttl=GUARD_CACHE_TTL or None)
+_unsaved_verdicts = 0
+_save_lock = threading.Lock()  # isti .tmp fajl – jedno snimanje u isto vrijeme
+_save_task: Optional[asyncio.Task] = None
+
+
+def _save_verdicts() -> None:
+    with _save_lock:
+        verdict_cache.save(Path(GUARD_CACHE_FILE))
+
+
+if GUARD_CACHE_FILE:
+    verdict_cache.load(Path(GUARD_CACHE_FILE))
+    atexit.register(_save_verdicts)
 
-    system_prompt = """
+# kraj rečenice: . ! ? … (ili novi red) praćeno razmakom
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
+
+GUARD_SYSTEM_PROMPT = """
 Ti si evaluator sigurnosti za LabGuard – digitalnog asistenta koji daje
 edukativna objašnjenja laboratorijskih nalaza.
 
@@ -64,15 +94,29 @@ FORMAT ODGOVORA:
 - Ako NIJE u redu, odgovori: UNSAFE: <kratko objašnjenje>
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
+# skraćena, korisniku prijatnija poruka koja zamjenjuje odbijen odgovor
+SAFE_FALLBACK_MESSAGE = (
+    "Izvinjavam se, ali ovakav odgovor ne zadovoljava sigurnosne kriterijume za medicinski sadržaj "
+    "u LabGuard aplikaciji. Ovaj alat je zamišljen samo kao edukativna podrška. "
+    "Za detaljno tumačenje nalaza ili bilo kakvu odluku o terapiji obavezno se obrati svom ljekaru."
+)
+register_canned_answer(SAFE_FALLBACK_MESSAGE)
+
+
+def _guard_request(question: str, answer: str) -> dict:
+    """Parametri poziva evaluatora – isti za sync i async klijenta."""
+    return {
+        "model": "gpt-4.1-mini",
+        "messages": [
+            {"role": "system", "content": GUARD_SYSTEM_PROMPT},
             {"role": "user", "content": f"PITANJE: {question}\nODGOVOR: {answer}"},
         ],
-        temperature=0,
-    )
+        "temperature": 0,
+    }
+
 
+def _parse_evaluation(response) -> dict:
+    """Pretvara SAFE/UNSAFE odgovor evaluatora u odluku."""
     evaluation = (response.choices[0].message.content or "").strip()
 
     # Malo tolerantnija logika:
@@ -89,6 +133,98 @@ FORMAT ODGOVORA:
     return {"allowed": True, "reason": ""}
 
 
+def _precheck(question: str, answer: str) -> Tuple[Optional[dict], str]:
+    """
+    Odluka bez LLM poziva (lokalni nivo, pa keš) ako postoji, plus ključ za keš.
+    """
+    if GUARD_LOCAL_TIER:
+        local = classify_locally(question, answer)
+        if local is not None:
+            return local, ""
+
+    key = fingerprint(question, answer)
+    return verdict_cache.get(key), key
+
+
+def _remember(key: str, verdict: dict) -> bool:
+    """Upisuje odluku evaluatora u keš; True kada je vrijeme da se keš snimi na disk."""
+    global _unsaved_verdicts
+    verdict_cache.set(key, verdict)
+    if not GUARD_CACHE_FILE:
+        return False
+    _unsaved_verdicts += 1
+    return _unsaved_verdicts >= _GUARD_CACHE_SAVE_EVERY
+
+
+def _save_now() -> None:
+    """Snimanje keša iz sync putanje (skripte) – u istom threadu."""
+    global _unsaved_verdicts
+    _unsaved_verdicts = 0
+    _save_verdicts()
+
+
+def _save_in_background() -> None:
+    """
+    Snimanje keša iz async putanje: u threadu (asyncio.to_thread), kao
+    pozadinski task – odgovor ne čeka disk. Dok jedno snimanje traje, novo
+    se ne pokreće; brojač ostaje pun pa ga sledeća odluka pokreće ponovo.
+    """
+    global _save_task, _unsaved_verdicts
+    if _save_task is not None and not _save_task.done():
+        return
+    _unsaved_verdicts = 0
+    _save_task = asyncio.get_running_loop().create_task(asyncio.to_thread(_save_verdicts))
+    # greška upisa (npr. pun disk) ne ruši zahtjev; atexit snimanje pokušava ponovo
+    _save_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+
+def guard_answer(question: str, answer: str) -> dict:
+    """
+    Evaluira odgovor modela i vraća odluku da li je siguran za prikaz.
+
+    Returns:
+        {
+          "allowed": bool,
+          "reason": str
+        }
+    """
+    with span("guard"):
+        verdict, key = _precheck(question, answer)
+        if verdict is not None:
+            return verdict
+
+        with span("guard_upstream"):
+            request = _guard_request(question, answer)
+            response = call_sync("guard", lambda timeout: client.chat.completions.create(**request, timeout=timeout))
+        record_usage("guard", getattr(response, "usage", None))
+        verdict = _parse_evaluation(response)
+        if _remember(key, verdict):
+            _save_now()
+        return verdict
+
+
+async def guard_answer_async(question: str, answer: str) -> dict:
+    """
+    Async varijanta guard_answer – ne blokira event loop dok čeka evaluator.
+    """
+    with span("guard"):
+        verdict, key = _precheck(question, answer)
+        if verdict is not None:
+            return verdict
+
+        async with admit("guard"):
+            with span("guard_upstream"):
+                request = _guard_request(question, answer)
+                response = await call_async(
+                    "guard", lambda timeout: async_client.chat.completions.create(**request, timeout=timeout)
+                )
+        record_usage("guard", getattr(response, "usage", None))
+        verdict = _parse_evaluation(response)
+        if _remember(key, verdict):
+            _save_in_background()
+        return verdict
+
+
 def guarded_response(question: str, answer: str) -> str:
     """
     Ako je odgovor siguran -> vraća se original.
@@ -99,9 +235,120 @@ def guarded_response(question: str, answer: str) -> str:
     if result["allowed"]:
         return answer
 
-    # skraćena, korisniku prijatnija poruka
-    return (
-        "Izvinjavam se, ali ovakav odgovor ne zadovoljava sigurnosne kriterijume za medicinski sadržaj "
-        "u LabGuard aplikaciji. Ovaj alat je zamišljen samo kao edukativna podrška. "
-        "Za detaljno tumačenje nalaza ili bilo kakvu odluku o terapiji obavezno se obrati svom ljekaru."
-    )
+    return SAFE_FALLBACK_MESSAGE
+
+
+async def guarded_response_async(question: str, answer: str) -> str:
+    """
+    Async varijanta guarded_response (koristi je /chat endpoint).
+    """
+    result = await guard_answer_async(question, answer)
+
+    if result["allowed"]:
+        return answer
+
+    return SAFE_FALLBACK_MESSAGE
+
+
+def _last_sentence_boundary(text: str, start: int) -> int:
+    """Indeks iza poslednjeg završenog reda/rečenice u text[start:] (ili -1)."""
+    boundary = -1
+    for m in _SENTENCE_END_RE.finditer(text, start):
+        boundary = m.end()
+    return boundary
+
+
+def _replace_event(result: dict) -> Dict:
+    return {"event": "replace", "text": SAFE_FALLBACK_MESSAGE, "reason": result["reason"]}
+
+
+async def guarded_stream(
+    question: str,
+    tokens: AsyncIterator[str],
+    min_chars: int = STREAM_GUARD_MIN_CHARS,
+) -> AsyncIterator[Dict]:
+    """
+    Inkrementalni guard za streaming odgovore.
+
+    Tokeni se skupljaju u bafer; čim se nakupi bar `min_chars` neprovjerenog
+    teksta koji se završava rečenicom, cijeli dosadašnji prefiks ide na
+    guard_answer_async (u pozadini, dok tokeni i dalje stižu). Korisniku se
+    šalje samo tekst koji je prošao provjeru, pa je zadržan samo mali,
+    neprovjereni prozor.
+
+    Događaji:
+      {"event": "delta", "text": str}                  – novi provjereni tekst
+      {"event": "replace", "text": str, "reason": str} – odgovor je odbijen;
+          klijent prikazani tekst zamjenjuje bezbjednom porukom i stream se prekida
+    """
+    buffer = ""
+    verified_upto = 0
+    guard_task = None
+    guard_upto = 0
+    token_task = None
+    iterator = tokens.__aiter__()
+
+    def start_guard(upto: int):
+        nonlocal guard_task, guard_upto
+        guard_upto = upto
+        guard_task = asyncio.ensure_future(guard_answer_async(question, buffer[:upto]))
+
+    try:
+        while True:
+            if token_task is None:
+                token_task = asyncio.ensure_future(iterator.__anext__())
+
+            waiting = {token_task}
+            if guard_task is not None:
+                waiting.add(guard_task)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if guard_task is not None and guard_task in done:
+                result = guard_task.result()
+                guard_task = None
+                if not result["allowed"]:
+                    yield _replace_event(result)
+                    return
+                if guard_upto > verified_upto:
+                    yield {"event": "delta", "text": buffer[verified_upto:guard_upto]}
+                    verified_upto = guard_upto
+
+            if token_task in done:
+                try:
+                    buffer += token_task.result() or ""
+                except StopAsyncIteration:
+                    token_task = None
+                    break
+                token_task = None
+
+            if guard_task is None:
+                boundary = _last_sentence_boundary(buffer, verified_upto)
+                if boundary - verified_upto >= min_chars:
+                    start_guard(boundary)
+
+        # generisanje je završeno – sačekaj provjeru u toku, pa provjeri ostatak
+        if guard_task is not None:
+            result = await guard_task
+            guard_task = None
+            if not result["allowed"]:
+                yield _replace_event(result)
+                return
+            if guard_upto > verified_upto:
+                yield {"event": "delta", "text": buffer[verified_upto:guard_upto]}
+                verified_upto = guard_upto
+
+        if verified_upto < len(buffer):
+            result = await guard_answer_async(question, buffer)
+            if not result["allowed"]:
+                yield _replace_event(result)
+                return
+            yield {"event": "delta", "text": buffer[verified_upto:]}
+    finally:
+        for task in (token_task, guard_task):
+            if task is not None and not task.done():
+                task.cancel()
+        # prekinut stream (odbijen odgovor): zatvori izvor tokena, da odmah oslobodi poziv modela
+        if token_task is None or token_task.done():
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
@@ -0,0 +1,124 @@
+"""
+Benchmark FAISS index modova (flat / hnsw / ivfpq / sq8 / ivfsq8):
+recall@k u odnosu na tačan flat index, latencija upita i veličina indexa.
+
+Primjeri:
+    python benchmark_index.py                      # vektori iz data/embedding_store
+    EMBEDDING_PROVIDER=local python benchmark_index.py  # lokalni embedding dokumenata, bez mreže
+    python benchmark_index.py --synthetic 200000   # sintetički klasterisani vektori
+    python benchmark_index.py --synthetic 50000 --dim 768 --modes flat,hnsw,ivfpq
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))  # upstream.py, metrics.py
+
+import local_storage_vector as lsv
+
+
+def _stored_vectors() -> np.ndarray:
+    store = lsv._embedding_store
+    dim = lsv.embedding_provider.dim
+    if store is None:
+        # provider bez keša (local) – embeduj dokumente iz baze znanja
+        texts = [lsv._doc_to_text(doc) for doc in lsv.load_documents()]
+        vectors, _ = lsv.embed_texts(texts)
+        if not vectors:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.stack([vectors[i] for i in sorted(vectors)]).astype(np.float32)
+    if not len(store):
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.array(store._ensure_matrix(), dtype=np.float32)
+
+
+def _synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Klasterisani vektori – realističniji od uniformnog šuma za ANN."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, n // 500)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors
+
+
+def _queries(vectors: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    """Upiti = blago pomjereni postojeći vektori (kao parafraza pitanja)."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=n_queries)
+    noise = 0.1 * rng.standard_normal((n_queries, vectors.shape[1]), dtype=np.float32)
+    queries = vectors[picks] + noise
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def _run(index, queries: np.ndarray, k: int):
+    latencies = []
+    results = []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - t0)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies) * 1000.0
+
+
+def _recall(approx: np.ndarray, exact: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx, exact))
+    return hits / (len(exact) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="broj sintetičkih vektora (0 = embedding store)")
+    parser.add_argument("--dim", type=int, default=lsv.embedding_provider.dim)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--modes", default=",".join(lsv.INDEX_MODES))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = _synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = _stored_vectors()
+    if not len(vectors):
+        print("No vectors – build the index first or pass --synthetic N.")
+        return
+
+    faiss.normalize_L2(vectors)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = _queries(vectors, args.queries)
+    k = min(args.k, len(vectors))
+    print(f"[{lsv.embedding_provider.name}] {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+
+    baseline = None
+    print(f"{'mode':8} {'build s':>8} {'MB':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in ["flat"] + [m for m in args.modes.split(",") if m and m != "flat"]:
+        t0 = time.perf_counter()
+        try:
+            index = lsv.make_index(mode, vectors.shape[1], len(vectors))
+            lsv.train_index(index, vectors)
+            index.add_with_ids(vectors, ids)
+        except ValueError as e:
+            print(f"{mode:8} skipped: {e}")
+            continue
+        build_s = time.perf_counter() - t0
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        found, latencies = _run(index, queries, k)
+        if baseline is None:
+            baseline = found
+        recall = _recall(found, baseline, k)
+        print(
+            f"{lsv.index_mode(index):8} {build_s:8.2f} {size_mb:8.1f} {recall:9.3f} "
+            f"{np.percentile(latencies, 50):8.3f} {np.percentile(latencies, 95):8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
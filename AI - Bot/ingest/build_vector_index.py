@@ -1,11 +1,12 @@
 """
 Generisanje vektorskih embeddinga za sve LabGuard analite
-koristeći OpenAI API + FAISS za brzu semantičku pretragu.
+koristeći embedding provider (OpenAI ili lokalni, EMBEDDING_PROVIDER) + FAISS za brzu semantičku pretragu.
 """
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent))  # upstream.py, metrics.py, text_match.py
 
 from local_storage_vector import build_vector_index
 
@@ -16,15 +17,21 @@ if __name__ == "__main__":
     print()
     print("This will:")
     print("  1. Load all documents from data/knowledge_analiti.json")
-    print("  2. Generate OpenAI embeddings for each analit")
+    print("     (only new/changed documents are re-embedded; pass --full to rebuild)")
+    print("  2. Generate embeddings in concurrent batches (resumes from cache)")
     print("  3. Build FAISS index for fast semantic search over analiti")
     print()
 
-    build_vector_index()
+    # --full: kompletna regeneracija; podrazumijevano samo izmijenjeni dokumenti
+    report = build_vector_index(incremental="--full" not in sys.argv[1:])
 
     print()
     print("=" * 70)
-    print("✓ Vector index built successfully!")
+    if report["failed"]:
+        print(f"! Vector index built with {len(report['failed'])} failed documents "
+              "(re-run to retry them)")
+    else:
+        print("✓ Vector index built successfully!")
     print("=" * 70)
     print()
     print("You can now use semantic search in your LabGuard chatbot!")
@@ -1,93 +1,302 @@
 """
-Vector-based storage za LabGuard analite koristeći FAISS + OpenAI embeddings.
+Vector-based storage za LabGuard analite koristeći FAISS + embeddings
+(OpenAI ili lokalni provider, vidi EMBEDDING_PROVIDER).
 """
 import json
 import os
 import pickle
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, List, Dict, NamedTuple, Optional, Tuple
 import faiss
 import numpy as np
-from openai import OpenAI
 from dotenv import load_dotenv
 import hashlib
 
+try:
+    from ingest.vector_store import MmapVectorStore
+except ImportError:  # pokrenuto iz ingest/ (build_vector_index.py)
+    from vector_store import MmapVectorStore
+
+from text_match import fold_diacritics
+from upstream import call_sync, client
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 
+# Embedding provider: openai (text-embedding-3-large) | local (hashirani n-grami, bez mreže)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").strip().lower()
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
+
+
+def _provider_path(path: Path) -> Path:
+    """Fajlovi podrazumijevanog (openai) providera zadržavaju stara imena, ostali dobijaju sufiks."""
+    if EMBEDDING_PROVIDER == "openai":
+        return path
+    return path.with_name(f"{path.stem}.{EMBEDDING_PROVIDER}{path.suffix}")
+
+
 # Storage files
 STORAGE_FILE = DATA_DIR / "knowledge_analiti.json"
-VECTOR_INDEX_FILE = DATA_DIR / "vector_index.faiss"
-DOCS_METADATA_FILE = DATA_DIR / "docs_metadata.pkl"
-EMBEDDING_CACHE_FILE = DATA_DIR / "embedding_cache.pkl"
-
-# OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+VECTOR_INDEX_FILE = _provider_path(DATA_DIR / "vector_index.faiss")
+DOCS_METADATA_FILE = _provider_path(DATA_DIR / "docs_metadata.pkl")
+EMBEDDING_CACHE_FILE = DATA_DIR / "embedding_cache.pkl"  # stari format, samo za migraciju
+EMBEDDING_STORE_DIR = _provider_path(DATA_DIR / "embedding_store")
 
 # Embedding model
 EMBEDDING_MODEL = "text-embedding-3-large"
 EMBEDDING_DIM = 3072
 
-# Global embedding cache (in-memory)
-_embedding_cache = {}
+# Tip FAISS indexa: flat (tačno, brute-force) | hnsw | ivfpq | sq8 | ivfsq8
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "flat")
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = automatski (~4*sqrt(n))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "96"))  # broj pod-kvantizatora; dim mora biti djeljiv sa PQ_M
 
+# Batch embedding pri izgradnji indexa
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
 
-def load_embedding_cache():
-    """Učitaj embedding cache ako postoji."""
-    global _embedding_cache
-    if EMBEDDING_CACHE_FILE.exists():
-        try:
-            with open(EMBEDDING_CACHE_FILE, 'rb') as f:
-                _embedding_cache = pickle.load(f)
-                print(f"Loaded {len(_embedding_cache)} cached embeddings")
-        except Exception:
-            _embedding_cache = {}
+# float32 (tačno) ili float16 (upola manje, dovoljno za cosine pretragu)
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interfejs izvora embeddinga. Index kod zna samo za `dim`, pa se
+    provider može zamijeniti bez izmjena u izgradnji i pretrazi.
+
+    - name:   ime providera (dio imena fajlova indexa i keša)
+    - dim:    dimenzija vektora
+    - cached: da li se vektori čuvaju u embedding store-u (skupi/mrežni
+              provideri da, lokalni ne – brže ih je izračunati nego pročitati)
+    """
+
+    name = ""
+    dim = 0
+    cached = True
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        """Embedding za listu tekstova, istim redosljedom. Greška se baca."""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+    cached = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        response = call_sync(
+            "embedding", lambda timeout: client.embeddings.create(model=self.model, input=texts, timeout=timeout)
+        )
+        data = sorted(response.data, key=lambda d: d.index)
+        return [np.array(d.embedding, dtype=np.float32) for d in data]
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Lokalni CPU embedding bez mreže: riječi i znakovni n-grami (3–5) teksta
+    bez dijakritika, hashirani (feature hashing sa znakom) u `dim` kanti,
+    sa log(1 + tf) težinom i L2 normalizacijom.
+
+    Hvata leksičku i morfološku sličnost ("hemoglobina" ~ "hemoglobin"),
+    ne i pravu semantiku – dovoljno za CI, offline rad i brz fallback.
+    Rezultat je deterministički (crc32, ne Python hash()).
+    """
+
+    name = "local"
+    cached = False
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> Counter:
+        features: Counter = Counter()
+        lo, hi = self.ngram_range
+        for word in _WORD_RE.findall(fold_diacritics(text)):
+            features["w:" + word] += 1
+            padded = f" {word} "
+            for n in range(lo, hi + 1):
+                for i in range(len(padded) - n + 1):
+                    features[padded[i:i + n]] += 1
+        return features
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, tf in self._features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vec[h % self.dim] += sign * (1.0 + np.log(tf))
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    def embed(self, texts: List[str]) -> List[np.ndarray]:
+        return [self.embed_one(text) for text in texts]
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "local": HashingEmbeddingProvider,
+}
+
+
+def make_embedding_provider(name: str) -> EmbeddingProvider:
+    """Provider po imenu (EMBEDDING_PROVIDER)."""
+    name = (name or "openai").strip().lower()
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(
+            f"Nepoznat EMBEDDING_PROVIDER: {name} (dozvoljeno: {', '.join(EMBEDDING_PROVIDERS)})"
+        )
+    return EMBEDDING_PROVIDERS[name]()
 
 
-def save_embedding_cache():
-    """Sačuvaj embedding cache."""
-    global _embedding_cache
-    if _embedding_cache:
-        EMBEDDING_CACHE_FILE.parent.mkdir(exist_ok=True)
-        with open(EMBEDDING_CACHE_FILE, 'wb') as f:
-            pickle.dump(_embedding_cache, f)
+embedding_provider = make_embedding_provider(EMBEDDING_PROVIDER)
 
+# Embedding cache: memory-mapped store na disku (otvaranje ne zavisi od veličine),
+# poseban direktorijum po provideru; lokalni provider keš ne koristi
+_embedding_store = (
+    MmapVectorStore(EMBEDDING_STORE_DIR, embedding_provider.dim, dtype=EMBEDDING_STORE_DTYPE)
+    if embedding_provider.cached else None
+)
 
-# Load cache on import
-load_embedding_cache()
+
+def migrate_pickle_cache() -> int:
+    """
+    Jednokratno prebacuje stari embedding_cache.pkl u memory-mapped store
+    (samo ako je store prazan). Vraća broj prebačenih embeddinga.
+    """
+    if embedding_provider.name != "openai" or _embedding_store is None:
+        return 0  # stari keš je pravljen isključivo OpenAI embeddingom
+    if len(_embedding_store) or not EMBEDDING_CACHE_FILE.exists():
+        return 0
+    try:
+        with open(EMBEDDING_CACHE_FILE, 'rb') as f:
+            old_cache = pickle.load(f)
+    except Exception:
+        return 0
+    migrated = _embedding_store.put_many(
+        {k: v for k, v in old_cache.items() if np.asarray(v).size == embedding_provider.dim}
+    )
+    print(f"Migrated {migrated} cached embeddings to {EMBEDDING_STORE_DIR}")
+    return migrated
+
+
+migrate_pickle_cache()
 
 
 def get_embedding(text: str) -> np.ndarray:
-    """Generiše embedding za tekst koristeći OpenAI sa CACHING."""
-    global _embedding_cache
+    """Generiše embedding za tekst preko aktivnog providera, sa CACHING-om (ako ga provider koristi)."""
+    if _embedding_store is None:
+        return embedding_provider.embed([text])[0]
 
     # Check cache first
     cache_key = hashlib.sha256(text.encode('utf-8')).hexdigest()
 
-    if cache_key in _embedding_cache:
-        return _embedding_cache[cache_key]
+    try:
+        cached = _embedding_store.get(cache_key)
+    except Exception as e:  # oštećen / nedostupan keš – računa se ispočetka
+        print(f"Error reading embedding cache: {e}")
+        cached = None
+    if cached is not None:
+        return cached
 
     # Generate embedding
     try:
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text
-        )
-        embedding = np.array(response.data[0].embedding, dtype=np.float32)
-
-        # Cache it
-        _embedding_cache[cache_key] = embedding
+        embedding = embedding_provider.embed([text])[0]
 
-        # Save cache every 10 new entries
-        if len(_embedding_cache) % 10 == 0:
-            save_embedding_cache()
+        # Cache it (append jednog reda, bez prepisivanja cijelog keša)
+        _embedding_store.put(cache_key, embedding)
 
         return embedding
     except Exception as e:
         print(f"Error generating embedding: {e}")
-        return np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        return np.zeros(embedding_provider.dim, dtype=np.float32)
+
+
+def embed_texts(
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+) -> Tuple[Dict[int, np.ndarray], Dict[int, str]]:
+    """
+    Embedding za mnogo tekstova odjednom: u batch-evima, kroz ograničen
+    pool paralelnih zahtjeva. Prolazne greške (timeout, 429, 5xx) ponavlja
+    sam provider (OpenAI kroz upstream.call_sync, UPSTREAM_MAX_RETRIES);
+    batch koji i poslije toga ne uspije ide u "greške".
+
+    Već keširani tekstovi se preskaču, a keš se dopisuje poslije svakog
+    završenog batch-a – prekinuta izgradnja se nastavlja tamo gdje je stala.
+
+    Vraća (indeks teksta -> embedding, indeks teksta -> greška).
+    """
+    embeddings: Dict[int, np.ndarray] = {}
+    failed: Dict[int, str] = {}
+
+    # 1) iz keša (checkpoint prethodnih pokretanja)
+    missing: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        cache_key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        cached = _embedding_store.get(cache_key) if _embedding_store is not None else None
+        if cached is not None:
+            embeddings[i] = cached
+        else:
+            missing.setdefault(cache_key, []).append(i)
+
+    if not missing:
+        return embeddings, failed
+
+    # 2) ostatak u batch-evima (isti tekst samo jednom)
+    keys = list(missing)
+    batches = [keys[j:j + batch_size] for j in range(0, len(keys), batch_size)]
+    print(f"  {len(embeddings)} cached, embedding {len(keys)} texts in {len(batches)} batches...")
+
+    done_batches = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(embedding_provider.embed, [texts[missing[k][0]] for k in batch]): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                vectors = future.result()
+            except Exception as e:
+                for k in batch:
+                    for i in missing[k]:
+                        failed[i] = str(e)
+                continue
+
+            # checkpoint: append + atomski commit u store
+            if _embedding_store is not None:
+                _embedding_store.put_many(dict(zip(batch, vectors)))
+            for k, vec in zip(batch, vectors):
+                for i in missing[k]:
+                    embeddings[i] = vec
+
+            done_batches += 1
+            print(f"  Embedded batch {done_batches}/{len(batches)}")
+
+    return embeddings, failed
 
 
 def load_documents() -> List[Dict]:
@@ -164,105 +373,427 @@ def _doc_to_display(doc: Dict) -> Dict:
     return doc
 
 
-def build_vector_index():
+INDEX_MODES = ("flat", "hnsw", "ivfpq", "sq8", "ivfsq8")
+
+
+def _ivf_nlist(n_vectors: int) -> int:
+    if IVF_NLIST:
+        return IVF_NLIST
+    return max(1, min(int(4 * np.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+
+
+def _pq_m(dim: int) -> int:
+    """PQ_M ako dijeli dim, inače najveći manji djelilac (dim zavisi od providera)."""
+    for m in range(min(PQ_M, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+# minimum za treniranje: 2 IVF liste po ~39 vektora, PQ kodna knjiga od 256 centroida
+_MIN_TRAIN_VECTORS = {"ivfpq": 256, "ivfsq8": 78}
+
+
+def effective_index_mode(mode: str, n_vectors: int) -> str:
+    """Mode koji make_index stvarno pravi za n_vectors (IVF bez dovoljno vektora -> flat)."""
+    mode = (mode or "flat").lower()
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Nepoznat VECTOR_INDEX_MODE: {mode} (dozvoljeno: {', '.join(INDEX_MODES)})")
+    if n_vectors < _MIN_TRAIN_VECTORS.get(mode, 0):
+        return "flat"
+    return mode
+
+
+def make_index(mode: str, dim: int, n_vectors: int):
+    """
+    Fabrika FAISS indexa (uvijek inner product nad L2-normalizovanim
+    vektorima == cosine), umotanog u IndexIDMap radi stabilnih ID-jeva.
+
+    - flat:   IndexFlatIP – tačna pretraga, 4*dim bajtova po vektoru
+    - hnsw:   HNSW graf – brza približna pretraga, bez brisanja vektora
+    - ivfpq:  IVF + product quantization – ~PQ_M bajtova po vektoru
+              (PQ_M se spušta na djelilac dim-a ako ga ne dijeli)
+    - sq8:    skalarna kvantizacija (1 bajt po dimenziji), brute-force
+    - ivfsq8: IVF + skalarna kvantizacija
+
+    IVF varijante traže treniranje (train_index) i dovoljno vektora
+    (~39 po listi, 256 za PQ); kada ih nema, pada se na flat.
+    """
+    requested = (mode or "flat").lower()
+    mode = effective_index_mode(requested, n_vectors)
+    if mode != requested:
+        print(f"Too few vectors ({n_vectors}) to train {requested} – using flat index.")
+
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if mode == "flat":
+        base = faiss.IndexFlatIP(dim)
+    elif mode == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif mode == "sq8":
+        base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    elif mode == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dim)
+        base = faiss.IndexIVFPQ(quantizer, dim, _ivf_nlist(n_vectors), _pq_m(dim), 8, metric)
+    else:  # ivfsq8
+        quantizer = faiss.IndexFlatIP(dim)
+        base = faiss.IndexIVFScalarQuantizer(
+            quantizer, dim, _ivf_nlist(n_vectors), faiss.ScalarQuantizer.QT_8bit, metric
+        )
+
+    configure_search(base)
+    return faiss.IndexIDMap(base)
+
+
+def index_mode(index) -> str:
+    """Koji je mode (iz make_index) dati index – za poređenje sa effective_index_mode."""
+    base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(base, faiss.IndexIVFScalarQuantizer):
+        return "ivfsq8"
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        return "sq8"
+    return "flat"
+
+
+def configure_search(index) -> None:
+    """Parametri pretrage (efSearch / nprobe) – ne čuvaju se svi u fajlu."""
+    base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = IVF_NPROBE
+
+
+def train_index(index, vectors: np.ndarray) -> None:
+    """Trenira index (IVF/PQ/SQ) ako je potrebno; flat i HNSW ne traže treniranje."""
+    if not index.is_trained:
+        index.train(vectors)
+
+
+def _supports_removal(index) -> bool:
+    return index_mode(index) != "hnsw"
+
+
+def _doc_key(doc: Dict, i: int) -> str:
+    """Stabilan ključ dokumenta između izgradnji: 'id' iz JSON-a, inače pozicija."""
+    return str(doc.get("id") or f"doc:{i}")
+
+
+def _vector_id(doc_key: str) -> int:
+    """Stabilan int64 ID vektora (za IndexIDMap) izveden iz ključa dokumenta."""
+    digest = hashlib.sha256(doc_key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & 0x7FFFFFFFFFFFFFFF
+
+
+def _doc_metadata(doc: Dict, i: int, doc_key: str, content_hash: str) -> Dict:
+    return {
+        'doc_id': i,
+        'doc_key': doc_key,
+        'vector_id': _vector_id(doc_key),
+        'content_hash': content_hash,
+        'title': doc.get('name', '') or doc.get('title', ''),
+        'url': doc.get('source', ''),
+        'type': doc.get('type', 'analit_info'),
+        'category': doc.get('category', '')
+    }
+
+
+def _fsync(path: Path) -> None:
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def _write_atomic(index, metadata: List[Dict]) -> None:
+    """
+    Upis indexa i metadata preko tmp fajlova + os.replace, index prvi.
+
+    Metadata je tačka commit-a (kao meta.json u vector_store.py): ako proces
+    padne između dva os.replace, ostaje novi index sa starim metadata.
+    Vektori kojih nema u metadata se u pretrazi preskaču, a sledeća
+    inkrementalna izgradnja ih uklanja (_orphan_ids). Obrnuti redosljed bi
+    ostavio metadata koja tvrdi da su vektori u indexu kad nisu.
+    """
+    VECTOR_INDEX_FILE.parent.mkdir(exist_ok=True)
+    tmp_index = VECTOR_INDEX_FILE.with_suffix(VECTOR_INDEX_FILE.suffix + ".tmp")
+    tmp_meta = DOCS_METADATA_FILE.with_suffix(DOCS_METADATA_FILE.suffix + ".tmp")
+
+    faiss.write_index(index, str(tmp_index))
+    _fsync(tmp_index)
+    os.replace(tmp_index, VECTOR_INDEX_FILE)
+
+    with open(tmp_meta, 'wb') as f:
+        pickle.dump(metadata, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_meta, DOCS_METADATA_FILE)
+
+
+def _orphan_ids(index, metadata: List[Dict]) -> List[int]:
+    """ID-jevi vektora u indexu bez zapisa u metadata (prekinut _write_atomic)."""
+    known = {m["vector_id"] for m in metadata}
+    return [int(vid) for vid in faiss.vector_to_array(index.id_map) if int(vid) not in known]
+
+
+def _load_previous_build(n_docs: int) -> Optional[Tuple[Any, List[Dict]]]:
+    """
+    Prethodni index + metadata, ako podržavaju inkrementalni rad
+    (IndexIDMap i content_hash u metadata). Inače None -> puna izgradnja.
+
+    Mode se poredi sa onim koji bi make_index sada stvarno napravio: ivfpq
+    sa premalo dokumenata je i prošli put pao na flat, pa to nije razlog
+    za ponovnu izgradnju.
+    """
+    if not VECTOR_INDEX_FILE.exists() or not DOCS_METADATA_FILE.exists():
+        return None
+    try:
+        index = faiss.read_index(str(VECTOR_INDEX_FILE))
+        with open(DOCS_METADATA_FILE, 'rb') as f:
+            metadata = pickle.load(f)
+    except Exception:
+        return None
+
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return None
+    if index.d != embedding_provider.dim or index_mode(index) != effective_index_mode(VECTOR_INDEX_MODE, n_docs):
+        return None
+    if any("content_hash" not in m or "vector_id" not in m for m in metadata):
+        return None
+    return index, metadata
+
+
+def build_vector_index(incremental: bool = False) -> Dict:
     """
     Kreira ili regeneriše FAISS index sa embeddings.
     Koristi tekst generisan iz analita (_doc_to_text).
+
+    Vektori su u IndexIDMap-u sa stabilnim ID-jem po dokumentu. Sa
+    incremental=True dokumenti se porede po hash-u _doc_to_text sa prethodnom
+    izgradnjom: embeduju se samo novi/izmijenjeni, obrisani se uklanjaju,
+    a nepromijenjeni ostaju u indexu. Index i metadata se upisuju atomski.
+
+    Dokumenti za koje embedding nije uspio se NE indeksiraju (umjesto nultog
+    vektora) i vraćaju se u izvještaju, zajedno sa brojem indeksiranih.
     """
     print("Building vector index...")
 
     docs = load_documents()
     if not docs:
         print("No documents to index!")
-        return
+        return {"indexed": 0, "failed": []}
 
-    print(f"Generating embeddings for {len(docs)} documents...")
+    texts = [_doc_to_text(doc) for doc in docs]
+    hashes = [hash_content(text) for text in texts]
+    keys = []
+    seen_keys = set()
+    for i, doc in enumerate(docs):
+        key = _doc_key(doc, i)
+        if key in seen_keys:
+            key = f"{key}#{i}"
+        seen_keys.add(key)
+        keys.append(key)
+
+    previous = _load_previous_build(len(docs)) if incremental else None
+    if incremental and previous is None:
+        print("No compatible previous build – doing a full rebuild.")
+
+    if previous is not None:
+        index, old_metadata = previous
+        old_by_key = {m["doc_key"]: m for m in old_metadata}
+        current_hashes = dict(zip(keys, hashes))
+
+        to_embed = [
+            i for i, key in enumerate(keys)
+            if key not in old_by_key or old_by_key[key]["content_hash"] != hashes[i]
+        ]
+        # izmijenjeni i obrisani dokumenti – njihovi stari vektori izlaze iz indexa
+        stale_ids = [
+            m["vector_id"] for m in old_metadata
+            if current_hashes.get(m["doc_key"]) != m["content_hash"]
+        ] + _orphan_ids(index, old_metadata)
+        unchanged = len(docs) - len(to_embed)
+        deleted = sum(1 for m in old_metadata if m["doc_key"] not in current_hashes)
+        print(
+            f"Incremental: {unchanged} unchanged, {len(to_embed)} new/changed, "
+            f"{deleted} deleted"
+        )
+        if stale_ids and not _supports_removal(index):
+            print(f"{index_mode(index)} index does not support removal – doing a full rebuild.")
+            previous = None
+        elif stale_ids:
+            index.remove_ids(np.array(stale_ids, dtype=np.int64))
+
+    if previous is None:
+        # Kreiraj FAISS index (mode iz VECTOR_INDEX_MODE, kreira se kad znamo broj vektora)
+        index = None
+        old_by_key = {}
+        to_embed = list(range(len(docs)))
+
+    print(f"Generating embeddings for {len(to_embed)} documents...")
+    vectors, errors = embed_texts([texts[i] for i in to_embed])
+
+    new_embeddings = []
+    new_ids = []
+    failed = []
+    embedded = set()
+    for j, i in enumerate(to_embed):
+        title = docs[i].get('name', '') or docs[i].get('title', '')
+        if j in errors:
+            failed.append({"doc_id": i, "title": title, "error": errors[j]})
+            continue
+        new_embeddings.append(vectors[j])
+        new_ids.append(_vector_id(keys[i]))
+        embedded.add(i)
 
-    # Kreiraj FAISS index
-    index = faiss.IndexFlatIP(EMBEDDING_DIM)  # Inner product za cosine similarity
+    if failed:
+        print(f"WARNING: {len(failed)} documents failed to embed and were NOT indexed:")
+        for item in failed:
+            print(f"  - [{item['doc_id']}] {item['title']}: {item['error']}")
 
-    embeddings = []
-    metadata = []
+    if new_embeddings:
+        # Normalizuj embeddings za cosine similarity
+        new_embeddings = np.array(new_embeddings, dtype=np.float32)
+        faiss.normalize_L2(new_embeddings)
 
-    for i, doc in enumerate(docs):
-        text_to_embed = _doc_to_text(doc)
-        embedding = get_embedding(text_to_embed)
-        embeddings.append(embedding)
-        metadata.append({
-            'doc_id': i,
-            'title': doc.get('name', '') or doc.get('title', ''),
-            'url': doc.get('source', ''),
-            'type': doc.get('type', 'analit_info'),
-            'category': doc.get('category', '')
-        })
-
-        if (i + 1) % 50 == 0:
-            print(f"  Processed {i + 1}/{len(docs)} documents...")
-
-    # Normalizuj embeddings za cosine similarity
-    embeddings = np.array(embeddings, dtype=np.float32)
-    faiss.normalize_L2(embeddings)
-
-    # Add embeddings to index
-    index.add(embeddings)
-
-    # Save index and metadata
-    VECTOR_INDEX_FILE.parent.mkdir(exist_ok=True)
-    faiss.write_index(index, str(VECTOR_INDEX_FILE))
-    with open(DOCS_METADATA_FILE, 'wb') as f:
-        pickle.dump(metadata, f)
+    if index is None:
+        index = make_index(VECTOR_INDEX_MODE, embedding_provider.dim, len(new_embeddings))
+        if len(new_embeddings):
+            train_index(index, new_embeddings)
 
-    print(f"SUCCESS: Vector index saved with {len(docs)} documents indexed")
+    if len(new_embeddings):
+        index.add_with_ids(new_embeddings, np.array(new_ids, dtype=np.int64))
 
+    # metadata za sve dokumente koji su sada u indexu (stari nepromijenjeni + novi)
+    to_embed_set = set(to_embed)
+    metadata = [
+        _doc_metadata(doc, i, keys[i], hashes[i])
+        for i, doc in enumerate(docs)
+        if i in embedded or (i not in to_embed_set and keys[i] in old_by_key)
+    ]
+
+    _write_atomic(index, metadata)
+
+    print(f"SUCCESS: Vector index saved with {index.ntotal} documents indexed")
+    return {"indexed": int(index.ntotal), "embedded": len(embedded), "failed": failed}
+
+
+class ResidentIndex(NamedTuple):
+    """Učitan index + sve što pretraga treba, drži se u memoriji procesa."""
+    signature: Tuple
+    index: Any
+    metadata: List[Dict]
+    docs: List[Dict]
+    display_by_vid: Dict[int, Dict]  # ID vektora -> _doc_to_display(doc)
 
-def search_documents(query: str, k: int = 8):
-    """
-    Semantička pretraga dokumenata (analita) pomoću FAISS-a.
-    """
-    if not VECTOR_INDEX_FILE.exists() or not DOCS_METADATA_FILE.exists():
-        build_vector_index()
 
+_resident_index: Optional[ResidentIndex] = None
+_resident_lock = threading.Lock()
+
+
+def _files_signature() -> Tuple:
+    """(mtime_ns, size) za index, metadata i JSON – jeftino, bez čitanja fajlova."""
+    signature = []
+    for path in (VECTOR_INDEX_FILE, DOCS_METADATA_FILE, STORAGE_FILE):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _load_resident_index(signature: Tuple) -> ResidentIndex:
     index = faiss.read_index(str(VECTOR_INDEX_FILE))
+    configure_search(index)
 
     with open(DOCS_METADATA_FILE, 'rb') as f:
         metadata = pickle.load(f)
 
     docs = load_documents()
+    docs_by_key = {
+        _doc_key(doc, i): doc for i, doc in enumerate(docs) if isinstance(doc, dict)
+    }
+
+    display_by_vid: Dict[int, Dict] = {}
+    for position, meta in enumerate(metadata):
+        # stari format (IndexFlatIP bez ID-jeva): ID vektora == pozicija
+        vid = meta.get("vector_id", position)
+        doc = docs_by_key.get(meta.get("doc_key"))
+        if doc is None:
+            doc_id = meta.get("doc_id")
+            if doc_id is None or doc_id >= len(docs) or not isinstance(docs[doc_id], dict):
+                continue
+            doc = docs[doc_id]
+        display_by_vid[vid] = _doc_to_display(doc)
+
+    return ResidentIndex(signature, index, metadata, docs, display_by_vid)
+
+
+def get_resident_index() -> ResidentIndex:
+    """
+    Vraća index koji živi u memoriji procesa. Ako su se fajlovi na disku
+    promijenili (mtime/veličina), učitava novu verziju i atomski je
+    zamjenjuje – pretrage u toku završavaju nad starom verzijom.
+    """
+    global _resident_index
+
+    signature = _files_signature()
+    current = _resident_index
+    if current is not None and current.signature == signature:
+        return current
+
+    with _resident_lock:
+        current = _resident_index
+        if current is not None and current.signature == signature:
+            return current
+        _resident_index = _load_resident_index(signature)
+        return _resident_index
+
+
+def search_documents_scored(query: str, k: int = 8) -> List[Tuple[Dict, float]]:
+    """
+    Kao search_documents, ali vraća i cosine sličnost: [(dokument, sličnost)].
+    """
+    if not VECTOR_INDEX_FILE.exists() or not DOCS_METADATA_FILE.exists():
+        build_vector_index()
+
+    resident = get_resident_index()
+    index = resident.index
+    if index.ntotal == 0:
+        return []
 
     query_embedding = get_embedding(query)
     query_embedding = np.array([query_embedding], dtype=np.float32)
     faiss.normalize_L2(query_embedding)
 
-    distances, indices = index.search(query_embedding, min(k * 2, len(metadata)))
+    distances, indices = index.search(query_embedding, min(k * 2, index.ntotal))
 
     results = []
     seen_sources = set()
 
-    for idx in indices[0]:
-        if idx < 0 or idx >= len(metadata):
+    for vid, score in zip(indices[0], distances[0]):
+        if vid < 0:
             continue
 
-        meta = metadata[idx]
-        doc_id = meta.get("doc_id")
+        # Dokument već pripremljen za prikaz (title/content za analite)
+        display_doc = resident.display_by_vid.get(int(vid))
 
-        if doc_id is None or doc_id >= len(docs):
+        if display_doc is None:
             continue
 
-        doc = docs[doc_id]
-
-        if not isinstance(doc, dict):
-            continue
-
-        source = doc.get("source", "")
+        source = display_doc.get("source", "")
 
         if source and source in seen_sources:
             continue
 
         seen_sources.add(source)
 
-        # Pripremi dokument za prikaz (dodaj title/content za analite)
-        display_doc = _doc_to_display(doc)
-        results.append(display_doc)
+        # plitka kopija – pozivalac ne smije da mijenja dijeljeni keš
+        results.append((dict(display_doc), float(score)))
 
         if len(results) >= k:
             break
@@ -270,6 +801,13 @@ def search_documents(query: str, k: int = 8):
     return results
 
 
+def search_documents(query: str, k: int = 8):
+    """
+    Semantička pretraga dokumenata (analita) pomoću FAISS-a.
+    """
+    return [doc for doc, _ in search_documents_scored(query, k)]
+
+
 def hash_content(content: str) -> str:
     """Hash content za uklanjanje duplikacije"""
     return hashlib.sha256(content.encode('utf-8')).hexdigest()
@@ -0,0 +1,169 @@
+"""
+Memory-mapped skladište embeddinga (zamjena za embedding_cache.pkl).
+
+Raspored na disku (jedan direktorijum):
+- vectors.bin – kontinualna matrica [count x dim] (float32 ili float16), red po red
+- keys.bin    – SHA-256 ključevi (32 bajta po redu), istim redosljedom
+- meta.json   – {"dim", "dtype", "count"}; jedini izvor istine o broju redova
+
+Upis je append-only: novi redovi se dopišu na kraj oba fajla, pa se tek onda
+atomski (tmp + os.replace) upiše novi count u meta.json. Ako proces padne
+usred upisa, višak na kraju fajlova se ignoriše i odsiječe pri sledećem upisu.
+Otvaranje ne čita ni matricu ni ključeve – indeks ključeva se pravi tek pri
+prvom traženju, a matrica se mapira (np.memmap).
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+_KEY_BYTES = 32
+
+
+class MmapVectorStore:
+    def __init__(self, directory: Path, dim: int, dtype: str = "float32"):
+        self.directory = Path(directory)
+        self.vectors_file = self.directory / "vectors.bin"
+        self.keys_file = self.directory / "keys.bin"
+        self.meta_file = self.directory / "meta.json"
+
+        self._lock = threading.Lock()
+        self._key_index: Optional[Dict[bytes, int]] = None
+        self._matrix: Optional[np.memmap] = None
+
+        meta = self._read_meta()
+        if meta is not None:
+            if meta["dim"] != dim:
+                raise ValueError(
+                    f"{self.directory}: store ima dim={meta['dim']}, a traženo je dim={dim}"
+                )
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.count = meta["count"]
+        else:
+            self.dim = dim
+            self.dtype = np.dtype(dtype)
+            self.count = 0
+
+    # ---------------------------------------------------------
+    #  meta
+    # ---------------------------------------------------------
+
+    def _read_meta(self) -> Optional[Dict]:
+        if not self.meta_file.exists():
+            return None
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, count: int) -> None:
+        tmp = self.meta_file.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "count": count}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.meta_file)
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    # ---------------------------------------------------------
+    #  čitanje
+    # ---------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _ensure_key_index(self) -> Dict[bytes, int]:
+        if self._key_index is None:
+            index: Dict[bytes, int] = {}
+            if self.count and self.keys_file.exists():
+                with open(self.keys_file, "rb") as f:
+                    raw = f.read(self.count * _KEY_BYTES)
+                for row in range(len(raw) // _KEY_BYTES):
+                    index[raw[row * _KEY_BYTES:(row + 1) * _KEY_BYTES]] = row
+            self._key_index = index
+        return self._key_index
+
+    def _ensure_matrix(self) -> Optional[np.memmap]:
+        if self.count == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != self.count:
+            self._matrix = np.memmap(
+                self.vectors_file, dtype=self.dtype, mode="r", shape=(self.count, self.dim)
+            )
+        return self._matrix
+
+    # čitanje ide pod istim lock-om kao put_many: ključ upravo dodat u indeks
+    # ne smije se tražiti u matrici mapiranoj sa starim count-om, a indeks
+    # ključeva koji se tek gradi ne smije pregaziti onaj koji put_many dopunjava
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return bytes.fromhex(key) in self._ensure_key_index()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Vektor za heksadecimalni SHA-256 ključ (kao float32 kopija) ili None."""
+        with self._lock:
+            row = self._ensure_key_index().get(bytes.fromhex(key))
+            if row is None:
+                return None
+            return np.array(self._ensure_matrix()[row], dtype=np.float32)
+
+    # ---------------------------------------------------------
+    #  upis
+    # ---------------------------------------------------------
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        self.put_many({key: vector})
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> int:
+        """
+        Dopisuje nove vektore (postojeći ključevi se preskaču) i atomski
+        potvrđuje novi count. Cijena je O(broj novih stavki). Vraća broj upisanih.
+        """
+        with self._lock:
+            key_index = self._ensure_key_index()
+            new_keys = []
+            new_rows = []
+            for key, vector in items.items():
+                raw_key = bytes.fromhex(key)
+                if raw_key in key_index:
+                    continue
+                vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+                if vec.shape[0] != self.dim:
+                    raise ValueError(f"Očekivana dimenzija {self.dim}, dobijeno {vec.shape[0]}")
+                new_keys.append(raw_key)
+                new_rows.append(vec)
+
+            if not new_keys:
+                return 0
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            matrix = np.stack(new_rows).astype(self.dtype, copy=False)
+
+            self._append(self.vectors_file, self.count * self._row_bytes, matrix.tobytes())
+            self._append(self.keys_file, self.count * _KEY_BYTES, b"".join(new_keys))
+
+            new_count = self.count + len(new_keys)
+            self._write_meta(new_count)
+
+            # prvo count (matrica novog oblika), pa tek onda ključevi u indeksu
+            old_count, self.count = self.count, new_count
+            for i, raw_key in enumerate(new_keys):
+                key_index[raw_key] = old_count + i
+            return len(new_keys)
+
+    @staticmethod
+    def _append(path: Path, committed_size: int, payload: bytes) -> None:
+        """Odsiječe nepotvrđeni višak (pad usred upisa) pa dopiše payload."""
+        mode = "r+b" if path.exists() else "w+b"
+        with open(path, mode) as f:
+            f.truncate(committed_size)
+            f.seek(committed_size)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,258 @@
+"""
+Kolonski (NumPy) prikaz laboratorijskih nalaza iz zahtjeva i statistike po
+analitu računate odjednom za sve analite (bez Python petlje po grupi).
+
+Redovi stižu kao dict-ovi sa dva moguća imena polja ("value"/"Vrijednost",
+"ref_low"/"Ref_low" ...). Ključevi se razriješe jednom po redu, pri pravljenju
+kolona; sve ostalo radi nad nizovima grupisanim po analitu i sortiranim po datumu.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# prozor za klizni prosjek (poslednjih N mjerenja)
+ROLLING_WINDOW = 3
+
+# nagib ispod ovog udjela srednje vrijednosti (preko cijelog perioda) = "stabilno"
+TREND_REL_THRESHOLD = 0.02
+
+_FIELDS = {
+    "analit": ("analit", "Analit"),
+    "value": ("value", "Vrijednost"),
+    "unit": ("unit", "Jedinica"),
+    "ref_low": ("ref_low", "Ref_low"),
+    "ref_high": ("ref_high", "Ref_high"),
+    "status": ("status", "Status"),
+}
+
+
+def _field(row: Dict, name: str) -> Any:
+    for key in _FIELDS[name]:
+        value = row.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _column(rows: Sequence[Dict], name: str) -> List[Any]:
+    """
+    Jedno polje za sve redove (prvi ključ koji postoji). U uobičajenom
+    slučaju – svi redovi koriste isti ključ – to je jedan prolaz.
+    """
+    primary, fallback = _FIELDS[name]
+    column = [row.get(primary) for row in rows]
+    if None in column:
+        column = [v if v is not None else row.get(fallback) for v, row in zip(column, rows)]
+    return column
+
+
+_NAN = float("nan")
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip().replace(",", "."))
+        except ValueError:
+            pass
+    return _NAN
+
+
+def _numbers(column: List[Any]) -> np.ndarray:
+    """
+    Kolona polja nalaza kao float64, NaN gdje nije broj. Brzi put je jedna
+    NumPy konverzija; tek ako neka vrijednost nije broj ("<5", "negativan",
+    lista) ide se element po element.
+    """
+    try:
+        numbers = np.array(column, dtype=np.float64)  # None -> NaN
+    except (TypeError, ValueError):
+        numbers = None
+    # lista kao vrijednost ("value": [1, 2]) daje 2-D niz umjesto greške
+    if numbers is None or numbers.ndim != 1:
+        numbers = np.array([_to_float(v) for v in column], dtype=np.float64)
+    return numbers
+
+
+def _date_keys(column: List[Any]) -> np.ndarray:
+    """
+    Ključ za sortiranje po datumu: ISO datumi se parsiraju u datetime64
+    (brže sortiranje od stringova), a bilo šta drugo pada na poređenje stringova.
+    Prazan datum ide na početak, kao i ranije.
+    """
+    try:
+        keys = np.array(column, dtype="datetime64[s]")  # None -> NaT (najmanji)
+    except (TypeError, ValueError):
+        keys = None
+    if keys is None or keys.ndim != 1:
+        return np.array([str(d) if d else "" for d in column], dtype=str)
+    return keys.astype(np.int64)
+
+
+class AnalitStats(NamedTuple):
+    """Statistike jednog analita; brojevi su NaN kada nema dovoljno mjerenja."""
+    analit: str
+    n_rows: int
+    n_values: int  # broj numeričkih mjerenja (i brojeva poslatih kao tekst, "5,2")
+    last: Dict[str, Any]  # polja poslednjeg (po datumu) reda, kako su poslata
+    min: float
+    max: float
+    slope: float  # promjena po mjerenju (least squares)
+    trend: Optional[str]  # "porast" | "pad" | "stabilno" | None (< 2 mjerenja)
+    rolling_mean: float  # prosjek poslednjih ROLLING_WINDOW mjerenja
+    out_of_range: int  # mjerenja van referentnog opsega svog reda
+    ref_distance: float  # poslednja vrijednost vs. opseg, u % granice (+ iznad, - ispod, 0 u opsegu)
+
+
+class LabColumns:
+    """
+    Nalazi kao kolone, grupisani po analitu (redoslijed prvog pojavljivanja)
+    i unutar grupe stabilno sortirani po datumu.
+    """
+
+    def __init__(self, lab_rows: Sequence[Dict]):
+        rows = list(lab_rows)
+        analiti = _column(rows, "analit")
+        if not all(analiti):
+            rows = [row for row, analit in zip(rows, analiti) if analit]
+            analiti = [analit for analit in analiti if analit]
+
+        # kod analita = redoslijed prvog pojavljivanja
+        codes = {analit: code for code, analit in enumerate(dict.fromkeys(analiti))}
+        group = np.fromiter(map(codes.__getitem__, analiti), dtype=np.int64, count=len(analiti))
+        self.names: List[str] = list(codes)
+
+        # grupa pa datum; lexsort je stabilan, pa isti datum zadržava redoslijed slanja
+        dates = _date_keys([row.get("date") for row in rows])
+        order = np.lexsort((dates, group)) if rows else np.zeros(0, dtype=np.int64)
+
+        # kolone se prave nad redovima kako su stigli, pa se samo permutuju
+        self._rows = rows
+        self._order = order
+        self.group = group[order]
+        self.values = _numbers(_column(rows, "value"))[order]
+        self.ref_low = _numbers(_column(rows, "ref_low"))[order]
+        self.ref_high = _numbers(_column(rows, "ref_high"))[order]
+        self.starts = np.searchsorted(self.group, np.arange(len(self.names)))
+
+    def _last_fields(self, index: int) -> Dict[str, Any]:
+        row = self._rows[self._order[index]]
+        return {name: _field(row, name) for name in ("value", "unit", "ref_low", "ref_high", "status")}
+
+    def __len__(self) -> int:
+        return len(self.group)
+
+    def stats(self) -> List[AnalitStats]:
+        """Statistike za sve analite, u redoslijedu prvog pojavljivanja."""
+        n_groups = len(self.names)
+        if not n_groups:
+            return []
+
+        ends = np.append(self.starts[1:], len(self.group))
+        n_rows = ends - self.starts
+        finite = np.isfinite(self.values)
+        g = self.group[finite]
+        y = self.values[finite]
+        n = np.bincount(g, minlength=n_groups)
+
+        # redni broj mjerenja unutar grupe (0..n-1) i od kraja (n-1..0)
+        first_pos = np.concatenate(([0], np.cumsum(n)[:-1]))
+
+        # min / max po grupi (y je sortiran po grupi -> reduceat); grupe bez mjerenja ostaju NaN
+        v_min = np.full(n_groups, np.nan)
+        v_max = np.full(n_groups, np.nan)
+        has_values = n > 0
+        if has_values.any():
+            v_min[has_values] = np.minimum.reduceat(y, first_pos[has_values])
+            v_max[has_values] = np.maximum.reduceat(y, first_pos[has_values])
+        x = np.arange(len(y)) - first_pos[g]
+        from_end = n[g] - 1 - x
+
+        # least-squares nagib po mjerenju, sa centriranim x i y
+        safe_n = np.maximum(n, 1)
+        mean_x = np.bincount(g, weights=x, minlength=n_groups) / safe_n
+        mean_y = np.bincount(g, weights=y, minlength=n_groups) / safe_n
+        dx = x - mean_x[g]
+        dy = y - mean_y[g]
+        sxx = np.bincount(g, weights=dx * dx, minlength=n_groups)
+        sxy = np.bincount(g, weights=dx * dy, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = np.where(n >= 2, sxy / sxx, np.nan)
+
+        # klizni prosjek poslednjih ROLLING_WINDOW mjerenja
+        window = from_end < ROLLING_WINDOW
+        window_n = np.bincount(g[window], minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rolling = np.bincount(g[window], weights=y[window], minlength=n_groups) / window_n
+
+        # mjerenja van referentnog opsega (poređenje sa NaN je False -> ne broji se)
+        outside = (self.values < self.ref_low) | (self.values > self.ref_high)
+        out_count = np.bincount(self.group[outside], minlength=n_groups)
+
+        # trend: ukupna promjena po pravcu (nagib * raspon) u odnosu na srednju vrijednost
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rel_change = slope * (n - 1) / np.where(mean_y != 0, np.abs(mean_y), 1.0)
+
+        # odstupanje poslednjeg reda od opsega
+        last_idx = ends - 1
+        last_val = self.values[last_idx]
+        last_low = self.ref_low[last_idx]
+        last_high = self.ref_high[last_idx]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            above = (last_val - last_high) / np.abs(last_high) * 100.0
+            below = (last_val - last_low) / np.abs(last_low) * 100.0
+        ref_distance = np.where(
+            last_val > last_high, above,
+            np.where(last_val < last_low, below,
+                     np.where(np.isfinite(last_val) & (np.isfinite(last_low) | np.isfinite(last_high)), 0.0, np.nan)),
+        )
+
+        result = []
+        for i, analit in enumerate(self.names):
+            trend = None
+            if n[i] >= 2:
+                if not np.isfinite(rel_change[i]) or abs(rel_change[i]) < TREND_REL_THRESHOLD:
+                    trend = "stabilno"
+                else:
+                    trend = "porast" if rel_change[i] > 0 else "pad"
+            result.append(AnalitStats(
+                analit=analit,
+                n_rows=int(n_rows[i]),
+                n_values=int(n[i]),
+                last=self._last_fields(last_idx[i]),
+                min=float(v_min[i]),
+                max=float(v_max[i]),
+                slope=float(slope[i]),
+                trend=trend,
+                rolling_mean=float(rolling[i]),
+                out_of_range=int(out_count[i]),
+                ref_distance=float(ref_distance[i]),
+            ))
+        return result
+
+
+def normalize_lab_rows(lab_rows: Sequence[Dict]) -> List[Dict]:
+    """
+    Redovi sa kanonskim ključevima (analit, value, unit, ref_low, ref_high,
+    status, date, source), bez praznih polja i bez redova bez analita.
+    Vrijednosti ostaju kako su poslate – brojevi se tumače tek u LabColumns.
+    """
+    normalized = []
+    for row in lab_rows:
+        if not isinstance(row, dict):
+            continue
+        item = {name: _field(row, name) for name in _FIELDS}
+        item["date"] = row.get("date")
+        item["source"] = row.get("source")
+        if not item["analit"]:
+            continue
+        normalized.append({k: v for k, v in item.items() if v is not None})
+    return normalized
+
+
+def fmt_number(x: float) -> str:
+    """Kratak prikaz broja: 5, 5.2, 0.013 (bez ".0" i bez numpy repr-a)."""
+    return f"{x:.6g}" if abs(x) < 1e6 else f"{x:.0f}"
@@ -0,0 +1,210 @@
+"""
+Metrike za /metrics (Prometheus text format 0.0.4) i vremena faza obrade
+pitanja, bez dodatnih zavisnosti.
+
+Faze se mjere sa `span("ime")`: trajanje ide u histogram
+labguard_stage_seconds{stage="ime"}, a ako je za tekući zahtjev pokrenuto
+skupljanje (start_timings), i u njegov dict – tako /chat može da vrati
+"timings" kada klijent pošalje debug header. Dict se prenosi kroz
+contextvar, pa ga vide i asyncio.to_thread i taskovi pokrenuti iz zahtjeva.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# sekunde: od lokalnih faza (ispod 1 ms) do poziva modela (sekunde)
+STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(x: float) -> str:
+    if math.isinf(x):
+        return "+Inf" if x > 0 else "-Inf"
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # po labelama: [brojač po bucketu..., suma, ukupno]
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels_text(names, key + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels_text(names, key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+# (ime, tip, help, [(labele, vrijednost)]) – za metrike koje se čitaju iz postojećih brojača
+Sample = Tuple[Dict[str, str], float]
+Collected = Tuple[str, str, str, List[Sample]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[Collected]]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[Collected]]) -> None:
+        """Collector se poziva pri svakom /metrics (npr. hits/misses iz cache.stats())."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels_text(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "labguard_stage_seconds", "Trajanje faze obrade pitanja u sekundama", ["stage"]
+)
+request_seconds = registry.histogram(
+    "labguard_request_seconds", "Trajanje HTTP zahtjeva u sekundama", ["route", "status"]
+)
+prompt_tokens = registry.histogram(
+    "labguard_prompt_tokens", "Veličina prompta za model (lokalno brojanje)", ["intent"], TOKEN_BUCKETS
+)
+upstream_requests = registry.counter(
+    "labguard_upstream_requests_total", "Pozivi modela po namjeni", ["call"]
+)
+upstream_tokens = registry.counter(
+    "labguard_upstream_tokens_total", "Tokeni po usage iz odgovora modela", ["call", "kind"]
+)
+
+
+def record_usage(call: str, usage: Any) -> None:
+    """Broji poziv modela i njegove tokene (call: "generation" | "guard")."""
+    upstream_requests.inc(call=call)
+    if usage is None:
+        return
+    upstream_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0, call=call, kind="prompt")
+    upstream_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, call=call, kind="completion")
+
+
+# ---------------------------------------------------------
+#  VREMENA FAZA
+# ---------------------------------------------------------
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("labguard_timings", default=None)
+
+
+def start_timings(timings: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Počinje skupljanje vremena faza za tekući kontekst; vraća dict koji se
+    puni. Postojeći dict se može nastaviti (npr. u generatoru SSE streama).
+    """
+    if timings is None:
+        timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        # faza koja se ponovi (npr. guard u streamingu) se sabira
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds * 1000.0, 3) for stage, seconds in timings.items()}
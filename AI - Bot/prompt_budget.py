@@ -0,0 +1,174 @@
+"""
+Lokalno brojanje tokena i sklapanje konteksta za prompt unutar zadatog budžeta.
+
+Tokeni se broje preko tiktoken-a (o200k_base, enkoding gpt-4.1/4o modela)
+ako je instaliran i enkoding dostupan; inače gruba procjena (~4 znaka po
+tokenu za riječi, 1 token po interpunkciji) – dovoljno za odluku šta staje.
+"""
+
+import math
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # opciona zavisnost
+    tiktoken = None
+
+_ENCODING = None
+if tiktoken is not None:
+    try:
+        _ENCODING = tiktoken.get_encoding("o200k_base")
+    except Exception:  # enkoding se preuzima sa mreže pri prvom korišćenju
+        _ENCODING = None
+
+TOKEN_COUNTER = "tiktoken" if _ENCODING is not None else "estimate"
+
+# chat format: ~3 tokena po poruci + 3 za početak odgovora (OpenAI cookbook)
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_REPLY_PRIMING = 3
+# razmak između dijelova konteksta ("\n\n")
+_SEPARATOR_TOKENS = 1
+# dio manji od ovoga se ne skraćuje – bolje ga izostaviti
+_MIN_TRUNCATED_TOKENS = 64
+
+_ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return sum(
+        math.ceil(len(tok) / 4) if tok[0].isalnum() or tok[0] == "_" else 1
+        for tok in _ESTIMATE_RE.findall(text)
+    )
+
+
+def count_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    """Tokeni cijelog chat prompta (sadržaj + overhead po poruci)."""
+    return _TOKENS_REPLY_PRIMING + sum(
+        _TOKENS_PER_MESSAGE + count_tokens(m.get("content") or "") for m in messages
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Skraćuje tekst na najviše max_tokens, po mogućnosti na kraju reda/riječi."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        cut = _ENCODING.decode(_ENCODING.encode(text)[:max_tokens])
+    else:
+        cut = text[: max_tokens * 4]
+        while cut and count_tokens(cut) > max_tokens:
+            cut = cut[: int(len(cut) * 0.9)]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + " …"
+
+
+class ContextPiece(NamedTuple):
+    """Dio konteksta; manji priority = važnije. Lista dijelova je u redoslijedu ispisa."""
+    section: str
+    text: str
+    priority: int
+    truncatable: bool = False
+
+
+def fit_pieces(
+    pieces: Sequence[ContextPiece], budget: int
+) -> Tuple[List[ContextPiece], List[ContextPiece], bool]:
+    """
+    Bira dijelove po prioritetu dok ima budžeta (u tokenima). Dio koji ne
+    staje preskače se (manji iza njega još mogu da stanu); samo dio označen
+    kao truncatable se skraćuje na ostatak budžeta. Unutar istog prioriteta
+    prvo idu dijelovi koji se ne skraćuju, pa se skraćeni dio "stisne" oko njih.
+
+    Vraća (izabrani u originalnom redoslijedu, izostavljeni, da li je nešto skraćeno).
+    """
+    ranked = sorted(
+        range(len(pieces)), key=lambda i: (pieces[i].priority, pieces[i].truncatable, i)
+    )
+    chosen: Dict[int, ContextPiece] = {}
+    dropped: List[ContextPiece] = []
+    truncated = False
+    used = 0
+
+    for i in ranked:
+        piece = pieces[i]
+        cost = count_tokens(piece.text) + _SEPARATOR_TOKENS
+        if used + cost <= budget:
+            chosen[i] = piece
+            used += cost
+            continue
+        room = budget - used - _SEPARATOR_TOKENS
+        if piece.truncatable and room >= _MIN_TRUNCATED_TOKENS:
+            chosen[i] = piece._replace(text=truncate_to_tokens(piece.text, room))
+            used = budget
+            truncated = True
+            continue
+        dropped.append(piece)
+
+    return [chosen[i] for i in sorted(chosen)], dropped, truncated
+
+
+class PromptReport(NamedTuple):
+    """Veličina jednog prompta, kako je izmjerena pri sklapanju."""
+    intent: str
+    budget: int
+    prompt_tokens: int  # cijeli prompt (sve poruke)
+    context_tokens: int  # samo izabrani kontekst
+    pieces_included: int
+    pieces_dropped: int
+    truncated: bool
+    counter: str = TOKEN_COUNTER
+
+
+class PromptStats:
+    """Zbirni brojači veličine promptova (za /health), thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "max_prompt_tokens": 0,
+            "pieces_dropped": 0,
+            "truncated": 0,
+            "upstream_requests": 0,
+            "upstream_prompt_tokens": 0,
+            "upstream_completion_tokens": 0,
+        }
+        self._last: Optional[Dict[str, Any]] = None
+
+    def record(self, report: PromptReport, usage: Any = None) -> None:
+        """Bilježi prompt; `usage` je usage objekat iz odgovora modela (ako ga ima)."""
+        with self._lock:
+            s = self._stats
+            s["requests"] += 1
+            s["prompt_tokens"] += report.prompt_tokens
+            s["max_prompt_tokens"] = max(s["max_prompt_tokens"], report.prompt_tokens)
+            s["pieces_dropped"] += report.pieces_dropped
+            s["truncated"] += int(report.truncated)
+            last = report._asdict()
+            if usage is not None:
+                s["upstream_requests"] += 1
+                s["upstream_prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+                s["upstream_completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+                last["upstream_prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+                last["upstream_completion_tokens"] = getattr(usage, "completion_tokens", None)
+            self._last = last
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["last"] = self._last
+        requests = stats["requests"]
+        stats["avg_prompt_tokens"] = round(stats["prompt_tokens"] / requests, 1) if requests else 0.0
+        stats["counter"] = TOKEN_COUNTER
+        return stats
@@ -0,0 +1,174 @@
+"""
+Hibridna pretraga analita (fallback kada nema tačnog poklapanja imena/sinonima):
+BM25 leksička pretraga + FAISS vektorska pretraga, spojene reciprocal-rank
+fusion-om (RRF), uz vremenski budžet po fazi.
+"""
+
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from text_match import tokenize
+
+# česte riječi u pitanjima koje ne nose informaciju o analitu
+_STOPWORDS = {
+    "sta", "sto", "je", "su", "mi", "me", "ti", "te", "da", "li", "i", "a", "u", "na",
+    "za", "se", "od", "do", "o", "po", "sa", "iz", "kod", "koji", "koja", "koje",
+    "kako", "zasto", "moj", "moja", "moje", "moji", "tvoj", "ovaj", "ova", "ovo",
+    "taj", "to", "ima", "imam", "znaci", "objasni", "predstavlja", "nalaz", "nalazu",
+    "vrijednost", "vrijednosti", "mojoj", "mojem", "ako", "ali", "pa", "ne", "nije",
+}
+
+
+_STEM_LEN = 6
+
+
+def lexical_tokens(text: str) -> List[str]:
+    """
+    Folded tokeni bez stop-riječi, skraćeni na prvih 6 slova – grubo
+    "stemovanje" da se padeži poklope ("hemoglobina" ~ "hemoglobin").
+    """
+    return [tok[:_STEM_LEN] for tok, _, _ in tokenize(text) if tok not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 nad unaprijed tokenizovanim dokumentima (sve u memoriji)."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._tf: List[Counter] = [Counter(lexical_tokens(t)) for t in texts]
+        self._len = [sum(tf.values()) for tf in self._tf]
+        self._avg_len = (sum(self._len) / len(self._len)) if self._len else 0.0
+
+        df: Counter = Counter()
+        for tf in self._tf:
+            df.update(tf.keys())
+        n = len(self._tf)
+        self._idf = {
+            term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()
+        }
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """(indeks dokumenta, BM25 skor) za najboljih k, samo skor > 0."""
+        terms = [t for t in set(lexical_tokens(query)) if t in self._idf]
+        if not terms:
+            return []
+
+        scores = []
+        for i, tf in enumerate(self._tf):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._len[i] / (self._avg_len or 1.0))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    score += self._idf[term] * f * (self.k1 + 1) / (f + norm)
+            if score > 0:
+                scores.append((i, score))
+
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return scores[:k]
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal-rank fusion: skor = Σ 1 / (k + rang), rang počinje od 1."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+_stage_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+
+
+def run_with_budget(fn: Callable, budget_s: float, *args):
+    """
+    Pokreće fazu pretrage sa vremenskim budžetom. Vraća (rezultat, trajanje_s)
+    ili (None, budget_s) ako faza nije stigla na vrijeme ili je pukla –
+    pretraga se tada nastavlja bez nje.
+    """
+    t0 = time.perf_counter()
+    future = _stage_pool.submit(fn, *args)
+    try:
+        result = future.result(timeout=budget_s)
+    except FutureTimeout:
+        return None, budget_s
+    except Exception:
+        return None, time.perf_counter() - t0
+    return result, time.perf_counter() - t0
+
+
+class HybridRetriever:
+    """
+    BM25 + vektorska pretraga nad analitima, spojeni RRF-om.
+
+    `vector_search(query, k)` vraća listu (doc_id, cosine_sličnost); može biti
+    None kada vektorski index nije dostupan.
+
+    Sa `require_agreement` vraćaju se samo analiti koje su našle obje faze
+    (pogodak samo jedne liste, npr. slaba BM25 riječ, nije dovoljan); bez
+    vektorske faze tada nema ni rezultata.
+    """
+
+    def __init__(
+        self,
+        docs: List[Dict],
+        text_fn: Callable[[Dict], str],
+        vector_search: Optional[Callable[[str, int], List[Tuple[str, float]]]] = None,
+        bm25_min_score: float = 1.0,
+        vector_min_similarity: float = 0.35,
+        min_rrf_score: float = 1.0 / (60 + 3),
+        vector_budget_s: float = 0.8,
+        require_agreement: bool = False,
+    ):
+        self.docs = docs
+        self.ids = [d.get("id") or str(i) for i, d in enumerate(docs)]
+        self.by_id = dict(zip(self.ids, docs))
+        self.bm25 = BM25Index([text_fn(d) for d in docs])
+        self.vector_search = vector_search
+        self.bm25_min_score = bm25_min_score
+        self.vector_min_similarity = vector_min_similarity
+        self.min_rrf_score = min_rrf_score
+        self.vector_budget_s = vector_budget_s
+        self.require_agreement = require_agreement
+
+    def search(self, query: str, k: int = 3, timings: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """
+        Najviše k analita za upit. Ako je proslijeđen `timings` dict, u njega
+        se upisuje trajanje svake faze (lexical / vector / fusion) u sekundama.
+        """
+        if timings is None:
+            timings = {}
+
+        # 1) leksička faza – lokalna i brza, u istom threadu
+        t0 = time.perf_counter()
+        lexical = [
+            self.ids[i] for i, score in self.bm25.search(query, k=k * 3)
+            if score >= self.bm25_min_score
+        ]
+        timings["lexical"] = time.perf_counter() - t0
+
+        # 2) vektorska faza – embedding poziv, zato sa budžetom
+        semantic: List[str] = []
+        if self.vector_search is not None:
+            hits, timings["vector"] = run_with_budget(
+                self.vector_search, self.vector_budget_s, query, k * 3
+            )
+            semantic = [
+                doc_id for doc_id, sim in (hits or [])
+                if sim >= self.vector_min_similarity and doc_id in self.by_id
+            ]
+
+        # 3) RRF + prag
+        t0 = time.perf_counter()
+        both = set(lexical) & set(semantic) if self.require_agreement else None
+        fused = [
+            doc_id for doc_id, score in rrf_fuse([lexical, semantic])
+            if score >= self.min_rrf_score and (both is None or doc_id in both)
+        ]
+        timings["fusion"] = time.perf_counter() - t0
+
+        return [self.by_id[doc_id] for doc_id in fused[:k]]
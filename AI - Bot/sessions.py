@@ -0,0 +1,166 @@
+"""
+Serverske sesije sa laboratorijskim nalazima: klijent jednom pošalje (ili
+dopuni) lab_rows, dobije session_id i otisak sadržaja, a uz svako pitanje
+šalje samo session_id umjesto svih izvještaja.
+
+Sesije se čuvaju u ograničenom kešu sa TTL-om (cache.make_cache): "memory"
+za jedan proces ili "sqlite" kada sesije treba da dijeli više worker procesa
+na istoj mašini. U kešu su normalizovani redovi; sažetak i poslednje
+vrijednosti (engine.LabContext) računaju se jednom po sadržaju i drže u procesu.
+TTL teče od poslednjeg upisa (kreiranje / dopuna).
+"""
+
+import json
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from cache import LRUCache, make_cache
+from engine import LabContext
+from lab_columns import normalize_lab_rows
+
+# Skladište sesija: memory | sqlite
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(4 * 3600)))
+SESSION_MAX_ROWS = int(os.getenv("SESSION_MAX_ROWS", "5000"))
+SESSION_STORE_PATH = Path(
+    os.getenv("SESSION_STORE_PATH", str(Path(__file__).resolve().parent / "data" / "sessions.sqlite3"))
+)
+
+# pripremljeni LabContext-i po otisku sadržaja (samo u ovom procesu)
+_CONTEXT_CACHE_SIZE = 256
+
+
+def _row_key(row: Dict) -> str:
+    return json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SessionTooLarge(ValueError):
+    """Sesija bi imala više od SESSION_MAX_ROWS redova."""
+
+
+class LabSession(NamedTuple):
+    session_id: str
+    fingerprint: str  # otisak normalizovanih redova (isti kao u ključu keša odgovora)
+    rows: List[Dict]
+    updated_at: float
+
+    def info(self) -> Dict[str, Any]:
+        """Opis sesije za klijenta (bez samih redova)."""
+        return {
+            "session_id": self.session_id,
+            "fingerprint": self.fingerprint,
+            "rows": len(self.rows),
+            "analytes": len({row["analit"] for row in self.rows}),
+            "updated_at": self.updated_at,
+        }
+
+
+class SessionStore:
+    def __init__(self, backend: str, maxsize: int, ttl: Optional[float], path: Optional[Path] = None):
+        self.backend = (backend or "").strip().lower()
+        self.ttl = ttl
+        self._store = make_cache(self.backend, maxsize=maxsize, ttl=ttl, path=path)
+        if self._store is None:
+            raise ValueError("SESSION_STORE_BACKEND mora biti memory ili sqlite")
+        self._contexts = LRUCache(maxsize=_CONTEXT_CACHE_SIZE)
+        # dopuna je čitanje + upis – da se dvije istovremene dopune ne pregaze
+        self._lock = threading.Lock()
+        self.created = 0
+        self.appended = 0
+
+    def _save(self, session_id: str, rows: List[Dict]) -> LabSession:
+        if len(rows) > SESSION_MAX_ROWS:
+            raise SessionTooLarge(f"Sesija može imati najviše {SESSION_MAX_ROWS} redova")
+        # sažetak se računa odmah, pri upisu, a ne uz prvo pitanje
+        lab = LabContext(rows).precompute()
+        self._contexts.set(lab.fingerprint, lab)
+        session = LabSession(session_id, lab.fingerprint, rows, time.time())
+        self._store.set(session_id, {
+            "fingerprint": session.fingerprint,
+            "rows": rows,
+            "updated_at": session.updated_at,
+        })
+        return session
+
+    def create(self, lab_rows: List[Dict], normalized: bool = False) -> LabSession:
+        """`normalized=True` kada redovi već imaju kanonske ključeve (npr. iz wire.decode_lab_columns)."""
+        rows = lab_rows if normalized else normalize_lab_rows(lab_rows)
+        session = self._save(secrets.token_urlsafe(16), rows)
+        self.created += 1
+        return session
+
+    def append(self, session_id: str, lab_rows: List[Dict], normalized: bool = False) -> Optional[LabSession]:
+        """Dopisuje redove koji već ne postoje u sesiji; None ako sesije nema (ili je istekla)."""
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                return None
+            rows = list(session.rows)
+            seen = {_row_key(row) for row in rows}
+            for row in (lab_rows if normalized else normalize_lab_rows(lab_rows)):
+                key = _row_key(row)
+                if key not in seen:
+                    seen.add(key)
+                    rows.append(row)
+            if len(rows) == len(session.rows):
+                return session
+            session = self._save(session_id, rows)
+        self.appended += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[LabSession]:
+        item = self._store.get(session_id)
+        if item is None:
+            return None
+        return LabSession(session_id, item["fingerprint"], item["rows"], item["updated_at"])
+
+    def delete(self, session_id: str) -> bool:
+        return self._store.delete(session_id)
+
+    def _context_for(self, session: LabSession) -> LabContext:
+        lab = self._contexts.get(session.fingerprint)
+        if lab is None:
+            lab = LabContext(session.rows).precompute()
+            self._contexts.set(session.fingerprint, lab)
+        return lab
+
+    def lab_context(self, session_id: str) -> Optional[LabContext]:
+        """
+        Pripremljen LabContext sesije (za engine) ili None ako sesije nema.
+
+        Prvo se čita samo otisak; redovi se čitaju (i dekodiraju) tek kada
+        LabContext za taj otisak nije već pripremljen u ovom procesu.
+        """
+        fingerprint = self._store.get_field(session_id, "fingerprint")
+        if fingerprint is None:
+            return None
+        lab = self._contexts.get(fingerprint)
+        if lab is not None:
+            return lab
+        session = self.get(session_id)
+        if session is None:
+            return None
+        return self._context_for(session)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "ttl": self.ttl,
+            "created": self.created,
+            "appended": self.appended,
+            **self._store.stats(),
+            "contexts": self._contexts.stats(),
+        }
+
+
+session_store = SessionStore(
+    SESSION_STORE_BACKEND,
+    maxsize=SESSION_MAX,
+    ttl=SESSION_TTL or None,
+    path=SESSION_STORE_PATH,
+)
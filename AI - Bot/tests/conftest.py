@@ -0,0 +1,78 @@
+import os
+import sys
+from pathlib import Path
+
+# moduli bota su u ravnom rasporedu u "AI - Bot/" (kao kod uvicorn app:app)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# klijenti se prave pri importu; testovi ne zovu pravi API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GUARD_CACHE_FILE", "")
+
+import asyncio
+import types
+
+import pytest
+
+GUARD_MARKER = "evaluator sigurnosti"
+
+
+def _completion(text):
+    message = types.SimpleNamespace(content=text)
+    usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+async def _chunks(text):
+    """Stream odgovor kao kod stream=True: riječ po riječ, pa poslednji chunk sa usage."""
+    for word in text.split(" "):
+        delta = types.SimpleNamespace(content=word + " ")
+        yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+        await asyncio.sleep(0)
+    yield types.SimpleNamespace(choices=[], usage=_completion("").usage)
+
+
+class FakeCompletions:
+    """chat.completions bez mreže: guard pozivi -> SAFE, ostalo -> `answer`; pamti pozive."""
+
+    def __init__(self, answer="Hemoglobin je protein u krvi. Obrati se ljekaru.", delay=0.0):
+        self.answer = answer
+        self.delay = delay
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        system = kwargs["messages"][0]["content"]
+        if kwargs.get("stream"):
+            return _chunks(self.answer)
+        return _completion("SAFE" if GUARD_MARKER in system else self.answer)
+
+    def kinds(self):
+        return ["guard" if GUARD_MARKER in c["messages"][0]["content"] else "generation" for c in self.calls]
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Zamjenjuje async klijent u engine i guardrails; vraća FakeCompletions."""
+    import engine
+    import guardrails
+
+    completions = FakeCompletions()
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    monkeypatch.setattr(engine, "async_client", client)
+    monkeypatch.setattr(guardrails, "async_client", client)
+    if engine.answer_cache is not None:
+        engine.answer_cache.clear()
+    guardrails.verdict_cache.clear()
+    return completions
+
+
+@pytest.fixture
+def api(fake_llm):
+    from fastapi.testclient import TestClient
+
+    import app
+
+    return TestClient(app.app)
@@ -0,0 +1,54 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import app
+from metrics import request_seconds
+
+
+def _observed(route, status="200"):
+    """(broj, suma sekundi) za rutu iz labguard_request_seconds."""
+    series = request_seconds._series.get((route, status))
+    return (series[-1], series[-2]) if series else (0, 0.0)
+
+
+def test_lifespan_warms_up_and_closes_upstream(fake_llm, monkeypatch):
+    events = []
+
+    async def warm_up():
+        events.append("warm_up")
+        return {"generation": "ok"}
+
+    async def close():
+        events.append("close")
+
+    monkeypatch.setattr(app, "warm_up_upstream", warm_up)
+    monkeypatch.setattr(app, "close_upstream", close)
+    monkeypatch.setattr(app, "_warm_up", {})
+
+    with TestClient(app.app) as client:
+        assert events == ["warm_up"]
+        assert client.get("/health").json()["upstream"]["warm_up"] == {"generation": "ok"}
+    assert events == ["warm_up", "close"]
+
+
+def test_request_duration_covers_the_whole_stream(api, monkeypatch):
+    async def slow_stream(question, lab_rows=None):
+        yield {"event": "delta", "text": "Prvi dio. "}
+        await asyncio.sleep(0.3)  # poslije headera – ulazi u trajanje zahtjeva
+        yield {"event": "delta", "text": "Drugi dio."}
+
+    monkeypatch.setattr(app, "stream_answer_async", slow_stream)
+    count, total = _observed("/chat/stream")
+
+    response = api.post("/chat/stream", json={"question": "Šta je hemoglobin?"})
+    assert response.status_code == 200 and "Drugi dio." in response.text
+    new_count, new_total = _observed("/chat/stream")
+    assert new_count == count + 1
+    assert new_total - total >= 0.3
+
+
+def test_request_duration_is_observed_for_plain_responses(api):
+    count, _ = _observed("/health")
+    assert api.get("/health").status_code == 200
+    assert _observed("/health")[0] == count + 1
@@ -0,0 +1,78 @@
+import pytest
+
+import engine
+import upstream
+from upstream import DeadlineExceeded, Overloaded
+
+QUESTIONS = ["Šta je hemoglobin?", "Kakva mi je glukoza?", "Šta je holesterol?", "Šta je kreatinin?"]
+
+
+@pytest.fixture
+def answers(monkeypatch, fake_llm):
+    """generate_answer_async bez modela: ishod po pitanju iz rječnika `outcomes`."""
+    outcomes = {}
+
+    async def generate_answer_async(question, lab_rows=None):
+        outcome = outcomes.get(question, f"Odgovor: {question}")
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(engine, "generate_answer_async", generate_answer_async)
+    return outcomes
+
+
+def test_batch_answers_in_order(api, answers):
+    response = api.post("/chat/batch", json={"questions": QUESTIONS[:2]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["failed"] == 0
+    assert [r["question"] for r in body["results"]] == QUESTIONS[:2]
+    assert all(r["status"] == 200 and r["answer"] == f"Odgovor: {r['question']}" for r in body["results"])
+
+
+def test_batch_reports_partial_failures_per_item(api, answers):
+    answers[QUESTIONS[1]] = Overloaded("generation", "queue_full", 3)
+    answers[QUESTIONS[2]] = DeadlineExceeded("generation")
+    answers[QUESTIONS[3]] = RuntimeError("interna greška")
+
+    response = api.post("/chat/batch", json={"questions": QUESTIONS})
+    assert response.status_code == 200
+    body = response.json()
+    ok, overloaded, late, broken = body["results"]
+    assert body["failed"] == 3
+
+    assert ok["status"] == 200 and ok["answer"] == f"Odgovor: {QUESTIONS[0]}" and "error" not in ok
+    assert overloaded["status"] == 503 and overloaded["retry_after"] == 3
+    assert late["status"] == 504
+    assert broken["status"] == 500 and "interna" not in broken["error"]
+    for failed in (overloaded, late, broken):
+        assert "answer" not in failed and failed["error"]
+
+
+def test_batch_is_503_when_no_question_was_admitted(api, answers):
+    for question in QUESTIONS[:2]:
+        answers[question] = Overloaded("generation", "queue_full", 2)
+
+    response = api.post("/chat/batch", json={"questions": QUESTIONS[:2]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_batch_with_real_admission_limit(api, fake_llm, monkeypatch):
+    # jedno mjesto, bez reda: dok prvo pitanje čeka model, ostala se odbijaju
+    limiter = upstream.AdmissionLimiter("generation", limit=1, queue_max=0, timeout=1.0)
+    monkeypatch.setitem(upstream.admission, "generation", limiter)
+    fake_llm.delay = 0.3
+
+    response = api.post("/chat/batch", json={"questions": QUESTIONS[:3]})
+    assert response.status_code == 200
+    statuses = [r["status"] for r in response.json()["results"]]
+    assert 200 in statuses and 503 in statuses
+    assert response.json()["failed"] == statuses.count(503)
+
+
+def test_batch_validates_questions(api, answers):
+    assert api.post("/chat/batch", json={"questions": []}).status_code == 422
+    too_many = ["pitanje"] * 1000
+    assert api.post("/chat/batch", json={"questions": too_many}).status_code == 413
@@ -0,0 +1,253 @@
+import asyncio
+import threading
+
+import pytest
+
+import cache
+from cache import LRUCache, SingleFlight, SQLiteCache, make_cache
+
+
+class Clock:
+    """Zamjena za time.time u cache modulu."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make(request, tmp_path):
+    """Fabrika keša za oba backenda, sa istim potpisom."""
+    def build(maxsize=3, ttl=None):
+        return make_cache(request.param, maxsize=maxsize, ttl=ttl, path=tmp_path / "cache.sqlite3")
+
+    return build
+
+
+def test_make_cache_backends(tmp_path):
+    assert make_cache("off", 10, None) is None
+    assert isinstance(make_cache("memory", 10, None), LRUCache)
+    assert isinstance(make_cache("sqlite", 10, None, tmp_path / "c.sqlite3"), SQLiteCache)
+    with pytest.raises(ValueError):
+        make_cache("sqlite", 10, None)
+    with pytest.raises(ValueError):
+        make_cache("redis", 10, None)
+
+
+def test_get_set_and_stats(make):
+    c = make()
+    assert c.get("a") is None
+    c.set("a", {"answer": "x"})
+    assert c.get("a") == {"answer": "x"}
+    assert c.stats()["hits"] == 1 and c.stats()["misses"] == 1
+    assert c.delete("a") and not c.delete("a")
+
+
+def test_ttl_expiry(make, clock):
+    c = make(ttl=10)
+    c.set("a", "x")
+    clock.now += 9
+    assert c.get("a") == "x"
+    clock.now += 2
+    assert c.get("a") is None
+
+
+def test_get_field(make, clock):
+    c = make(ttl=10)
+    c.set("s", {"fingerprint": "abc", "rows": [{"analit": "Hb"}]})
+    c.set("plain", "x")
+    assert c.get_field("s", "fingerprint") == "abc"
+    assert c.get_field("s", "missing") is None
+    assert c.get_field("plain", "fingerprint") is None
+    assert c.get_field("nema", "fingerprint") is None
+    clock.now += 11
+    assert c.get_field("s", "fingerprint") is None
+
+
+def test_lru_eviction_respects_reads(make, clock):
+    c = make(maxsize=3)
+    for key in "abc":
+        clock.now += 1
+        c.set(key, key)
+    clock.now += 1
+    assert c.get("a") == "a"  # "a" postaje najskorije korišćen
+    clock.now += 1
+    c.set("d", "d")
+    assert c.get("b") is None
+    assert [c.get(k) for k in "acd"] == ["a", "c", "d"]
+    assert len(c) == 3
+
+
+def test_lru_cache_save_and_load(tmp_path, clock):
+    c = LRUCache(maxsize=10, ttl=100)
+    c.set("a", "x")
+    c.set("b", "y")
+    c.save(tmp_path / "cache.json")
+
+    clock.now += 50
+    restored = LRUCache(maxsize=1, ttl=100)
+    assert restored.load(tmp_path / "cache.json") == 2
+    assert len(restored) == 1 and restored.get("b") == "y"
+
+    clock.now += 60  # stavke su istekle
+    assert LRUCache().load(tmp_path / "cache.json") == 0
+    assert LRUCache().load(tmp_path / "missing.json") == 0
+
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    SQLiteCache(path).set("a", ["x", 1])
+    assert SQLiteCache(path).get("a") == ["x", 1]
+
+
+def test_sqlite_get_does_not_write(tmp_path, clock):
+    c = SQLiteCache(tmp_path / "cache.sqlite3", maxsize=2, ttl=5)
+    c.set("a", "x")
+    changes = c._conn.total_changes
+    assert c.get("a") == "x"
+    clock.now += 10
+    assert c.get("a") is None  # istekla stavka se ne briše pri čitanju
+    assert c._conn.total_changes == changes
+    c.set("b", "y")  # ... nego pri sledećem upisu
+    assert len(c) == 1
+
+
+def test_sqlite_cache_is_called_off_the_event_loop(tmp_path, monkeypatch):
+    import engine
+
+    sqlite_cache = SQLiteCache(tmp_path / "answers.sqlite3")
+    threads = []
+    get = sqlite_cache.get
+    monkeypatch.setattr(sqlite_cache, "get", lambda key: (threads.append(threading.get_ident()), get(key))[1])
+    monkeypatch.setattr(engine, "answer_cache", sqlite_cache)
+
+    async def scenario():
+        await engine._cache_set_async("k", "odgovor")
+        return threading.get_ident(), await engine._cache_get_async("k")
+
+    loop_thread, value = asyncio.run(scenario())
+    assert value == "odgovor"
+    assert threads and loop_thread not in threads
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    computed = []
+
+    async def compute():
+        computed.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.run("k", compute) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["answer"] * 5
+    assert len(computed) == 1
+    assert (flights.leaders, flights.coalesced) == (1, 4)
+
+
+def test_single_flight_shares_errors_and_forgets_the_key():
+    flights = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def scenario():
+        results = await asyncio.gather(flights.run("k", boom), flights.run("k", boom), return_exceptions=True)
+        again = await flights.run("k", lambda: asyncio.sleep(0, result="ok"))
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert again == "ok" and flights.failed == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_flight():
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.run("k", compute))
+        second = asyncio.ensure_future(flights.run("k", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "answer"
+
+
+def test_identical_questions_share_one_generation_call(fake_llm, monkeypatch):
+    import engine
+
+    monkeypatch.setattr(engine, "answer_cache", None)
+    fake_llm.delay = 0.05
+
+    async def scenario():
+        question = "Šta je hemoglobin?"
+        return await asyncio.gather(*(engine.generate_answer_async(question, []) for _ in range(10)))
+
+    answers = asyncio.run(scenario())
+    assert len(set(answers)) == 1
+    assert fake_llm.kinds().count("generation") == 1
+
+
+@pytest.mark.parametrize("enabled, expected", [(True, 1), (False, 3)])
+def test_single_flight_can_be_disabled(fake_llm, monkeypatch, enabled, expected):
+    import engine
+
+    monkeypatch.setattr(engine, "answer_cache", None)
+    monkeypatch.setattr(engine, "ANSWER_SINGLE_FLIGHT", enabled)
+    fake_llm.delay = 0.05
+
+    async def scenario():
+        await asyncio.gather(*(engine.generate_answer_async("Šta je glukoza?", []) for _ in range(3)))
+
+    asyncio.run(scenario())
+    assert fake_llm.kinds().count("generation") == expected
+
+
+@pytest.fixture
+def cached_engine(fake_llm, monkeypatch):
+    """engine sa praznim memorijskim kešom odgovora; brojač planiranja."""
+    import engine
+    from cache import LRUCache
+
+    monkeypatch.setattr(engine, "answer_cache", LRUCache(maxsize=16))
+    plans = []
+    plan = engine._plan_answer
+
+    def counted_plan(question, lab):  # i _plan_answer_async planira kroz _plan_answer
+        plans.append(question)
+        return plan(question, lab)
+
+    monkeypatch.setattr(engine, "_plan_answer", counted_plan)
+    return engine, plans
+
+
+def test_cache_hit_skips_planning(cached_engine):
+    engine, plans = cached_engine
+    rows = [{"analit": "Hemoglobin", "value": 120, "unit": "g/L"}]
+
+    first = asyncio.run(engine.generate_answer_async("Šta je hemoglobin?", rows))
+    assert asyncio.run(engine.generate_answer_async("Šta je hemoglobin?", rows)) == first
+    assert engine.generate_answer("Šta je hemoglobin?", rows) == first
+
+    async def stream():
+        return [e async for e in engine.stream_answer_async("Šta je hemoglobin?", rows)]
+
+    assert asyncio.run(stream()) == [{"event": "delta", "text": first}]
+    assert plans == ["Šta je hemoglobin?"]
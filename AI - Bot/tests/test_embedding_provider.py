@@ -0,0 +1,88 @@
+import types
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+import ingest.local_storage_vector as lsv
+import upstream
+from ingest.local_storage_vector import EmbeddingProvider, HashingEmbeddingProvider
+from upstream import CallStats
+
+
+def test_provider_interface_is_abstract():
+    with pytest.raises(TypeError):
+        EmbeddingProvider()
+
+    class NoEmbed(EmbeddingProvider):
+        name = "x"
+
+    with pytest.raises(TypeError):
+        NoEmbed()
+
+
+def test_hashing_provider_folds_diacritics_like_matcher():
+    provider = HashingEmbeddingProvider()
+    a, b, c = provider.embed(["Gvožđe u serumu", "gvozdje u serumu", "glukoza"])
+    assert a.shape == (provider.dim,)
+    assert np.allclose(a, b)
+    assert not np.allclose(a, c)
+
+
+# ---------------------------------------------------------
+#  embed_texts: ponavljanja su samo u upstream.call_sync
+# ---------------------------------------------------------
+
+_REQUEST = httpx.Request("POST", "http://upstream.test/v1/embeddings")
+
+
+@pytest.fixture
+def openai_embeddings(monkeypatch):
+    """OpenAI provider bez mreže i bez keša; `errors` su greške redom, pa uspjeh."""
+    calls = []
+    errors = []
+
+    def create(model, input, timeout):
+        calls.append(list(input))
+        if errors:
+            raise errors.pop(0)
+        data = [types.SimpleNamespace(index=i, embedding=[1.0, 0.0, 0.0, 0.0]) for i in range(len(input))]
+        return types.SimpleNamespace(data=data)
+
+    monkeypatch.setattr(lsv, "client", types.SimpleNamespace(embeddings=types.SimpleNamespace(create=create)))
+    monkeypatch.setattr(lsv, "embedding_provider", lsv.OpenAIEmbeddingProvider(dim=4))
+    monkeypatch.setattr(lsv, "_embedding_store", None)
+    monkeypatch.setattr(upstream, "call_stats", {call: CallStats(call) for call in upstream.UPSTREAM_TIMEOUTS})
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BASE_DELAY", 0.01)
+    return calls, errors
+
+
+def test_embed_texts_retries_transient_errors_only_in_call_sync(openai_embeddings):
+    calls, errors = openai_embeddings
+    errors.extend([openai.APIConnectionError(request=_REQUEST)] * 50)
+
+    embeddings, failed = lsv.embed_texts(["a", "b"], batch_size=2, concurrency=1)
+    assert embeddings == {} and set(failed) == {0, 1}
+    # jedan batch = najviše 1 + UPSTREAM_MAX_RETRIES zahtjeva, bez drugog sloja ponavljanja
+    assert len(calls) == 1 + upstream.UPSTREAM_MAX_RETRIES
+
+
+def test_embed_texts_does_not_retry_client_errors(openai_embeddings):
+    calls, errors = openai_embeddings
+    response = httpx.Response(400, request=_REQUEST)
+    errors.append(openai.BadRequestError("input too long", response=response, body=None))
+
+    embeddings, failed = lsv.embed_texts(["a", "b", "c"], batch_size=2, concurrency=1)
+    assert len(calls) == 2  # batch sa greškom jednom, drugi batch uspije
+    assert len(failed) == 2 and len(embeddings) == 1
+    assert "input too long" in next(iter(failed.values()))
+
+
+def test_embed_texts_recovers_after_transient_error(openai_embeddings):
+    calls, errors = openai_embeddings
+    errors.append(openai.RateLimitError("slow down", response=httpx.Response(429, request=_REQUEST), body=None))
+
+    embeddings, failed = lsv.embed_texts(["a", "b"], batch_size=2, concurrency=1)
+    assert failed == {} and sorted(embeddings) == [0, 1]
+    assert len(calls) == 2
@@ -0,0 +1,100 @@
+import pytest
+
+from guard_rules import classify_locally, register_canned_answer
+
+
+def _verdict(answer):
+    return classify_locally("Šta znači moj nalaz?", answer)
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "Sve izgleda odlično, ne idi ljekaru, nema razloga za brigu.",
+        "Preskoči kontrolu, vrijednosti su dobre.",
+        "Hemoglobin je protein u crvenim krvnim zrncima.",
+        "Nema razloga za brigu, ovo je sasvim normalno.",
+    ],
+)
+def test_answers_without_rule_hit_are_never_safe_locally(answer):
+    verdict = _verdict(answer)
+    assert verdict is None or verdict["allowed"] is False
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "Sve izgleda odlično, ne idi ljekaru.",
+        "Preskoči kontrolu, vrijednosti su dobre.",
+    ],
+)
+def test_discouraging_doctor_visit_is_unsafe(answer):
+    assert _verdict(answer) == {"allowed": False, "reason": "obeshrabrivanje odlaska ljekaru"}
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "Ukoliko imaš pitanja o bolesti, obrati se ljekaru.",
+        "Ako ti imaš anemiju, ljekar će to utvrditi.",
+        "Ovo ne znači da ti imaš anemiju.",
+        "Samo ljekar može da smanji dozu ili promijeni terapiju.",
+        "Uzmi u obzir da vitamin B12 utiče na nalaz.",
+        "Uzmi u obzir da gvožđe varira tokom dana.",
+        "Vrijednost od 5 mg dnevno je u granicama referentnog opsega.",
+        "Imaš li pitanja o bolesti?",
+    ],
+)
+def test_hedged_or_conditional_answers_escalate(answer):
+    assert _verdict(answer) is None
+
+
+@pytest.mark.parametrize(
+    "answer, reason",
+    [
+        ("Ti imaš anemiju.", "direktna dijagnoza"),
+        ("Imaš blagu anemiju, nije strašno.", "direktna dijagnoza"),
+        ("Ovo nije dijagnoza. Imaš anemiju.", "direktna dijagnoza"),
+        ("Smanji dozu lijeka.", "terapijski savjet"),
+        ("Vrijednosti su dobre, slobodno prekini terapiju.", "terapijski savjet"),
+        ("Preporučena doza je 5 mg dnevno.", "doza lijeka"),
+        ("Dovoljne su 2 tablete dnevno.", "doza lijeka"),
+    ],
+)
+def test_direct_statements_stay_unsafe(answer, reason):
+    assert _verdict(answer) == {"allowed": False, "reason": reason}
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "Uzmi u obzir referentni opseg laboratorije.",
+        "Počni sa praćenjem vrijednosti kroz nekoliko nalaza.",
+        "Popij dosta vode prije vađenja krvi.",
+    ],
+)
+def test_therapy_verb_without_drug_is_not_unsafe(answer):
+    assert _verdict(answer) is None
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        "Uzmi tablete gvožđa svaki dan.",
+        "Počni sa suplementom vitamina D.",
+        "Popij 500 mg paracetamola.",
+        "Preporučujem ti da uzimaš magnezijum.",
+    ],
+)
+def test_therapy_advice_with_drug_is_unsafe(answer):
+    assert _verdict(answer) == {"allowed": False, "reason": "terapijski savjet"}
+
+
+def test_diagnosis_is_unsafe():
+    assert _verdict("Ovo je sigurno anemija.")["allowed"] is False
+
+
+def test_canned_answer_is_safe():
+    text = "Ovo je fiksni odgovor aplikacije za testove."
+    register_canned_answer(text)
+    assert _verdict("  ovo je FIKSNI odgovor aplikacije za testove. ") == {"allowed": True, "reason": ""}
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import threading
+import time
+import types
+
+import pytest
+
+import guardrails
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch, fake_llm):
+    path = tmp_path / "guard_cache.json"
+    monkeypatch.setattr(guardrails, "GUARD_CACHE_FILE", str(path))
+    monkeypatch.setattr(guardrails, "_GUARD_CACHE_SAVE_EVERY", 2)
+    monkeypatch.setattr(guardrails, "_unsaved_verdicts", 0)
+    monkeypatch.setattr(guardrails, "_save_task", None)
+    return path
+
+
+def _slow_save(monkeypatch, seconds):
+    """verdict_cache.save koji traje `seconds`; vraća listu threadova u kojima je pozvan."""
+    threads = []
+    real_save = guardrails.verdict_cache.save
+
+    def save(path):
+        threads.append(threading.get_ident())
+        time.sleep(seconds)
+        real_save(path)
+
+    monkeypatch.setattr(guardrails.verdict_cache, "save", save)
+    return threads
+
+
+def test_async_guard_saves_cache_off_the_event_loop(cache_file, monkeypatch):
+    threads = _slow_save(monkeypatch, 0.3)
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        await guardrails.guard_answer_async("q1", "Hemoglobin je protein.")
+        t0 = time.perf_counter()
+        verdict = await guardrails.guard_answer_async("q2", "Glukoza je šećer.")
+        returned_after = time.perf_counter() - t0
+        await guardrails._save_task
+        return loop_thread, verdict, returned_after
+
+    loop_thread, verdict, returned_after = asyncio.run(scenario())
+    assert verdict["allowed"] is True
+    assert returned_after < 0.2  # odgovor ne čeka snimanje
+    assert len(threads) == 1 and threads[0] != loop_thread
+    assert len(json.loads(cache_file.read_text(encoding="utf-8"))) == 2
+
+
+def test_async_guard_does_not_start_overlapping_saves(cache_file, monkeypatch):
+    threads = _slow_save(monkeypatch, 0.3)
+
+    async def scenario():
+        for i in range(4):
+            await guardrails.guard_answer_async(f"q{i}", f"Odgovor {i}.")
+        await guardrails._save_task
+
+    asyncio.run(scenario())
+    assert len(threads) == 1
+    assert guardrails._unsaved_verdicts == 2  # sledeća odluka pokreće novo snimanje
+
+
+def test_sync_guard_saves_inline(cache_file, monkeypatch):
+    message = types.SimpleNamespace(content="SAFE")
+    completion = types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+    completions = types.SimpleNamespace(create=lambda **kwargs: completion)
+    monkeypatch.setattr(guardrails, "client", types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+
+    guardrails.guard_answer("q1", "Hemoglobin je protein.")
+    assert not cache_file.exists()
+    guardrails.guard_answer("q2", "Glukoza je šećer.")
+    assert cache_file.exists()
+
+
+# ---------------------------------------------------------
+#  STREAMING (guarded_stream, /chat/stream)
+# ---------------------------------------------------------
+
+STREAM_TEXT = "Hemoglobin prenosi kiseonik. Nizak nivo znači anemiju. Obrati se ljekaru"
+
+
+def _tokens(text, closed):
+    """Izvor tokena riječ po riječ; u `closed` upisuje kad je zatvoren."""
+
+    async def gen():
+        try:
+            for word in text.split(" "):
+                yield word + " "
+                await asyncio.sleep(0)
+        finally:
+            closed.append(True)
+
+    return gen()
+
+
+def _fake_guard(monkeypatch, reject_if=None):
+    """guard_answer_async bez modela; vraća listu tekstova koji su išli na provjeru."""
+    checked = []
+
+    async def guard(question, answer):
+        checked.append(answer)
+        if reject_if and reject_if in answer:
+            return {"allowed": False, "reason": "test"}
+        return {"allowed": True, "reason": "ok"}
+
+    monkeypatch.setattr(guardrails, "guard_answer_async", guard)
+    return checked
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+def test_guarded_stream_emits_only_checked_prefixes(monkeypatch):
+    checked = _fake_guard(monkeypatch)
+    closed = []
+    events = asyncio.run(_collect(guardrails.guarded_stream("q", _tokens(STREAM_TEXT, closed), min_chars=10)))
+
+    assert len(events) > 1 and all(e["event"] == "delta" for e in events)
+    shown = ""
+    for event in events:
+        shown += event["text"]
+        assert shown in checked  # klijent nikad ne vidi neprovjeren tekst
+    assert shown == STREAM_TEXT + " "
+    assert closed == [True]
+
+
+def test_guarded_stream_replaces_and_closes_source_on_rejection(monkeypatch):
+    _fake_guard(monkeypatch, reject_if="anemiju")
+    closed = []
+    events = asyncio.run(_collect(guardrails.guarded_stream("q", _tokens(STREAM_TEXT, closed), min_chars=10)))
+
+    assert events[-1] == {"event": "replace", "text": guardrails.SAFE_FALLBACK_MESSAGE, "reason": "test"}
+    assert all("anemiju" not in e["text"] for e in events[:-1])
+    assert closed == [True]
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_chat_stream_sends_deltas_then_done(api, fake_llm):
+    fake_llm.answer = STREAM_TEXT
+    response = api.post("/chat/stream", json={"question": "Šta je hemoglobin?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+    assert events[-1][0] == "done"
+    deltas = [data["text"] for event, data in events[:-1] if event == "delta"]
+    assert deltas and "".join(deltas) == events[-1][1]["answer"]
+    assert events[-1][1]["answer"].strip() == STREAM_TEXT
+
+
+def test_chat_stream_releases_admission_slot_when_client_leaves(fake_llm, monkeypatch):
+    import app
+    import upstream
+
+    fake_llm.answer = " ".join([STREAM_TEXT + "."] * 50)  # model još šalje kad stigne prvi događaj
+    limiter = upstream.AdmissionLimiter("generation", limit=1, queue_max=0, timeout=0.1)
+    monkeypatch.setitem(upstream.admission, "generation", limiter)
+    body = json.dumps({"question": "Šta je hemoglobin?"}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/chat/stream",
+        "raw_path": b"/chat/stream",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+
+    async def scenario():
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            # klijent je otišao prije nego što je stigao ijedan bajt tijela
+            if message["type"] == "http.response.start":
+                raise OSError("client disconnected")
+
+        # dok greška (i njen traceback) živi, generator ne pokupi GC – mjesto
+        # mora biti oslobođeno zatvaranjem, ne finalizacijom generatora
+        with pytest.raises(Exception) as error:
+            await app.app(scope, receive, send)
+        return error, limiter.admitted, limiter.in_flight
+
+    _, admitted, in_flight = asyncio.run(scenario())
+    assert admitted == 1
+    assert in_flight == 0
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+
+from lab_columns import LabColumns, _numbers, normalize_lab_rows
+
+
+def _stats_by_name(rows):
+    return {s.analit: s for s in LabColumns(rows).stats()}
+
+
+def test_numbers_fast_path_and_text_fallback():
+    assert _numbers([1, 2.5, None]).tolist()[:2] == [1.0, 2.5]
+    values = _numbers([" 5,2", "<5", 3])
+    assert values[0] == 5.2 and math.isnan(values[1]) and values[2] == 3.0
+
+
+def test_list_value_becomes_nan_instead_of_2d_array():
+    values = _numbers([[1, 2]])
+    assert values.ndim == 1 and math.isnan(values[0])
+    values = _numbers([[1, 2], 120])
+    assert values.shape == (2,) and math.isnan(values[0]) and values[1] == 120.0
+
+
+def test_stats_with_list_value_row():
+    stats = _stats_by_name([
+        {"analit": "Hemoglobin", "value": [1, 2]},
+        {"analit": "Hemoglobin", "value": 130, "date": "2024-01-01"},
+    ])
+    hb = stats["Hemoglobin"]
+    assert hb.n_rows == 2 and hb.n_values == 1
+    assert hb.last["value"] == 130
+
+
+def test_list_date_falls_back_to_string_keys():
+    stats = _stats_by_name([{"analit": "Hb", "value": 120, "date": ["2024"]}])
+    assert stats["Hb"].n_values == 1
+
+
+def test_trend_and_out_of_range():
+    rows = [
+        {"analit": "Glukoza", "value": v, "ref_low": 3.9, "ref_high": 6.1, "date": f"2024-0{i + 1}-01"}
+        for i, v in enumerate([5.0, 6.0, 7.0])
+    ]
+    g = _stats_by_name(rows)["Glukoza"]
+    assert g.trend == "porast"
+    assert np.isclose(g.slope, 1.0)
+    assert g.out_of_range == 1
+    assert g.min == 5.0 and g.max == 7.0
+
+
+def test_summary_with_list_value_does_not_fail():
+    import engine
+
+    text = engine.summarize_lab_rows([{"analit": "Hemoglobin", "value": [1, 2]}])
+    assert "Hemoglobin" in text
+
+
+def test_normalize_lab_rows_drops_rows_without_analit():
+    rows = normalize_lab_rows([{"Analit": "Hb", "Vrijednost": 120}, {"value": 1}, "x"])
+    assert rows == [{"analit": "Hb", "value": 120}]
+
+
+def test_chat_overall_with_list_value_row(api):
+    response = api.post(
+        "/chat",
+        json={"question": "Kakvo je moje opšte stanje?", "lab_rows": [{"analit": "Hemoglobin", "value": [1, 2]}]},
+    )
+    assert response.status_code == 200
+    assert response.json()["answer"]
@@ -0,0 +1,125 @@
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+import engine
+import prompt_budget
+from prompt_budget import ContextPiece, count_tokens, fit_pieces
+
+MODULE_FILE = Path(prompt_budget.__file__)
+
+
+def _load_prompt_budget(monkeypatch, tiktoken_module):
+    """Svjež primjerak prompt_budget modula uz zadati tiktoken (None = nije instaliran)."""
+    monkeypatch.setitem(sys.modules, "tiktoken", tiktoken_module)
+    spec = importlib.util.spec_from_file_location("prompt_budget_under_test", MODULE_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _piece(section, tokens, priority, truncatable=False):
+    # procjena: riječ od 4 slova = 1 token, pa je cijena dijela tačno poznata
+    return ContextPiece(section, " ".join(["abcd"] * tokens), priority, truncatable)
+
+
+@pytest.fixture
+def estimate(monkeypatch):
+    """Brojanje procjenom, kao bez tiktoken-a, da cijene dijelova ne zavise od okruženja."""
+    monkeypatch.setattr(prompt_budget, "_ENCODING", None)
+
+
+# ---------------------------------------------------------
+#  BROJANJE TOKENA
+# ---------------------------------------------------------
+
+def test_estimate_is_used_without_tiktoken(monkeypatch):
+    module = _load_prompt_budget(monkeypatch, None)
+    assert module.TOKEN_COUNTER == "estimate"
+    assert module._ENCODING is None
+    # riječi ~4 znaka po tokenu, interpunkcija 1 token
+    assert module.count_tokens("Hemoglobin je 120 g/L.") == 3 + 1 + 1 + 1 + 1 + 1 + 1
+    assert module.count_tokens("") == 0
+
+
+def test_estimate_is_used_when_encoding_is_unavailable(monkeypatch):
+    def get_encoding(name):
+        raise OSError("nema mreže za preuzimanje enkodinga")
+
+    module = _load_prompt_budget(monkeypatch, types.SimpleNamespace(get_encoding=get_encoding))
+    assert module.TOKEN_COUNTER == "estimate"
+    assert module.PromptStats().stats()["counter"] == "estimate"
+
+
+def test_tiktoken_is_used_when_available(monkeypatch):
+    encoding = types.SimpleNamespace(encode=lambda text: list(text), decode=lambda ids: "".join(ids))
+    module = _load_prompt_budget(monkeypatch, types.SimpleNamespace(get_encoding=lambda name: encoding))
+    assert module.TOKEN_COUNTER == "tiktoken"
+    assert module.count_tokens("abcd efgh") == 9
+
+
+def test_estimate_truncation_fits_budget(estimate):
+    text = " ".join(f"red{i} vrijednost" for i in range(200))
+    cut = prompt_budget.truncate_to_tokens(text, 50)
+    assert cut.endswith(" …")
+    assert count_tokens(cut) <= 50 + 1
+
+
+# ---------------------------------------------------------
+#  IZBOR DIJELOVA (fit_pieces / PROMPT_TOKEN_BUDGET)
+# ---------------------------------------------------------
+
+def test_everything_fits_within_budget(estimate):
+    pieces = [_piece("a", 10, 1), _piece("b", 10, 2)]
+    chosen, dropped, truncated = fit_pieces(pieces, 100)
+    assert chosen == pieces and dropped == [] and not truncated
+
+
+def test_lowest_priority_pieces_are_dropped_first(estimate):
+    pieces = [_piece("nisko", 30, 3), _piece("visoko", 30, 1), _piece("srednje", 30, 2)]
+    chosen, dropped, truncated = fit_pieces(pieces, 65)
+    # izabrani ostaju u originalnom redoslijedu
+    assert [p.section for p in chosen] == ["visoko", "srednje"]
+    assert [p.section for p in dropped] == ["nisko"]
+    assert not truncated
+
+
+def test_smaller_piece_still_fits_after_a_skipped_one(estimate):
+    pieces = [_piece("veliki", 80, 1), _piece("mali", 5, 2)]
+    chosen, dropped, _ = fit_pieces(pieces, 50)
+    assert [p.section for p in chosen] == ["mali"]
+    assert [p.section for p in dropped] == ["veliki"]
+
+
+def test_truncatable_piece_is_cut_to_the_remaining_budget(estimate):
+    pieces = [_piece("fiksni", 20, 1), _piece("dug", 500, 1, truncatable=True)]
+    chosen, dropped, truncated = fit_pieces(pieces, 200)
+    assert truncated and dropped == []
+    assert sum(count_tokens(p.text) + 1 for p in chosen) <= 200 + 1
+    assert chosen[1].text.endswith(" …")
+
+
+def test_short_remainder_drops_instead_of_truncating(estimate):
+    pieces = [_piece("fiksni", 90, 1), _piece("dug", 500, 2, truncatable=True)]
+    chosen, dropped, truncated = fit_pieces(pieces, 100)
+    assert [p.section for p in dropped] == ["dug"] and not truncated
+
+
+def test_budgeted_request_respects_prompt_token_budget(estimate, monkeypatch):
+    monkeypatch.setattr(engine, "PROMPT_TOKEN_BUDGET", 120)
+    pieces = [_piece(f"dio{i}", 30, i) for i in range(5)]
+
+    def render(chosen, omitted):
+        context = "\n\n".join(p.text for p in chosen)
+        return [{"role": "system", "content": "Sistem."}, {"role": "user", "content": context}]
+
+    request, report = engine._budgeted_request("test", pieces, render, 0.2)
+    assert report.prompt_tokens <= 120
+    assert report.pieces_dropped >= 1
+    assert report.pieces_included + report.pieces_dropped == len(pieces)
+    kept = request["messages"][1]["content"]
+    # ostaju najvažniji dijelovi (manji priority)
+    assert kept.startswith(pieces[0].text)
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from retrieval import HybridRetriever, rrf_fuse
+
+DOCS = [
+    {"id": "hb", "text": "hemoglobin protein u eritrocitima prenosi kiseonik"},
+    {"id": "glu", "text": "glukoza secer u krvi energija"},
+    {"id": "chol", "text": "holesterol masnoca u krvi srce"},
+]
+
+
+def _retriever(semantic, **kwargs):
+    def vector_search(query, k):
+        return semantic
+
+    return HybridRetriever(DOCS, text_fn=lambda d: d["text"], vector_search=vector_search, bm25_min_score=0.5, **kwargs)
+
+
+def test_rrf_fuse_rewards_agreement():
+    fused = dict(rrf_fuse([["a", "b"], ["b", "c"]]))
+    assert fused["b"] > fused["a"] > fused["c"]
+
+
+def test_without_agreement_single_list_hit_passes():
+    retriever = _retriever([("chol", 0.9)])
+    ids = [d["id"] for d in retriever.search("kiseonik")]
+    assert ids == ["hb", "chol"]
+
+
+def test_agreement_keeps_only_docs_found_by_both():
+    retriever = _retriever([("chol", 0.9), ("hb", 0.5)], require_agreement=True)
+    assert [d["id"] for d in retriever.search("kiseonik")] == ["hb"]
+
+
+def test_agreement_without_vector_stage_returns_nothing():
+    lexical_only = HybridRetriever(DOCS, text_fn=lambda d: d["text"], bm25_min_score=0.5)
+    assert [d["id"] for d in lexical_only.search("kiseonik")] == ["hb"]
+
+    lexical_only.require_agreement = True
+    assert lexical_only.search("kiseonik") == []
+
+
+def test_min_rrf_score_is_configurable():
+    strict = _retriever([("chol", 0.9)], min_rrf_score=2.0 / (60 + 3))
+    assert strict.search("kiseonik") == []
+
+
+def test_timings_per_stage_and_vector_budget():
+    def slow(query, k):
+        time.sleep(0.2)
+        return [("hb", 0.9)]
+
+    retriever = HybridRetriever(
+        DOCS, text_fn=lambda d: d["text"], vector_search=slow, vector_budget_s=0.01, bm25_min_score=0.5
+    )
+    timings = {}
+    assert [d["id"] for d in retriever.search("kiseonik", timings=timings)] == ["hb"]
+    assert set(timings) == {"lexical", "vector", "fusion"}
+    assert timings["vector"] == pytest.approx(0.01)
+
+
+def test_engine_reports_retrieval_stages(monkeypatch):
+    import engine
+    from metrics import start_timings
+
+    monkeypatch.setattr(engine, "_vector_search_analiti", lambda q, k: [])
+    monkeypatch.setattr(engine, "_ANALITI_HYBRID", None)
+    timings = start_timings()
+    engine.retrieve_analiti("protein koji prenosi kiseonik")
+    assert {"retrieval_lexical", "retrieval_vector", "retrieval_fusion"} <= set(timings)
+
+
+def test_debug_header_carries_retrieval_timings(api, monkeypatch):
+    import engine
+
+    monkeypatch.setattr(engine, "_vector_search_analiti", lambda q, k: [])
+    monkeypatch.setattr(engine, "_ANALITI_HYBRID", None)
+    response = api.post(
+        "/chat", json={"question": "protein koji prenosi kiseonik"}, headers={"X-LabGuard-Debug": "1"}
+    )
+    assert response.status_code == 200
+    assert "retrieval_lexical" in response.json()["timings"]
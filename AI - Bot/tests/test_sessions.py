@@ -0,0 +1,130 @@
+import pytest
+
+import cache
+import sessions
+from sessions import SessionStore
+
+ROWS = [
+    {"analit": "Hemoglobin", "value": 130, "unit": "g/L", "date": "2024-01-01"},
+    {"analit": "Glukoza", "value": 5.4, "unit": "mmol/L", "date": "2024-01-01"},
+]
+NEW_ROW = {"analit": "Hemoglobin", "value": 118, "unit": "g/L", "date": "2024-03-01"}
+
+
+class Clock:
+    """Zamjena za time.time (keš i sesije dijele isti time modul)."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    """Svježe skladište sesija (oba backenda), i kao session_store za API."""
+    import app
+
+    store = SessionStore(request.param, maxsize=10, ttl=60, path=tmp_path / "sessions.sqlite3")
+    monkeypatch.setattr(sessions, "session_store", store)
+    monkeypatch.setattr(app, "session_store", store)
+    return store
+
+
+def _create(api, rows=ROWS):
+    response = api.post("/sessions", json={"lab_rows": rows})
+    assert response.status_code == 201
+    return response.json()
+
+
+# ---------------------------------------------------------
+#  ŽIVOTNI CIKLUS PREKO API-ja
+# ---------------------------------------------------------
+
+def test_create_session(api, store, clock):
+    info = _create(api)
+    assert info["session_id"] and info["fingerprint"]
+    assert info["rows"] == 2 and info["analytes"] == 2
+    assert info["ttl"] == 60
+    assert store.created == 1
+
+
+def test_session_is_reused_by_id(api, store, clock, fake_llm):
+    info = _create(api)
+    assert api.get(f"/sessions/{info['session_id']}").json()["fingerprint"] == info["fingerprint"]
+
+    for question in ("Šta je hemoglobin?", "Kakva mi je glukoza?"):
+        response = api.post("/chat", json={"question": question, "session_id": info["session_id"]})
+        assert response.status_code == 200
+    assert store.created == 1  # pitanja ne prave nove sesije
+    # redovi su se pripremili jednom, pri kreiranju
+    assert store.stats()["contexts"]["size"] == 1
+
+
+def test_chat_with_changed_fingerprint_is_conflict(api, store, clock, fake_llm):
+    info = _create(api)
+    appended = api.post(f"/sessions/{info['session_id']}/rows", json={"lab_rows": [NEW_ROW]}).json()
+    assert appended["rows"] == 3 and appended["fingerprint"] != info["fingerprint"]
+
+    stale = {"question": "Šta je hemoglobin?", "session_id": info["session_id"], "fingerprint": info["fingerprint"]}
+    assert api.post("/chat", json=stale).status_code == 409
+    fresh = {**stale, "fingerprint": appended["fingerprint"]}
+    assert api.post("/chat", json=fresh).status_code == 200
+
+
+def test_session_expires_after_ttl(api, store, clock, fake_llm):
+    info = _create(api)
+    clock.now += 59
+    assert api.get(f"/sessions/{info['session_id']}").status_code == 200
+    clock.now += 2
+    assert api.get(f"/sessions/{info['session_id']}").status_code == 404
+    response = api.post("/chat", json={"question": "Šta je hemoglobin?", "session_id": info["session_id"]})
+    assert response.status_code == 404
+
+
+def test_unknown_session_is_404(api, store, fake_llm):
+    assert api.get("/sessions/nepostojeca").status_code == 404
+    assert api.post("/sessions/nepostojeca/rows", json={"lab_rows": ROWS}).status_code == 404
+    assert api.delete("/sessions/nepostojeca").status_code == 404
+    response = api.post("/chat", json={"question": "Šta je hemoglobin?", "session_id": "nepostojeca"})
+    assert response.status_code == 404
+
+
+def test_deleted_session_is_gone(api, store, clock):
+    info = _create(api)
+    assert api.delete(f"/sessions/{info['session_id']}").status_code == 200
+    assert api.get(f"/sessions/{info['session_id']}").status_code == 404
+
+
+# ---------------------------------------------------------
+#  LabContext: redovi se čitaju samo kada treba
+# ---------------------------------------------------------
+
+def test_lab_context_reads_rows_only_on_context_miss(store, monkeypatch):
+    session = store.create(ROWS)
+    reads = []
+    real_get = store.get
+
+    def get(session_id):
+        reads.append(session_id)
+        return real_get(session_id)
+
+    monkeypatch.setattr(store, "get", get)
+
+    lab = store.lab_context(session.session_id)
+    assert lab is not None and lab.fingerprint == session.fingerprint
+    assert store.lab_context(session.session_id) is lab
+    assert reads == []  # LabContext je već pripremljen pri kreiranju – samo otisak
+
+    store._contexts.clear()  # npr. drugi worker proces, ili izbačen iz LRU-a
+    assert store.lab_context(session.session_id).fingerprint == session.fingerprint
+    assert reads == [session.session_id]
+    assert store.lab_context("nepostojeca") is None
@@ -0,0 +1,81 @@
+import pytest
+
+from text_match import AhoCorasick, fold_diacritics, stem
+
+
+@pytest.mark.parametrize(
+    "token, expected",
+    [
+        ("hemoglobina", "hemoglobin"),
+        ("hemoglobinom", "hemoglobin"),
+        ("holesterola", "holesterol"),
+        ("glukoze", "glukoz"),
+        ("leukocitima", "leukocit"),
+        ("hdl", "hdl"),
+        ("hba1c", "hba1c"),
+    ],
+)
+def test_stem(token, expected):
+    assert stem(token) == expected
+
+
+def test_fold_diacritics():
+    assert fold_diacritics("Gvožđe Šećer") == "gvozdje secer"
+    assert fold_diacritics("gvožđe", dj="d") == "gvozde"
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return AhoCorasick.from_terms(
+        [("hemoglobin", "HB"), ("holesterol", "CHOL"), ("ldl holesterol", "LDL"), ("gvožđe", "FE"), ("hb", "HB")]
+    )
+
+
+def _found(matcher, text):
+    return [(text[m.start:m.end], m.payload) for m in matcher.search(text)]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("nizak nivo hemoglobina", [("hemoglobina", "HB")]),
+        ("povisen holesterola", [("holesterola", "CHOL")]),
+        ("Koliko gvožđa imam?", [("gvožđa", "FE")]),
+        ("koliko gvozda", [("gvozda", "FE")]),
+        ("sa hemoglobinom", [("hemoglobinom", "HB")]),
+    ],
+)
+def test_inflected_final_token(matcher, text, expected):
+    assert _found(matcher, text) == expected
+
+
+def test_multi_word_term_with_inflected_last_token(matcher):
+    assert _found(matcher, "LDL holesterola je visok") == [
+        ("LDL holesterola", "LDL"),
+        ("holesterola", "CHOL"),
+    ]
+
+
+@pytest.mark.parametrize("text", ["hemoglobinski", "holesterolemija", "hba", "hbs"])
+def test_no_match_for_other_words(matcher, text):
+    assert matcher.search(text) == []
+
+
+def test_short_terms_stay_exact(matcher):
+    assert _found(matcher, "hb je nizak") == [("hb", "HB")]
+
+
+def test_rebuild_does_not_duplicate():
+    ac = AhoCorasick.from_terms([("hemoglobin", 1)])
+    ac.add("holesterol", 2)
+    assert [m.payload for m in ac.search("hemoglobina i holesterola")] == [1, 2]
+    ac.build()
+    assert len(ac.search("hemoglobina")) == 1
+
+
+def test_engine_matches_inflected_question():
+    import engine
+
+    names = [d["name"] for d in engine._match_analiti_in_question("Šta znači nizak nivo hemoglobina i povišen holesterola?")]
+    assert any("emoglobin" in n for n in names)
+    assert any("olesterol" in n for n in names)
@@ -0,0 +1,242 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+import upstream
+from upstream import AdmissionLimiter, CallStats, DeadlineExceeded, Overloaded, call_async, call_sync, start_deadline
+
+_REQUEST = httpx.Request("POST", "http://upstream.test/v1/chat/completions")
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    """Svježa CallStats po vrsti poziva i kratke pauze između pokušaja."""
+    fresh = {call: CallStats(call) for call in upstream.UPSTREAM_TIMEOUTS}
+    monkeypatch.setattr(upstream, "call_stats", fresh)
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BASE_DELAY", 0.01)
+    return fresh
+
+
+def _in_deadline(seconds, coro_fn):
+    async def run():
+        start_deadline(seconds)
+        return await coro_fn()
+
+    return asyncio.run(run())
+
+
+async def _hold(limiter, seconds=0.05):
+    async with limiter.slot():
+        await asyncio.sleep(seconds)
+
+
+def test_limiter_works_across_event_loops():
+    limiter = AdmissionLimiter("test", limit=1, queue_max=4, timeout=1.0)
+
+    async def contended():
+        await asyncio.gather(_hold(limiter), _hold(limiter))
+
+    asyncio.run(contended())
+    asyncio.run(contended())  # ranije: semafor vezan za prvi loop -> RuntimeError
+    assert limiter.admitted == 4
+    assert limiter.in_flight == 0
+
+
+def test_limiter_rejects_when_queue_is_full():
+    limiter = AdmissionLimiter("test", limit=1, queue_max=1, timeout=1.0)
+
+    async def scenario():
+        return await asyncio.gather(*(_hold(limiter) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    rejected = [r for r in results if isinstance(r, Overloaded)]
+    assert len(rejected) == 1 and rejected[0].reason == "queue_full"
+    assert rejected[0].retry_after >= 1
+    assert limiter.stats()["rejected"] == {"queue_full": 1, "timeout": 0}
+
+
+def test_limiter_rejects_after_queue_timeout():
+    limiter = AdmissionLimiter("test", limit=1, queue_max=4, timeout=0.01)
+
+    async def scenario():
+        return await asyncio.gather(_hold(limiter, 0.2), _hold(limiter), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert results[0] is None
+    assert isinstance(results[1], Overloaded) and results[1].reason == "timeout"
+    assert limiter.waiting == 0
+
+
+def test_chat_returns_503_with_retry_after_when_overloaded(api, monkeypatch):
+    limiter = AdmissionLimiter("generation", limit=1, queue_max=1, timeout=1.0)
+    limiter.waiting = 1  # red je već pun
+    monkeypatch.setitem(upstream.admission, "generation", limiter)
+
+    response = api.post("/chat", json={"question": "Šta je hemoglobin?"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert limiter.rejected["queue_full"] == 1
+
+
+# ---------------------------------------------------------
+#  PONAVLJANJA, ROK, HEDGING (call_async / call_sync)
+# ---------------------------------------------------------
+
+def test_transient_errors_are_retried(stats):
+    attempts = []
+
+    async def flaky(timeout):
+        attempts.append(timeout.read)
+        if len(attempts) < 3:
+            raise openai.APIConnectionError(request=_REQUEST)
+        return "ok"
+
+    assert _in_deadline(10, lambda: call_async("guard", flaky)) == "ok"
+    assert stats["guard"].retries == 2 and stats["guard"].attempts == 3
+    assert all(t <= upstream.UPSTREAM_TIMEOUTS["guard"] for t in attempts)
+
+
+def test_client_errors_are_not_retried(stats):
+    attempts = []
+
+    async def bad(timeout):
+        attempts.append(timeout)
+        raise openai.BadRequestError("bad", response=httpx.Response(400, request=_REQUEST), body=None)
+
+    with pytest.raises(openai.BadRequestError):
+        _in_deadline(10, lambda: call_async("guard", bad))
+    assert len(attempts) == 1 and stats["guard"].failed == 1
+
+
+def test_retry_after_header_is_respected(stats):
+    attempts = []
+
+    async def limited(timeout):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            response = httpx.Response(429, request=_REQUEST, headers={"retry-after": "0.3"})
+            raise openai.RateLimitError("slow down", response=response, body=None)
+        return "ok"
+
+    assert _in_deadline(10, lambda: call_async("guard", limited)) == "ok"
+    assert attempts[1] - attempts[0] >= 0.3
+
+
+def test_stalled_call_ends_at_the_deadline(stats):
+    async def stall(timeout):
+        await asyncio.sleep(30)
+
+    t0 = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        _in_deadline(1.0, lambda: call_async("guard", stall))
+    assert time.perf_counter() - t0 < 1.5
+    assert stats["guard"].deadline_exceeded == 1
+
+
+def test_generation_leaves_reserve_for_guard(stats, monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_GUARD_RESERVE", 0.6)
+
+    async def stall(timeout):
+        await asyncio.sleep(30)
+
+    t0 = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        _in_deadline(1.6, lambda: call_async("generation", stall))
+    assert time.perf_counter() - t0 < 1.3
+
+
+def test_no_attempt_without_enough_deadline(stats):
+    attempts = []
+
+    async def send(timeout):
+        attempts.append(timeout)
+        return "ok"
+
+    with pytest.raises(DeadlineExceeded):
+        _in_deadline(upstream.UPSTREAM_MIN_ATTEMPT / 2, lambda: call_async("guard", send))
+    assert attempts == []
+
+
+def _warm(call_stats, n=30, seconds=0.02):
+    """Prozor latencija (za p95) i broj poziva, kao poslije n brzih poziva."""
+    for _ in range(n):
+        call_stats.observe(seconds)
+    call_stats.calls = n
+
+
+def test_hedge_wins_when_first_attempt_stalls(stats):
+    _warm(stats["guard"])
+    started = []
+
+    async def first_stalls(timeout):
+        started.append(time.perf_counter())
+        if len(started) == 1:
+            await asyncio.sleep(20)
+        await asyncio.sleep(0.02)
+        return "hedged"
+
+    t0 = time.perf_counter()
+    assert _in_deadline(None, lambda: call_async("guard", first_stalls)) == "hedged"
+    assert time.perf_counter() - t0 < 1.0
+    assert stats["guard"].hedges == 1 and stats["guard"].hedge_wins == 1
+
+
+def test_hedge_respects_budget_and_flag(stats):
+    _warm(stats["guard"], n=20)
+    stats["guard"].hedges = 2  # budžet: 5% od 21 poziva (~1 hedge) je već potrošen
+
+    async def slow(timeout):
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    assert _in_deadline(None, lambda: call_async("guard", slow)) == "ok"
+    assert stats["guard"].hedges == 2
+
+    _warm(stats["generation"])
+    assert _in_deadline(None, lambda: call_async("generation", slow, hedge=False)) == "ok"
+    assert stats["generation"].hedges == 0 and stats["generation"].attempts == 1
+
+
+def test_no_hedge_before_enough_samples(stats):
+    assert stats["guard"].hedge_delay() is None
+    _warm(stats["guard"])
+    assert stats["guard"].hedge_delay() == pytest.approx(max(upstream.UPSTREAM_HEDGE_MIN_DELAY, 0.02))
+
+
+def test_sync_call_retries_timeouts(stats):
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 2:
+            raise openai.APITimeoutError(request=_REQUEST)
+        return "ok"
+
+    assert call_sync("embedding", flaky) == "ok"
+    assert stats["embedding"].retries == 1 and stats["embedding"].attempts == 2
+
+
+def test_sync_timeout_without_retries_left_is_deadline_exceeded(stats, monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_MAX_RETRIES", 0)
+
+    def timeout_once(timeout):
+        raise openai.APITimeoutError(request=_REQUEST)
+
+    with pytest.raises(DeadlineExceeded):
+        call_sync("embedding", timeout_once)
+
+
+def test_chat_returns_504_when_model_misses_deadline(api, fake_llm, stats, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "CHAT_DEADLINE_S", 1.2)
+    monkeypatch.setattr(upstream, "UPSTREAM_GUARD_RESERVE", 0.2)
+    fake_llm.delay = 5.0
+
+    t0 = time.perf_counter()
+    response = api.post("/chat", json={"question": "Šta je hemoglobin?"})
+    assert response.status_code == 504
+    assert time.perf_counter() - t0 < 2.0
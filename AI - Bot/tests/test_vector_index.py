@@ -0,0 +1,90 @@
+import json
+import pickle
+
+import pytest
+
+import ingest.local_storage_vector as lsv
+
+
+def _docs(n, changed=()):
+    return [
+        {
+            "id": f"a{i}",
+            "type": "analit_info",
+            "name": f"Analit {i}",
+            "short_description": f"opis {i}" + (" izmijenjen" if i in changed else ""),
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def local_build(tmp_path, monkeypatch):
+    """build_vector_index nad tmp fajlovima i lokalnim (hashing) embeddingom."""
+    monkeypatch.setattr(lsv, "embedding_provider", lsv.HashingEmbeddingProvider(dim=64))
+    monkeypatch.setattr(lsv, "_embedding_store", None)
+    monkeypatch.setattr(lsv, "STORAGE_FILE", tmp_path / "knowledge_analiti.json")
+    monkeypatch.setattr(lsv, "VECTOR_INDEX_FILE", tmp_path / "vector_index.faiss")
+    monkeypatch.setattr(lsv, "DOCS_METADATA_FILE", tmp_path / "docs_metadata.pkl")
+
+    def build(docs, mode="flat", incremental=True):
+        monkeypatch.setattr(lsv, "VECTOR_INDEX_MODE", mode)
+        lsv.STORAGE_FILE.write_text(json.dumps(docs), encoding="utf-8")
+        return lsv.build_vector_index(incremental=incremental)
+
+    return build
+
+
+def test_effective_mode_falls_back_to_flat():
+    assert lsv.effective_index_mode("ivfpq", 10) == "flat"
+    assert lsv.effective_index_mode("IVFPQ", 256) == "ivfpq"
+    assert lsv.effective_index_mode("hnsw", 1) == "hnsw"
+    with pytest.raises(ValueError):
+        lsv.effective_index_mode("nope", 10)
+
+
+def test_incremental_reuses_downgraded_ivf_build(local_build):
+    first = local_build(_docs(12), mode="ivfpq", incremental=False)
+    assert first["embedded"] == 12
+
+    second = local_build(_docs(12), mode="ivfpq")
+    assert second == {"indexed": 12, "embedded": 0, "failed": []}
+
+
+def test_incremental_embeds_only_changed(local_build):
+    local_build(_docs(8), incremental=False)
+    report = local_build(_docs(9, changed={2}))
+    assert report["embedded"] == 2  # izmijenjen a2 + novi a8
+    assert report["indexed"] == 9
+
+
+def test_duplicate_ids_get_unique_keys(local_build):
+    docs = _docs(3)
+    docs[2]["id"] = "a0"
+    local_build(docs, incremental=False)
+    with open(lsv.DOCS_METADATA_FILE, "rb") as f:
+        keys = [m["doc_key"] for m in pickle.load(f)]
+    assert keys == ["a0", "a1", "a0#2"]
+
+
+def test_index_is_replaced_before_metadata(local_build, monkeypatch):
+    replaced = []
+    real_replace = lsv.os.replace
+    monkeypatch.setattr(lsv.os, "replace", lambda src, dst: (replaced.append(dst), real_replace(src, dst)))
+    local_build(_docs(3), incremental=False)
+    assert replaced == [lsv.VECTOR_INDEX_FILE, lsv.DOCS_METADATA_FILE]
+
+
+def test_incremental_drops_vectors_left_by_interrupted_write(local_build, monkeypatch):
+    local_build(_docs(3), incremental=False)
+    with open(lsv.DOCS_METADATA_FILE, "rb") as f:
+        old_metadata = pickle.load(f)
+
+    # pad između dva os.replace: novi index (5 dokumenata) sa starim metadata (3)
+    local_build(_docs(5))
+    with open(lsv.DOCS_METADATA_FILE, "wb") as f:
+        pickle.dump(old_metadata, f)
+
+    report = local_build(_docs(5))
+    assert report["embedded"] == 2
+    assert report["indexed"] == 5  # bez duplih vektora za a3, a4
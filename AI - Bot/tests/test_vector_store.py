@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from ingest.vector_store import MmapVectorStore
+
+
+def _key(i):
+    return hashlib.sha256(f"tekst {i}".encode("utf-8")).hexdigest()
+
+
+def _vec(i, dim=8):
+    return np.full(dim, float(i), dtype=np.float32)
+
+
+def test_put_get_and_reopen(tmp_path):
+    store = MmapVectorStore(tmp_path, dim=8)
+    assert store.get(_key(0)) is None
+    assert store.put_many({_key(i): _vec(i) for i in range(3)}) == 3
+    assert store.put_many({_key(1): _vec(99), _key(3): _vec(3)}) == 1  # postojeći ključ se preskače
+
+    assert np.array_equal(store.get(_key(1)), _vec(1))
+    assert _key(3) in store and len(store) == 4
+
+    reopened = MmapVectorStore(tmp_path, dim=8)
+    assert len(reopened) == 4
+    assert np.array_equal(reopened.get(_key(3)), _vec(3))
+    assert json.loads((tmp_path / "meta.json").read_text()) == {"dim": 8, "dtype": "float32", "count": 4}
+
+
+def test_dimension_checks(tmp_path):
+    store = MmapVectorStore(tmp_path, dim=8)
+    with pytest.raises(ValueError):
+        store.put(_key(0), np.zeros(4))
+    store.put(_key(0), _vec(0))
+    with pytest.raises(ValueError):
+        MmapVectorStore(tmp_path, dim=16)
+
+
+def test_float16_store_returns_float32(tmp_path):
+    store = MmapVectorStore(tmp_path, dim=8, dtype="float16")
+    store.put(_key(0), _vec(0.5))
+    vec = store.get(_key(0))
+    assert vec.dtype == np.float32 and np.allclose(vec, 0.5)
+    assert (tmp_path / "vectors.bin").stat().st_size == 8 * 2
+
+
+def test_uncommitted_tail_is_ignored_and_truncated(tmp_path):
+    store = MmapVectorStore(tmp_path, dim=8)
+    store.put(_key(0), _vec(0))
+    # pad usred upisa: redovi dopisani, meta.json nije potvrdio novi count
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(_vec(7).tobytes())
+    with open(tmp_path / "keys.bin", "ab") as f:
+        f.write(bytes.fromhex(_key(7)))
+
+    reopened = MmapVectorStore(tmp_path, dim=8)
+    assert reopened.get(_key(7)) is None
+    reopened.put(_key(1), _vec(1))
+    assert (tmp_path / "vectors.bin").stat().st_size == 2 * 8 * 4
+    assert np.array_equal(reopened.get(_key(1)), _vec(1))
+
+
+def test_concurrent_get_during_put_many(tmp_path):
+    store = MmapVectorStore(tmp_path, dim=8)
+    keys = [_key(i) for i in range(400)]
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            for i in range(0, len(keys), 7):
+                try:
+                    vec = store.get(keys[i])
+                except Exception as e:  # IndexError / TypeError prije ispravke
+                    errors.append(e)
+                    return
+                if vec is not None and vec[0] != i:
+                    errors.append(AssertionError(f"red {i}: {vec[0]}"))
+                    return
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for start in range(0, len(keys), 5):
+        store.put_many({keys[i]: _vec(i) for i in range(start, start + 5)})
+    done.set()
+    for t in readers:
+        t.join()
+
+    assert errors == []
+    assert len(store) == len(keys)
+
+
+@pytest.mark.parametrize("existing", [0, 2])
+def test_get_never_sees_key_before_its_row(tmp_path, existing):
+    store = MmapVectorStore(tmp_path, dim=8)
+    if existing:
+        store.put_many({_key(i): _vec(i) for i in range(existing)})
+    results = []
+
+    class Hooked(dict):
+        """Čitalac iz drugog threada kreće tačno kad put_many objavi novi ključ."""
+
+        def __setitem__(self, raw_key, row):
+            super().__setitem__(raw_key, row)
+            reader = threading.Thread(target=lambda: results.append(_safe_get(store, raw_key.hex())))
+            reader.start()
+            reader.join(0.2)
+            readers.append(reader)
+
+    readers = []
+    store._ensure_key_index()
+    store._key_index = Hooked(store._key_index)
+    store.put(_key(existing), _vec(existing))
+    for reader in readers:
+        reader.join()
+
+    assert len(results) == 1
+    assert isinstance(results[0], np.ndarray) and results[0][0] == existing
+
+
+def _safe_get(store, key):
+    try:
+        return store.get(key)
+    except Exception as e:
+        return e
@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+
+from lab_columns import normalize_lab_rows
+from wire import WireError, decode_body, decode_lab_columns, encode_lab_columns
+
+ROWS = [
+    {"analit": "Hemoglobin", "value": 120, "unit": "g/L", "ref_low": 130, "date": "2024-01-01"},
+    {"analit": "Hemoglobin", "value": 125, "unit": "g/L", "ref_low": 130, "date": "2024-03-01"},
+    {"analit": "Glukoza", "value": 5.2, "unit": "mmol/L", "date": "2024-03-01"},
+]
+
+
+def test_roundtrip_matches_normalized_rows():
+    assert decode_lab_columns(encode_lab_columns(ROWS)) == normalize_lab_rows(ROWS)
+
+
+def test_every_column_with_null_still_decodes_all_rows():
+    columns = {
+        "analit": ["Hemoglobin", None, "Glukoza"],
+        "value": [120, 125, None],
+        "unit": [None, "g/L", "mmol/L"],
+    }
+    # srednji red nema analit i otpada, ostali ostaju (ranije je rezultat bio [])
+    assert decode_lab_columns(columns) == [
+        {"analit": "Hemoglobin", "value": 120},
+        {"analit": "Glukoza", "unit": "mmol/L"},
+    ]
+
+
+def test_sparse_value_column_keeps_rows():
+    columns = {"analit": ["Hemoglobin", "Glukoza"], "value": [None, 5.2]}
+    assert decode_lab_columns(columns) == [{"analit": "Hemoglobin"}, {"analit": "Glukoza", "value": 5.2}]
+
+
+def test_dictionary_encoded_text_columns():
+    columns = {"dicts": {"analit": ["Hemoglobin", "Glukoza"]}, "analit": [0, 1, 0], "value": [120, 5.2, 125]}
+    assert [r["analit"] for r in decode_lab_columns(columns)] == ["Hemoglobin", "Glukoza", "Hemoglobin"]
+
+
+@pytest.mark.parametrize("name", ["value", "unit", "ref_low"])
+def test_length_mismatch_is_400(name):
+    columns = {"analit": ["Hemoglobin", "Glukoza"], name: [None]}
+    with pytest.raises(WireError) as e:
+        decode_lab_columns(columns)
+    assert e.value.status == 400
+
+
+@pytest.mark.parametrize(
+    "columns",
+    [
+        {"analit": ["Hemoglobin"], "value": ["120"]},
+        {"analit": [0], "dicts": {"analit": ["Hemoglobin"]}, "value": [1], "unit": [3]},
+        {"dicts": {"value": [1]}, "analit": ["Hemoglobin"], "value": [0]},
+        {"value": [1]},
+    ],
+)
+def test_type_errors_are_422(columns):
+    with pytest.raises(WireError) as e:
+        decode_lab_columns(columns)
+    assert e.value.status == 422
+
+
+def test_decode_body_gzip():
+    payload, size = decode_body(gzip.compress(b'{"question": "x"}'), "gzip")
+    assert payload == {"question": "x"} and size == 17
+
+
+def test_chat_rejects_mismatched_columns(api):
+    body = {"question": "Šta je hemoglobin?", "lab_columns": {"analit": ["Hemoglobin", "Glukoza"], "value": [120]}}
+    assert api.post("/chat", json=body).status_code == 400
+
+
+def test_chat_accepts_columns_with_nulls_everywhere(api, fake_llm):
+    body = {
+        "question": "Šta je hemoglobin?",
+        "lab_columns": {"analit": ["Hemoglobin", None], "value": [None, 5.2]},
+    }
+    assert api.post("/chat", json=body).status_code == 200
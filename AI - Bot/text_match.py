@@ -0,0 +1,171 @@
+"""
+Pomoćne funkcije za poređenje teksta: skidanje dijakritika, tokenizacija
+i Aho–Corasick automat nad tokenima (višestruko traženje izraza u jednom prolazu).
+
+Zadnja riječ izraza se poredi po osnovi (stem), pa se pogađaju i padeži:
+"nizak nivo hemoglobina", "povišen holesterola", "gvožđa".
+"""
+
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, List, NamedTuple, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# padežni nastavci (bez dijakritika), duži prije kraćih
+_ENDINGS = ("ima", "ama", "om", "em", "og", "oj", "a", "e", "i", "o", "u")
+# osnova kraća od ovoga se ne skraćuje ("hb", "hdl", "ldl" ostaju tačni)
+_MIN_STEM = 4
+
+
+def fold_diacritics(text: str, dj: str = "dj") -> str:
+    """
+    lowercase + bez dijakritika: č/ć -> c, š -> s, ž -> z, đ -> `dj`.
+
+    `đ` nema Unicode dekompoziciju, pa se mijenja ručno ("gvožđe" -> "gvozdje").
+    """
+    text = (text or "").lower().replace("đ", dj)
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Tokeni (folded_token, start, end) – pozicije su u ORIGINALNOM tekstu."""
+    return [
+        (fold_diacritics(m.group()), m.start(), m.end())
+        for m in _TOKEN_RE.finditer(text or "")
+    ]
+
+
+def stem(token: str) -> str:
+    """
+    Folded token bez padežnog nastavka: "hemoglobina" -> "hemoglobin",
+    "glukoze" -> "glukoz". Tokeni sa ciframa i kratki tokeni ostaju isti.
+    """
+    if not token.isalpha():
+        return token
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= _MIN_STEM:
+            return token[: -len(ending)]
+    return token
+
+
+def term_variants(term: str) -> List[Tuple[str, ...]]:
+    """
+    Tokenizovane varijante izraza za automat. Za `đ` dodajemo i varijantu
+    sa `d` jer se bez dijakritika piše i "gvozdje" i "gvozde".
+    """
+    variants = []
+    for dj in ("dj", "d"):
+        tokens = tuple(_TOKEN_RE.findall(fold_diacritics(term, dj=dj)))
+        if tokens and tokens not in variants:
+            variants.append(tokens)
+    return variants
+
+
+class Match(NamedTuple):
+    start: int  # pozicija u originalnom tekstu
+    end: int
+    term: str  # izraz (ime/sinonim) koji je pogođen, kako je zadat
+    payload: Any
+
+
+class AhoCorasick:
+    """
+    Aho–Corasick automat nad TOKENIMA (ne znakovima), pa se izrazi poklapaju
+    samo na granicama riječi ("hb" ne pogađa unutar dužih riječi).
+
+    Svi tokeni izraza osim zadnjeg su ivice automata (tačno poređenje);
+    zadnji se poredi po osnovi (stem): "hemoglobin u krvi" pogađa i
+    "hemoglobin u krvima", a "hemoglobin" i "hemoglobina", "hemoglobinom".
+
+    Upotreba:
+        ac = AhoCorasick()
+        ac.add("hemoglobin u krvi", payload)
+        ac.build()
+        ac.search("šta je hemoglobin u krvi?")  # -> [Match(...)]
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        # izlazi čvora po osnovi zadnjeg tokena: stem -> [(dužina u tokenima, izraz, payload)];
+        # _own su izrazi dodati baš u taj čvor, _out i izlazi sa fail lanca (puni build)
+        self._own: List[Dict[str, List[Tuple[int, str, Any]]]] = [{}]
+        self._out: List[Dict[str, List[Tuple[int, str, Any]]]] = [{}]
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def add(self, term: str, payload: Any) -> None:
+        for tokens in term_variants(term):
+            node = 0
+            for tok in tokens[:-1]:
+                nxt = self._goto[node].get(tok)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][tok] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._own.append({})
+                    self._out.append({})
+                node = nxt
+            self._own[node].setdefault(stem(tokens[-1]), []).append((len(tokens), term, payload))
+        self._built = False
+
+    @staticmethod
+    def _merged(own: Dict[str, list], inherited: Dict[str, list]) -> Dict[str, list]:
+        out = {key: list(outputs) for key, outputs in own.items()}
+        for key, outputs in inherited.items():
+            out.setdefault(key, []).extend(outputs)
+        return out
+
+    def build(self) -> None:
+        """BFS izgradnja fail linkova; izlazi se spajaju duž fail lanca."""
+        queue = deque()
+        self._out[0] = self._merged(self._own[0], {})
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            self._out[child] = self._merged(self._own[child], self._out[0])
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for tok, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and tok not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(tok, 0)
+                self._out[child] = self._merged(self._own[child], self._out[self._fail[child]])
+        self._built = True
+
+    def search(self, text: str) -> List[Match]:
+        """Svi pogoci u jednom linearnom prolazu, sortirani po poziciji."""
+        if not self._built:
+            self.build()
+
+        tokens = tokenize(text)
+        matches: List[Match] = []
+        node = 0
+        for i, (tok, _, end) in enumerate(tokens):
+            # čvor pokriva prethodne tokene; trenutni token zatvara izraz po osnovi
+            for length, term, payload in self._out[node].get(stem(tok), ()):
+                start = tokens[i - length + 1][1]
+                matches.append(Match(start, end, term, payload))
+            while node and tok not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(tok, 0)
+
+        matches.sort(key=lambda m: (m.start, -m.end))
+        return matches
+
+    @classmethod
+    def from_terms(cls, terms: Iterable[Tuple[str, Any]]) -> "AhoCorasick":
+        ac = cls()
+        for term, payload in terms:
+            ac.add(term, payload)
+        ac.build()
+        return ac
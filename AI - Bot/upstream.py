@@ -0,0 +1,812 @@
+"""
+Zajednički HTTP klijent prema OpenAI API-ju: generisanje (engine), guard
+(guardrails) i embeddings (ingest/local_storage_vector) idu kroz isti pool
+konekcija, umjesto da svaki modul pravi svoj OpenAI(...) klijent sa
+podrazumijevanim podešavanjima.
+
+- pool: UPSTREAM_MAX_CONNECTIONS konekcija, od kojih se do
+  UPSTREAM_MAX_KEEPALIVE drži otvoreno (keep-alive) UPSTREAM_KEEPALIVE_EXPIRY s,
+  pa se TLS handshake plaća jednom po konekciji, a ne po pozivu;
+- HTTP/2 (UPSTREAM_HTTP2) ako je instaliran paket h2 – više poziva kroz
+  jednu konekciju;
+- timeout po vrsti poziva: call_timeout("generation" | "guard" | "embedding");
+- warm_up(): otvara konekcije pri startu servera, prije prvog pitanja;
+- pool_stats(): u letu / vršno / čekanje na slobodnu konekciju, nove
+  konekcije i TLS handshake-ovi (za /health i /metrics).
+- admit("generation" | "guard"): ograničen broj istovremenih poziva modela
+  po vrsti, sa ograničenim redom čekanja; ko ne dobije mjesto na vrijeme
+  dobija Overloaded (app.py -> 503 sa Retry-After) umjesto da zatrpa API;
+- call_async / call_sync: poziv modela u roku zahtjeva (start_deadline, kroz
+  contextvar): timeout pokušaja je ograničen preostalim rokom, ponavljanja
+  (sa jitterom) samo dok ima roka, a opciono i "hedge" – drugi, isti zahtjev
+  kada prvi traje duže od posmatranog p95. SDK sam ne ponavlja (max_retries=0).
+
+Sinhroni i asinhroni klijent ne mogu dijeliti konekcije (httpx), pa postoje
+dva poola sa istim ograničenjima: "sync" (embeddings pri izgradnji indexa,
+generate_answer) i "async" (/chat, /chat/stream, guard).
+
+Vrijeme čekanja na konekciju mjeri se preko httpcore "trace" ekstenzije: od
+ulaska zahtjeva u transport do prvog događaja na konekciji (nova TCP
+konekcija ili slanje headera kroz postojeću).
+"""
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, OpenAI
+
+from metrics import observe_stage, registry
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # opciona zavisnost – HTTP/2 (pip install httpx[http2])
+    h2 = None
+
+load_dotenv()
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+# Pool konekcija (zajednički za sve vrste poziva)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "64"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "32"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "1") != "0" and h2 is not None
+
+# Timeouti u sekundama; read timeout zavisi od vrste poziva (call_timeout)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "10"))
+UPSTREAM_TIMEOUTS = {
+    "generation": float(os.getenv("UPSTREAM_TIMEOUT_GENERATION", "60")),
+    "guard": float(os.getenv("UPSTREAM_TIMEOUT_GUARD", "20")),
+    "embedding": float(os.getenv("UPSTREAM_TIMEOUT_EMBEDDING", "30")),
+}
+
+# Admission control: najviše poziva modela istovremeno po vrsti, najviše
+# čekalaca u redu, i koliko se najduže čeka na mjesto (s)
+UPSTREAM_CONCURRENCY = {
+    "generation": int(os.getenv("UPSTREAM_CONCURRENCY_GENERATION", "32")),
+    "guard": int(os.getenv("UPSTREAM_CONCURRENCY_GUARD", "32")),
+}
+UPSTREAM_QUEUE_MAX = int(os.getenv("UPSTREAM_QUEUE_MAX", "64"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "5"))
+
+# Ponavljanja poziva modela (samo dok ima roka): najviše pokušaja poslije
+# prvog, osnova i plafon eksponencijalnog backoff-a sa punim jitterom (s)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.25"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "4"))
+# pokušaj sa manje roka od ovoga se ni ne šalje (s)
+UPSTREAM_MIN_ATTEMPT = float(os.getenv("UPSTREAM_MIN_ATTEMPT", "0.5"))
+# rok koji generisanje ostavlja guard provjeri koja slijedi (s)
+UPSTREAM_GUARD_RESERVE = float(os.getenv("UPSTREAM_GUARD_RESERVE", "3"))
+
+# Hedging: drugi, isti zahtjev kada prvi traje duže od p95 poslednjih
+# poziva te vrste; najviše UPSTREAM_HEDGE_MAX_RATIO poziva dobija hedge
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "1") != "0"
+UPSTREAM_HEDGE_MAX_RATIO = float(os.getenv("UPSTREAM_HEDGE_MAX_RATIO", "0.05"))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY", "0.05"))
+_LATENCY_WINDOW = 256
+
+# Koliko konekcija warm_up() otvori unaprijed (0 = bez zagrijavanja)
+UPSTREAM_WARMUP_CONNECTIONS = int(os.getenv("UPSTREAM_WARMUP_CONNECTIONS", "4"))
+
+# čekanje na konekciju do ovog praga se ne računa kao čekanje (samo overhead poola)
+_WAIT_THRESHOLD_S = 0.001
+
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+pool_wait_seconds = registry.histogram(
+    "labguard_upstream_pool_wait_seconds",
+    "Čekanje na konekciju prema modelu (uključuje otvaranje nove)",
+    ["pool"],
+    POOL_WAIT_BUCKETS,
+)
+
+queue_wait_seconds = registry.histogram(
+    "labguard_upstream_queue_wait_seconds",
+    "Čekanje na mjesto za poziv modela (admission control)",
+    ["call"],
+    POOL_WAIT_BUCKETS,
+)
+
+
+T = TypeVar("T")
+
+
+def call_timeout(call: str, seconds: Optional[float] = None) -> httpx.Timeout:
+    """
+    Timeout za jedan poziv modela po vrsti ("generation" | "guard" | "embedding");
+    `seconds` ga dodatno skraćuje (npr. na preostali rok zahtjeva).
+    """
+    limit = UPSTREAM_TIMEOUTS.get(call, UPSTREAM_TIMEOUTS["generation"])
+    if seconds is not None:
+        limit = min(limit, seconds)
+    return httpx.Timeout(
+        limit,
+        connect=min(UPSTREAM_CONNECT_TIMEOUT, limit),
+        pool=min(UPSTREAM_POOL_TIMEOUT, limit),
+    )
+
+
+# ---------------------------------------------------------
+#  ROK ZAHTJEVA
+# ---------------------------------------------------------
+
+class DeadlineExceeded(Exception):
+    """Poziv modela nije uspio u roku zahtjeva (app.py -> 504)."""
+
+    def __init__(self, call: str):
+        super().__init__(f"Model nije odgovorio u roku zahtjeva ({call})")
+        self.call = call
+
+
+# apsolutni rok (time.monotonic) tekućeg zahtjeva; vide ga i taskovi i asyncio.to_thread
+_deadline: ContextVar[Optional[float]] = ContextVar("labguard_deadline", default=None)
+
+
+def start_deadline(seconds: Optional[float]) -> Optional[float]:
+    """Postavlja rok za tekući kontekst (None ili 0 = bez roka); vraća apsolutni rok."""
+    at = time.monotonic() + seconds if seconds else None
+    _deadline.set(at)
+    return at
+
+
+def set_deadline(at: Optional[float]) -> None:
+    """Vraća rok dobijen od start_deadline (npr. u generatoru SSE streama)."""
+    _deadline.set(at)
+
+
+def remaining() -> Optional[float]:
+    """Sekunde do roka tekućeg zahtjeva (može biti negativno) ili None ako roka nema."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+# ---------------------------------------------------------
+#  STATISTIKA POOLA
+# ---------------------------------------------------------
+
+class PoolStats:
+    """Brojači jednog poola (thread-safe); zahtjev je "u letu" dok se ne zatvori tijelo odgovora."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0  # zahtjevi koji su zatekli sve konekcije zauzete
+        self.waited = 0  # zahtjevi koji su čekali konekciju duže od _WAIT_THRESHOLD_S
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= UPSTREAM_MAX_CONNECTIONS:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, error: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if error:
+                self.errors += 1
+
+    def acquired(self, wait_s: float) -> None:
+        pool_wait_seconds.observe(wait_s, pool=self.name)
+        with self._lock:
+            if wait_s > _WAIT_THRESHOLD_S:
+                self.waited += 1
+            self.wait_s += wait_s
+            self.max_wait_s = max(self.max_wait_s, wait_s)
+
+    def event(self, name: str) -> None:
+        with self._lock:
+            if name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            elif name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": round(self.in_flight / UPSTREAM_MAX_CONNECTIONS, 3),
+                "saturated": self.saturated,
+                "waited": self.waited,
+                "avg_wait_ms": round(self.wait_s / requests * 1000.0, 3) if requests else 0.0,
+                "max_wait_ms": round(self.max_wait_s * 1000.0, 3),
+                "connections_opened": self.connections_opened,
+                "tls_handshakes": self.tls_handshakes,
+                # udio poziva koji su dobili već otvorenu konekciju
+                "reuse_ratio": round(1.0 - self.connections_opened / requests, 3) if requests else 0.0,
+            }
+
+
+sync_pool = PoolStats("sync")
+async_pool = PoolStats("async")
+
+
+class _Probe:
+    """Prati jedan zahtjev kroz pool: prvi događaj na konekciji = konekcija dobijena."""
+
+    __slots__ = ("pool", "t0", "acquired")
+
+    def __init__(self, pool: PoolStats):
+        self.pool = pool
+        self.t0 = time.perf_counter()
+        self.acquired = False
+
+    def on_event(self, name: str) -> None:
+        if not self.acquired and name.endswith(".started") and (
+            name.startswith("connection.") or "send_request_headers" in name
+        ):
+            self.acquired = True
+            self.pool.acquired(time.perf_counter() - self.t0)
+        self.pool.event(name)
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, done: Callable[[], None]):
+        self._stream = stream
+        self._done = done
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._done()
+
+
+class _AsyncTrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, done: Callable[[], None]):
+        self._stream = stream
+        self._done = done
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._done()
+
+
+def _once(fn: Callable[[], None]) -> Callable[[], None]:
+    called = False
+
+    def wrapper() -> None:
+        nonlocal called
+        if not called:
+            called = True
+            fn()
+
+    return wrapper
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        probe = _Probe(sync_pool)
+        request.extensions.setdefault("trace", lambda name, info: probe.on_event(name))
+        sync_pool.begin()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            sync_pool.end(error=True)
+            raise
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, _once(sync_pool.end)),
+            extensions=response.extensions,
+        )
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        probe = _Probe(async_pool)
+
+        async def trace(name: str, info: Dict[str, Any]) -> None:
+            probe.on_event(name)
+
+        request.extensions.setdefault("trace", trace)
+        async_pool.begin()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            async_pool.end(error=True)
+            raise
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_AsyncTrackedStream(response.stream, _once(async_pool.end)),
+            extensions=response.extensions,
+        )
+
+
+# ---------------------------------------------------------
+#  ADMISSION CONTROL
+# ---------------------------------------------------------
+
+class Overloaded(Exception):
+    """Poziv modela nije dobio mjesto (pun red ili isteklo čekanje); `retry_after` u sekundama."""
+
+    def __init__(self, call: str, reason: str, retry_after: int):
+        super().__init__(f"Previše istovremenih poziva modela ({call}: {reason})")
+        self.call = call
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    Najviše `limit` poziva u letu; do `queue_max` ih čeka na red (FIFO), a
+    ostali se odbijaju odmah. Čekanje je ograničeno timeout-om, pa pod
+    preopterećenjem latencija raste do granice, a ne bez kraja.
+
+    Retry-After se procjenjuje iz dužine reda i prosječnog trajanja poziva.
+    Sve metode se zovu iz event loop-a, pa brojačima ne treba lock.
+
+    Semafor se pravi tek u slot(), po event loop-u koji ga koristi: limiter
+    nastaje pri importu, a asyncio.Semaphore se veže za prvi loop na kojem
+    se čeka (TestClient, asyncio.run u skriptama i testovima prave nove).
+    """
+
+    def __init__(self, call: str, limit: int, queue_max: int, timeout: float):
+        self.call = call
+        self.limit = max(1, limit)
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._service_s = 1.0  # EWMA trajanja poziva, za Retry-After
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil((self.waiting + 1) / self.limit * self._service_s))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.rejected[reason] += 1
+        return Overloaded(self.call, reason, self.retry_after())
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        t0 = time.perf_counter()
+        semaphore = self._semaphore()
+        if semaphore.locked() or self.waiting:
+            if self.waiting >= self.queue_max:
+                raise self._reject("queue_full")
+            timeout = self.timeout if timeout is None else timeout
+            budget = remaining()
+            if budget is not None:
+                # na mjesto se ne čeka duže od roka zahtjeva
+                timeout = min(timeout, max(0.0, budget))
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("timeout") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await semaphore.acquire()
+
+        waited = time.perf_counter() - t0
+        queue_wait_seconds.observe(waited, call=self.call)
+        observe_stage("admission", waited)
+        self.admitted += 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+            self._service_s = 0.8 * self._service_s + 0.2 * (time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "queue_max": self.queue_max,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_call_ms": round(self._service_s * 1000.0, 1),
+        }
+
+
+admission = {
+    call: AdmissionLimiter(call, limit, UPSTREAM_QUEUE_MAX, UPSTREAM_QUEUE_TIMEOUT)
+    for call, limit in UPSTREAM_CONCURRENCY.items()
+}
+
+
+def admit(call: str, timeout: Optional[float] = None):
+    """`async with admit("generation"):` oko poziva modela (i cijelog streama)."""
+    return admission[call].slot(timeout)
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {call: limiter.stats() for call, limiter in admission.items()}
+
+
+# ---------------------------------------------------------
+#  KLIJENTI
+# ---------------------------------------------------------
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+
+
+http_client = httpx.Client(
+    transport=_CountingTransport(limits=_limits(), http2=UPSTREAM_HTTP2),
+    timeout=call_timeout("generation"),
+)
+async_http_client = httpx.AsyncClient(
+    transport=_AsyncCountingTransport(limits=_limits(), http2=UPSTREAM_HTTP2),
+    timeout=call_timeout("generation"),
+)
+
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=OPENAI_BASE_URL,
+    http_client=http_client,
+    timeout=call_timeout("generation"),
+    max_retries=0,  # ponavljanja rade call_sync / call_async, u roku zahtjeva
+)
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=OPENAI_BASE_URL,
+    http_client=async_http_client,
+    timeout=call_timeout("generation"),
+    max_retries=0,
+)
+
+
+# ---------------------------------------------------------
+#  POZIVI U ROKU: TIMEOUT PO POKUŠAJU, PONAVLJANJA, HEDGING
+# ---------------------------------------------------------
+
+class CallStats:
+    """Pokušaji, ponavljanja i hedge-ovi jedne vrste poziva + prozor latencija za p95."""
+
+    def __init__(self, call: str):
+        self.call = call
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.failed = 0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < UPSTREAM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Poslije koliko sekundi ide hedge (None = ne ide: isključen, malo uzoraka ili budžet potrošen)."""
+        if not UPSTREAM_HEDGE or self.hedges >= UPSTREAM_HEDGE_MAX_RATIO * max(1, self.calls):
+            return None
+        p95 = self.p95()
+        return None if p95 is None else max(UPSTREAM_HEDGE_MIN_DELAY, p95)
+
+    def count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "failed": self.failed,
+            "p95_ms": round(p95 * 1000.0, 1) if p95 is not None else None,
+        }
+
+
+call_stats = {call: CallStats(call) for call in UPSTREAM_TIMEOUTS}
+
+# greške posle kojih ima smisla pokušati ponovo (mreža, timeout, 429, 5xx)
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.APIConnectionError,  # uključuje APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+_TIMEOUTS = (asyncio.TimeoutError, openai.APITimeoutError)
+
+
+def _budget(call: str) -> Optional[float]:
+    """Rok za ovaj poziv: preostali rok zahtjeva, minus rezerva za guard poslije generisanja."""
+    budget = remaining()
+    if budget is not None and call == "generation":
+        budget -= UPSTREAM_GUARD_RESERVE
+    return budget
+
+
+def _attempt_budget(stats: CallStats) -> float:
+    """Timeout sledećeg pokušaja; DeadlineExceeded ako roka više nema."""
+    budget = _budget(stats.call)
+    if budget is not None and budget < UPSTREAM_MIN_ATTEMPT:
+        stats.count("deadline_exceeded")
+        raise DeadlineExceeded(stats.call)
+    limit = UPSTREAM_TIMEOUTS.get(stats.call, UPSTREAM_TIMEOUTS["generation"])
+    return limit if budget is None else min(limit, budget)
+
+
+def _retry_delay(stats: CallStats, attempt: int, exc: Exception) -> float:
+    """
+    Pauza prije sledećeg pokušaja (pun jitter, uz Retry-After od 429); greška
+    se baca dalje ako nije prolazna, ako su pokušaji potrošeni ili ako posle
+    pauze ne bi ostalo roka za još jedan pokušaj.
+    """
+    if not isinstance(exc, _RETRYABLE) or attempt >= UPSTREAM_MAX_RETRIES:
+        stats.count("failed")
+        if isinstance(exc, _TIMEOUTS):
+            raise DeadlineExceeded(stats.call) from exc
+        raise exc
+    delay = random.uniform(0.0, min(UPSTREAM_RETRY_MAX_DELAY, UPSTREAM_RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(exc, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("retry-after", 0)))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    budget = _budget(stats.call)
+    if budget is not None and budget - delay < UPSTREAM_MIN_ATTEMPT:
+        stats.count("deadline_exceeded")
+        raise DeadlineExceeded(stats.call) from exc
+    stats.count("retries")
+    return delay
+
+
+async def _hedged_attempt(
+    stats: CallStats, send: Callable[[httpx.Timeout], Awaitable[T]], timeout: float, hedge: bool
+) -> T:
+    """Jedan pokušaj sa ukupnim timeout-om; ako traje duže od p95, šalje se i drugi, isti zahtjev."""
+    t0 = time.perf_counter()
+
+    def start(seconds: float) -> asyncio.Task:
+        stats.count("attempts")
+        return asyncio.ensure_future(asyncio.wait_for(send(call_timeout(stats.call, seconds)), seconds))
+
+    delay = stats.hedge_delay() if hedge else None
+    primary = start(timeout)
+    tasks = {primary}
+    try:
+        if delay is not None and delay < timeout - UPSTREAM_MIN_ATTEMPT:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                stats.count("hedges")
+                tasks.add(start(timeout - delay))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        stats.count("hedge_wins")
+                    stats.observe(time.perf_counter() - t0)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_async(
+    call: str, send: Callable[[httpx.Timeout], Awaitable[T]], hedge: bool = True
+) -> T:
+    """
+    Poziv modela u roku tekućeg zahtjeva. `send(timeout)` šalje jedan
+    zahtjev sa datim httpx timeout-om, npr.
+
+        await call_async("guard", lambda timeout: async_client.chat.completions.create(**req, timeout=timeout))
+
+    Prolazne greške se ponavljaju dok ima roka; timeout bez roka za novi
+    pokušaj -> DeadlineExceeded. hedge=False za streamove (duplikat bi
+    poslao drugi, različit tekst).
+    """
+    stats = call_stats[call]
+    stats.count("calls")
+    attempt = 0
+    while True:
+        timeout = _attempt_budget(stats)
+        try:
+            return await _hedged_attempt(stats, send, timeout, hedge)
+        except Exception as exc:
+            delay = _retry_delay(stats, attempt, exc)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def call_sync(call: str, send: Callable[[httpx.Timeout], T]) -> T:
+    """Sinhrona varijanta call_async (bez hedginga); ukupno trajanje pokušaja ograničava httpx timeout."""
+    stats = call_stats[call]
+    stats.count("calls")
+    attempt = 0
+    while True:
+        timeout = _attempt_budget(stats)
+        t0 = time.perf_counter()
+        stats.count("attempts")
+        try:
+            result = send(call_timeout(call, timeout))
+        except Exception as exc:
+            delay = _retry_delay(stats, attempt, exc)
+        else:
+            stats.observe(time.perf_counter() - t0)
+            return result
+        attempt += 1
+        time.sleep(delay)
+
+
+def call_stats_snapshot() -> Dict[str, Any]:
+    return {call: stats.stats() for call, stats in call_stats.items()}
+
+
+async def warm_up(connections: int = UPSTREAM_WARMUP_CONNECTIONS) -> Dict[str, Any]:
+    """
+    Otvara `connections` konekcija u async poolu (TCP + TLS) istovremenim
+    GET /models pozivima, da ih prvi korisnici ne plaćaju. Status odgovora
+    je nebitan; greška (npr. API nedostupan) se samo prijavljuje.
+    """
+    if connections <= 0:
+        return {"connections": 0}
+    t0 = time.perf_counter()
+    url = f"{OPENAI_BASE_URL.rstrip('/')}/models"
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY') or ''}"}
+    results = await asyncio.gather(
+        *(async_http_client.get(url, headers=headers, timeout=call_timeout("guard")) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    return {
+        "connections": connections,
+        "errors": len(errors),
+        "error": repr(errors[0]) if errors else None,
+        "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    }
+
+
+async def aclose() -> None:
+    await async_http_client.aclose()
+    http_client.close()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        "base_url": OPENAI_BASE_URL,
+        "http2": UPSTREAM_HTTP2,
+        "max_connections": UPSTREAM_MAX_CONNECTIONS,
+        "max_keepalive": UPSTREAM_MAX_KEEPALIVE,
+        "keepalive_expiry": UPSTREAM_KEEPALIVE_EXPIRY,
+        "timeouts": dict(UPSTREAM_TIMEOUTS),
+        "sync": sync_pool.stats(),
+        "async": async_pool.stats(),
+    }
+
+
+def _collect_metrics():
+    pools = (sync_pool, async_pool)
+    stats = {pool.name: pool.stats() for pool in pools}
+
+    def samples(key: str) -> List:
+        return [({"pool": name}, s[key]) for name, s in stats.items()]
+
+    limiters = admission_stats()
+    calls = call_stats_snapshot()
+
+    def per_call(key: str) -> List:
+        return [({"call": call}, st[key]) for call, st in calls.items()]
+
+    return [
+        ("labguard_upstream_retries_total", "counter", "Ponovljeni pozivi modela", per_call("retries")),
+        ("labguard_upstream_hedges_total", "counter", "Hedge zahtjevi (duplikat sporog poziva)", per_call("hedges")),
+        ("labguard_upstream_hedge_wins_total", "counter", "Hedge zahtjevi koji su stigli prvi", per_call("hedge_wins")),
+        (
+            "labguard_upstream_deadline_exceeded_total",
+            "counter",
+            "Pozivi modela prekinuti jer je istekao rok zahtjeva",
+            per_call("deadline_exceeded"),
+        ),
+        (
+            "labguard_upstream_queue_depth",
+            "gauge",
+            "Pozivi modela koji čekaju na mjesto (admission control)",
+            [({"call": call}, st["waiting"]) for call, st in limiters.items()],
+        ),
+        (
+            "labguard_upstream_admitted_in_flight",
+            "gauge",
+            "Primljeni pozivi modela u toku",
+            [({"call": call}, st["in_flight"]) for call, st in limiters.items()],
+        ),
+        (
+            "labguard_upstream_rejected_total",
+            "counter",
+            "Odbijeni pozivi modela (pun red / isteklo čekanje)",
+            [
+                ({"call": call, "reason": reason}, count)
+                for call, st in limiters.items()
+                for reason, count in st["rejected"].items()
+            ],
+        ),
+        ("labguard_upstream_in_flight", "gauge", "Pozivi modela u letu", samples("in_flight")),
+        ("labguard_upstream_peak_in_flight", "gauge", "Najviše poziva modela u letu", samples("peak_in_flight")),
+        (
+            "labguard_upstream_saturated_total",
+            "counter",
+            "Pozivi koji su zatekli sve konekcije zauzete",
+            samples("saturated"),
+        ),
+        (
+            "labguard_upstream_connections_opened_total",
+            "counter",
+            "Nove TCP konekcije prema modelu",
+            samples("connections_opened"),
+        ),
+        ("labguard_upstream_tls_handshakes_total", "counter", "TLS handshake-ovi", samples("tls_handshakes")),
+        ("labguard_upstream_errors_total", "counter", "Greške transporta", samples("errors")),
+    ]
+
+
+registry.register_collector(_collect_metrics)
@@ -0,0 +1,251 @@
+"""
+Ulazni format zahtjeva: dekompresija tijela (gzip / deflate / br), JSON i
+kolonski zapis nalaza.
+
+Kolonski zapis (`lab_columns` umjesto `lab_rows`) šalje paralelne nizove
+umjesto objekta po redu, a tekstualne kolone mogu biti kodirane rječnikom
+(indeksi u tabelu iz `dicts`):
+
+    {
+      "question": "...",
+      "lab_columns": {
+        "dicts":   {"analit": ["Hemoglobin", "Glukoza"], "unit": ["g/L", "mmol/L"]},
+        "analit":  [0, 0, 1],
+        "unit":    [0, 0, 1],
+        "value":   [120, 125, 5.2],
+        "ref_low": [130, 130, 3.9],
+        "date":    ["2024-01-01", "2024-03-01", "2024-03-01"]
+      }
+    }
+
+Nedostajuća kolona = sve null. Rezultat su redovi sa kanonskim ključevima,
+isti kao lab_columns.normalize_lab_rows (bez praznih polja i bez redova bez analita).
+"""
+
+import json
+import os
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from lab_columns import normalize_lab_rows
+
+try:
+    import orjson
+except ImportError:  # opciona zavisnost – brži JSON parser
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # opciona zavisnost – Content-Encoding: br
+    brotli = None
+
+# najveće tijelo zahtjeva poslije dekompresije
+MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_BYTES", str(8 * 1024 * 1024)))
+
+TEXT_COLUMNS = ("analit", "unit", "status", "date", "source")
+NUMBER_COLUMNS = ("value", "ref_low", "ref_high")
+
+
+class WireError(ValueError):
+    """Neispravno tijelo zahtjeva; `status` je HTTP status za odgovor."""
+
+    def __init__(self, message: str, status: int = 422):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------------------------
+#  TIJELO ZAHTJEVA
+# ---------------------------------------------------------
+
+def _inflate(body: bytes, wbits: int) -> bytes:
+    d = zlib.decompressobj(wbits)
+    try:
+        out = d.decompress(body, MAX_REQUEST_BODY_BYTES + 1)
+    except zlib.error as e:
+        raise WireError(f"Neispravno kompresovano tijelo: {e}", 400)
+    if len(out) > MAX_REQUEST_BODY_BYTES or d.unconsumed_tail:
+        raise WireError("Tijelo zahtjeva je preveliko", 413)
+    return out
+
+
+def decompress_body(body: bytes, content_encoding: Optional[str]) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        data = _inflate(body, 16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        data = _inflate(body, zlib.MAX_WBITS)
+    elif encoding == "br" and brotli is not None:
+        try:
+            data = brotli.decompress(body)
+        except brotli.error as e:
+            raise WireError(f"Neispravno kompresovano tijelo: {e}", 400)
+    else:
+        raise WireError(f"Nepodržan Content-Encoding: {encoding}", 415)
+
+    if len(data) > MAX_REQUEST_BODY_BYTES:
+        raise WireError("Tijelo zahtjeva je preveliko", 413)
+    return data
+
+
+def loads(data: bytes) -> Any:
+    try:
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    except ValueError as e:  # i orjson.JSONDecodeError je ValueError
+        raise WireError(f"Neispravan JSON: {e}", 400)
+
+
+def decode_body(body: bytes, content_encoding: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    """(JSON objekat iz tijela, veličina tijela poslije dekompresije)."""
+    data = decompress_body(body, content_encoding)
+    payload = loads(data)
+    if not isinstance(payload, dict):
+        raise WireError("Tijelo zahtjeva mora biti JSON objekat")
+    return payload, len(data)
+
+
+# ---------------------------------------------------------
+#  KOLONSKI ZAPIS NALAZA
+# ---------------------------------------------------------
+
+def _is_text(v: Any) -> bool:
+    return v is None or type(v) is str
+
+
+def _is_number(v: Any) -> bool:
+    return v is None or type(v) is int or type(v) is float
+
+
+def _lookup(name: str, indexes: List[Any], table: Any) -> List[Optional[str]]:
+    if not isinstance(table, list) or not all(type(v) is str for v in table):
+        raise WireError(f"dicts.{name} mora biti niz stringova")
+    size = len(table)
+    if not all(i is None or (type(i) is int and 0 <= i < size) for i in indexes):
+        raise WireError(f"{name}: indeksi moraju biti cijeli brojevi 0..{size - 1} ili null")
+    return [None if i is None else table[i] for i in indexes]
+
+
+def decode_lab_columns(columns: Any) -> List[Dict[str, Any]]:
+    """Kolonski zapis -> redovi sa kanonskim ključevima; greška u tipu ili dužini -> WireError."""
+    if not isinstance(columns, dict):
+        raise WireError("lab_columns mora biti JSON objekat")
+    dicts = columns.get("dicts") or {}
+    if not isinstance(dicts, dict):
+        raise WireError("lab_columns.dicts mora biti JSON objekat")
+
+    analit = columns.get("analit")
+    if not isinstance(analit, list):
+        raise WireError("lab_columns.analit je obavezan niz")
+    n = len(analit)
+
+    decoded: Dict[str, List[Any]] = {}
+    for name in TEXT_COLUMNS + NUMBER_COLUMNS:
+        column = columns.get(name)
+        if column is None:
+            continue
+        if not isinstance(column, list) or len(column) != n:
+            raise WireError(f"lab_columns.{name} mora biti niz dužine {n}", status=400)
+        if name in dicts:
+            if name in NUMBER_COLUMNS:
+                raise WireError(f"{name}: rječnik je dozvoljen samo za tekstualne kolone")
+            column = _lookup(name, column, dicts[name])
+        elif not all(map(_is_text if name in TEXT_COLUMNS else _is_number, column)):
+            kind = "stringovi" if name in TEXT_COLUMNS else "brojevi"
+            raise WireError(f"lab_columns.{name}: vrijednosti moraju biti {kind} ili null")
+        decoded[name] = column
+
+    # kolone bez ijednog null-a se upisuju bez provjere (uobičajen slučaj), ostale se filtriraju po redu;
+    # redovi postoje unaprijed, pa i zapis u kojem svaka kolona ima null daje n redova
+    dense = [name for name, column in decoded.items() if None not in column]
+    sparse = [name for name in decoded if name not in dense]
+    rows: List[Dict[str, Any]] = [{} for _ in range(n)]
+    for name in dense:
+        for row, value in zip(rows, decoded[name]):
+            row[name] = value
+    for name in sparse:
+        for row, value in zip(rows, decoded[name]):
+            if value is not None:
+                row[name] = value
+    if "analit" in sparse or "" in decoded["analit"]:
+        rows = [row for row in rows if row.get("analit")]
+    return rows
+
+
+def encode_lab_columns(lab_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Obrnuto od decode_lab_columns; tekstualne kolone se uvijek kodiraju rječnikom."""
+    rows = normalize_lab_rows(lab_rows)
+    columns: Dict[str, Any] = {"dicts": {}}
+    for name in TEXT_COLUMNS + NUMBER_COLUMNS:
+        column = [row.get(name) for row in rows]
+        if name != "analit" and all(v is None for v in column):
+            continue
+        if name in TEXT_COLUMNS:
+            table: Dict[str, int] = {}
+            column = [None if v is None else table.setdefault(str(v), len(table)) for v in column]
+            columns["dicts"][name] = list(table)
+        columns[name] = column
+    return columns
+
+
+# ---------------------------------------------------------
+#  STATISTIKA
+# ---------------------------------------------------------
+
+class WireStats:
+    """Veličina tijela zahtjeva i vrijeme parsiranja (za /health), thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "requests": 0,
+            "wire_bytes": 0,
+            "body_bytes": 0,
+            "rows": 0,
+            "parse_ms": 0.0,
+            "max_parse_ms": 0.0,
+            "encodings": {},
+            "formats": {},
+        }
+        self._last: Optional[Dict[str, Any]] = None
+
+    def record(self, encoding: str, fmt: str, wire_bytes: int, body_bytes: int, rows: int, parse_s: float) -> None:
+        parse_ms = parse_s * 1000.0
+        with self._lock:
+            s = self._stats
+            s["requests"] += 1
+            s["wire_bytes"] += wire_bytes
+            s["body_bytes"] += body_bytes
+            s["rows"] += rows
+            s["parse_ms"] += parse_ms
+            s["max_parse_ms"] = max(s["max_parse_ms"], parse_ms)
+            s["encodings"][encoding] = s["encodings"].get(encoding, 0) + 1
+            s["formats"][fmt] = s["formats"].get(fmt, 0) + 1
+            self._last = {
+                "encoding": encoding,
+                "format": fmt,
+                "wire_bytes": wire_bytes,
+                "body_bytes": body_bytes,
+                "rows": rows,
+                "parse_ms": round(parse_ms, 3),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self._stats.items()}
+            stats["last"] = self._last
+        requests = stats["requests"]
+        stats["avg_parse_ms"] = round(stats["parse_ms"] / requests, 3) if requests else 0.0
+        stats["parse_ms"] = round(stats["parse_ms"], 3)
+        stats["max_parse_ms"] = round(stats["max_parse_ms"], 3)
+        stats["compression_ratio"] = (
+            round(stats["body_bytes"] / stats["wire_bytes"], 2) if stats["wire_bytes"] else 0.0
+        )
+        stats["json_parser"] = "orjson" if orjson is not None else "json"
+        stats["brotli"] = brotli is not None
+        return stats
+
+
+wire_stats = WireStats()
@@ -1,5 +1,7 @@
 import { LabReport } from "@/types";
 
+const API_BASE = "http://127.0.0.1:8000";
+
 export interface LabGuardResponse {
   answer: string;
   timestamp: string;
@@ -58,6 +60,138 @@ function flattenReportsToLabRows(reports: LabReport[]): LabRowPayload[] {
   return rows;
 }
 
+const TEXT_COLUMNS = ["analit", "unit", "status", "date", "source"] as const;
+const NUMBER_COLUMNS = ["value", "ref_low", "ref_high"] as const;
+
+/**
+ * Kolonski zapis redova (backend: wire.py) – paralelni nizovi umjesto
+ * objekta po redu, tekstualne kolone kodirane rječnikom.
+ */
+function encodeLabColumns(rows: LabRowPayload[]): Record<string, unknown> {
+  const dicts: Record<string, string[]> = {};
+  const columns: Record<string, unknown> = { dicts };
+
+  for (const name of TEXT_COLUMNS) {
+    const table = new Map<string, number>();
+    columns[name] = rows.map((row) => {
+      const value = row[name];
+      if (value == null) return null;
+      let index = table.get(value);
+      if (index === undefined) {
+        index = table.size;
+        table.set(value, index);
+      }
+      return index;
+    });
+    dicts[name] = Array.from(table.keys());
+  }
+
+  for (const name of NUMBER_COLUMNS) {
+    columns[name] = rows.map((row) => row[name]);
+  }
+
+  return columns;
+}
+
+/**
+ * JSON tijelo zahtjeva; veća tijela se šalju gzip-ovana
+ * (Content-Encoding: gzip) ako browser ima CompressionStream.
+ */
+async function jsonRequest(body: unknown): Promise<RequestInit> {
+  const json = JSON.stringify(body);
+  const headers: Record<string, string> = {
+    "Content-Type": "application/json",
+  };
+
+  if (typeof CompressionStream === "undefined" || json.length < 1024) {
+    return { method: "POST", headers, body: json };
+  }
+
+  const stream = new Blob([json])
+    .stream()
+    .pipeThrough(new CompressionStream("gzip"));
+  const compressed = await new Response(stream).arrayBuffer();
+  return {
+    method: "POST",
+    headers: { ...headers, "Content-Encoding": "gzip" },
+    body: compressed,
+  };
+}
+
+interface LabSession {
+  id: string;
+  fingerprint: string;
+  rowsKey: string; // JSON redova za koje je sesija napravljena
+}
+
+let labSession: LabSession | null = null;
+
+/**
+ * Serverska sesija sa nalazima: redovi se šalju samo kada se promijene,
+ * a uz pitanje ide samo session_id.
+ */
+async function ensureLabSession(
+  lab_rows: LabRowPayload[],
+  rowsKey: string
+): Promise<LabSession> {
+  if (labSession && labSession.rowsKey === rowsKey) {
+    return labSession;
+  }
+
+  const res = await fetch(
+    `${API_BASE}/sessions`,
+    await jsonRequest({ lab_columns: encodeLabColumns(lab_rows) })
+  );
+
+  if (!res.ok) {
+    throw new Error(`LabGuard API error: ${res.status}`);
+  }
+
+  const data: any = await res.json();
+  labSession = { id: data.session_id, fingerprint: data.fingerprint, rowsKey };
+  return labSession;
+}
+
+async function postChat(body: Record<string, unknown>): Promise<Response> {
+  return fetch(`${API_BASE}/chat`, await jsonRequest(body));
+}
+
+/**
+ * Pitanje uz sesiju (session_id + fingerprint); ako je sesija istekla (404)
+ * ili joj se sadržaj u međuvremenu promijenio (409), pravi se nova i pitanje
+ * se ponavlja jednom. Ako server ne podržava sesije, redovi idu uz pitanje.
+ */
+async function sendQuestion(
+  question: string,
+  lab_rows: LabRowPayload[]
+): Promise<Response> {
+  const rowsKey = JSON.stringify(lab_rows);
+
+  let session: LabSession;
+  try {
+    session = await ensureLabSession(lab_rows, rowsKey);
+  } catch {
+    return postChat({ question, lab_columns: encodeLabColumns(lab_rows) });
+  }
+
+  const res = await postChat({
+    question,
+    session_id: session.id,
+    fingerprint: session.fingerprint,
+  });
+  if (res.status !== 404 && res.status !== 409) {
+    return res;
+  }
+
+  labSession = null;
+  session = await ensureLabSession(lab_rows, rowsKey);
+  return postChat({
+    question,
+    session_id: session.id,
+    fingerprint: session.fingerprint,
+  });
+}
+
 /**
  * Poziv AI-bota.
  * Vraća čist odgovor + listu analita koje treba vizuelno istaknuti.
@@ -68,16 +202,7 @@ export async function askLabGuard(
 ): Promise<LabGuardResponse> {
   const lab_rows = flattenReportsToLabRows(reports);
 
-  const res = await fetch("http://127.0.0.1:8000/chat", {
-    method: "POST",
-    headers: {
-      "Content-Type": "application/json",
-    },
-    body: JSON.stringify({
-      question,
-      lab_rows,
-    }),
-  });
+  const res = await sendQuestion(question, lab_rows);
 
   if (!res.ok) {
     throw new Error(`LabGuard API error: ${res.status}`);